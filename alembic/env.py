@@ -6,19 +6,19 @@ from alembic import context
 from neutrino_database.models.base import metadata
 from neutrino_database.models import tables
 from neutrino_database.config import settings
+from neutrino_database.db import sync_database_url
+from neutrino_database.migrations import retry_on_lock_timeout
 
 config = context.config
 
 # Convert async URL to sync for Alembic
-sync_url = settings.DATABASE_URL.replace(
-    "postgresql+asyncpg://",
-    "postgresql+psycopg2://"
-)
+sync_url = sync_database_url(settings.DATABASE_URL)
 
 config.set_main_option("sqlalchemy.url", sync_url)
 
 if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
+    # Keep the loggers of neutrino_database (imported above) enabled
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
 
 target_metadata = metadata
 
@@ -29,23 +29,34 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
+    context.execute(f"SET lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    with context.begin_transaction():
+        context.run_migrations()
+
+def _run_migrations():
     with context.begin_transaction():
         context.run_migrations()
 
 def run_migrations_online():
+    # Statements give up on a lock after DB_MIGRATION_LOCK_TIMEOUT rather than
+    # queue every writer of the table behind them (RESET returns to this).
+    # Each revision commits on its own, so one that fails on a lock is rolled
+    # back and run again; the revisions before it stay applied.
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        connect_args={"options": f"-c lock_timeout={settings.DB_MIGRATION_LOCK_TIMEOUT}"},
     )
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
         )
-        with context.begin_transaction():
-            context.run_migrations()
+        retry_on_lock_timeout(_run_migrations)
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,229 @@
+"""move embedding vectors into content-addressed embedding_vector
+
+Revision ID: 2b8f0d6c4e13
+Revises: 7a1e4c9d2f60
+Create Date: 2026-02-02 09:26:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import add_check_constraint, drop_index_if_invalid, validate_constraint
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b8f0d6c4e13'
+down_revision: Union[str, Sequence[str], None] = '7a1e4c9d2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+# Keep in sync with neutrino_database.search.ANN_INDEX_DIMS
+DIMS = (1024,)
+
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+BUILD_MAINTENANCE_WORK_MEM = '1GB'
+
+VECTOR_COLUMNS = ('dense_vector', 'dense_dim', 'sparse_vector', 'sparse_dim')
+
+
+def _scalar(bind, sql: str, **params):
+    return bind.execute(sa.text(sql), params).scalar()
+
+
+def _column_type(bind, table: str, column: str) -> str:
+    return _scalar(bind, (
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = CAST(:table AS regclass) AND attname = :column AND NOT attisdropped"
+    ), table=table, column=column)
+
+
+def _create_index(bind, name: str, definition: str) -> None:
+    drop_index_if_invalid(name)
+    op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+
+def _create_ann_indexes(bind, table: str, prefix: str) -> None:
+    """Partial HNSW (or IVFFlat) index per dimension, as in 9c4d1a7e3b25."""
+    if context.is_offline_mode():
+        uses_pgvector, has_hnsw, rows = True, True, 0
+    else:
+        uses_pgvector = _column_type(bind, table, 'dense_vector').startswith('vector')
+        has_hnsw = _scalar(bind, "SELECT EXISTS (SELECT 1 FROM pg_am WHERE amname = 'hnsw')")
+        rows = _scalar(bind, (
+            "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"
+        ), table=table)
+    if not uses_pgvector:
+        return
+
+    op.execute(f"SET maintenance_work_mem = '{BUILD_MAINTENANCE_WORK_MEM}'")
+    for dim in DIMS:
+        if has_hnsw:
+            method = f"hnsw ((dense_vector::vector({dim})) vector_cosine_ops)"
+            options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        else:
+            method = f"ivfflat ((dense_vector::vector({dim})) vector_cosine_ops)"
+            options = f"lists = {min(max(rows // 1000, 10), 4000)}"
+        _create_index(bind, f"{prefix}_{dim}", (
+            f"ON {table} USING {method} WITH ({options}) WHERE dense_dim = {dim}"
+        ))
+    op.execute("RESET maintenance_work_mem")
+
+
+def _batched(bind, *statements: str) -> None:
+    """
+    Run ``statements`` in order over keyset batches of embedding ids, one
+    commit each. ``migrations.backfill`` runs a single ``UPDATE`` per batch;
+    this copies into embedding_vector before linking the batch to it.
+    """
+    select_ids = sa.text(
+        "SELECT id FROM embedding WHERE id > :after ORDER BY id LIMIT :limit"
+    )
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        ids = [row[0] for row in bind.execute(select_ids, {"after": after, "limit": BATCH_SIZE})]
+        if not ids:
+            break
+        for sql in statements:
+            bind.execute(sa.text(sql), {"ids": ids})
+        after = ids[-1]
+
+
+# One vector per (tenant_id, model, chunk_hash); the row with the lowest id
+# wins if files disagree. _batched walks ids in ascending order and later
+# batches do not overwrite, so this holds across batches too (rows written
+# meanwhile go through the trigger instead). The second statement points
+# embedding rows at it.
+COPY_VECTORS = """
+    INSERT INTO embedding_vector (id, tenant_id, model, chunk_hash, dense_vector, dense_dim, sparse_vector, sparse_dim)
+    SELECT DISTINCT ON (tenant_id, COALESCE(model, ''), chunk_hash)
+        gen_random_uuid(), tenant_id, COALESCE(model, ''), chunk_hash,
+        dense_vector, dense_dim, sparse_vector, sparse_dim
+    FROM embedding
+    WHERE {where} AND vector_id IS NULL
+    ORDER BY tenant_id, COALESCE(model, ''), chunk_hash, id
+    ON CONFLICT (tenant_id, model, chunk_hash) DO NOTHING
+"""
+LINK_VECTORS = """
+    UPDATE embedding e SET vector_id = v.id
+    FROM embedding_vector v
+    WHERE {where} AND e.vector_id IS NULL
+      AND v.tenant_id = e.tenant_id AND v.model = COALESCE(e.model, '') AND v.chunk_hash = e.chunk_hash
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema - Deduplicate embedding vectors into embedding_vector."""
+    bind = op.get_bind()
+    dense_type = 'vector' if context.is_offline_mode() else _column_type(bind, 'embedding', 'dense_vector')
+
+    # Step 1: New table and reference column, plus a trigger that routes
+    # vectors written by not-yet-upgraded code through the new table.
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS embedding_vector (
+            id uuid PRIMARY KEY,
+            tenant_id uuid NOT NULL REFERENCES tenant (id) ON DELETE CASCADE,
+            model varchar(100) NOT NULL DEFAULT '',
+            chunk_hash varchar NOT NULL,
+            dense_vector {dense_type},
+            dense_dim integer NOT NULL,
+            sparse_vector bytea,
+            sparse_dim integer,
+            created_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_vector_tenant_model_hash "
+        "ON embedding_vector (tenant_id, model, chunk_hash)"
+    )
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS vector_id uuid")
+    op.execute("ALTER TABLE embedding DROP CONSTRAINT IF EXISTS embedding_vector_id_fkey")
+    op.execute(
+        "ALTER TABLE embedding ADD CONSTRAINT embedding_vector_id_fkey "
+        "FOREIGN KEY (vector_id) REFERENCES embedding_vector (id) NOT VALID"
+    )
+    op.execute("""
+        CREATE OR REPLACE FUNCTION embedding_vector_link() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO embedding_vector (id, tenant_id, model, chunk_hash, dense_vector, dense_dim, sparse_vector, sparse_dim)
+            VALUES (gen_random_uuid(), NEW.tenant_id, COALESCE(NEW.model, ''), NEW.chunk_hash,
+                    NEW.dense_vector, NEW.dense_dim, NEW.sparse_vector, NEW.sparse_dim)
+            ON CONFLICT (tenant_id, model, chunk_hash) DO UPDATE SET
+                dense_vector = EXCLUDED.dense_vector, dense_dim = EXCLUDED.dense_dim,
+                sparse_vector = EXCLUDED.sparse_vector, sparse_dim = EXCLUDED.sparse_dim
+            RETURNING id INTO NEW.vector_id;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS embedding_vector_link ON embedding")
+    op.execute("""
+        CREATE TRIGGER embedding_vector_link
+        BEFORE INSERT OR UPDATE OF dense_vector, sparse_vector, model, chunk_hash ON embedding
+        FOR EACH ROW EXECUTE FUNCTION embedding_vector_link()
+    """)
+
+    # Step 2: Backfill in individually committed batches, then build the
+    # indexes and validate the constraints without blocking writers.
+    with op.get_context().autocommit_block():
+        if context.is_offline_mode():
+            op.execute(COPY_VECTORS.format(where='true'))
+            op.execute(LINK_VECTORS.format(where='true'))
+        else:
+            _batched(bind, COPY_VECTORS.format(where='id = ANY(:ids)'), LINK_VECTORS.format(where='e.id = ANY(:ids)'))
+
+    with op.get_context().autocommit_block():
+        _create_index(bind, 'ix_embedding_vector_id', 'ON embedding (vector_id)')
+        _create_ann_indexes(bind, 'embedding_vector', 'ix_embedding_vector_dense_ann')
+
+    validate_constraint('embedding', 'embedding_vector_id_fkey')
+    # A validated CHECK lets SET NOT NULL below skip its full-table scan
+    add_check_constraint('embedding_vector_id_not_null', 'embedding', 'vector_id IS NOT NULL')
+
+    # Step 3: Drop the per-file copies (catalog-only; this also drops the
+    # ANN indexes on embedding)
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER embedding_vector_link ON embedding")
+    op.execute("DROP FUNCTION embedding_vector_link()")
+    op.execute("ALTER TABLE embedding ALTER COLUMN vector_id SET NOT NULL")
+    op.execute("ALTER TABLE embedding DROP CONSTRAINT embedding_vector_id_not_null")
+    for column in VECTOR_COLUMNS:
+        op.drop_column('embedding', column)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Copy vectors back onto embedding and drop embedding_vector."""
+    bind = op.get_bind()
+    dense_type = 'vector' if context.is_offline_mode() else _column_type(bind, 'embedding_vector', 'dense_vector')
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(f"ALTER TABLE embedding ADD COLUMN IF NOT EXISTS dense_vector {dense_type}")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS dense_dim integer")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS sparse_vector bytea")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS sparse_dim integer")
+
+    fill = (
+        "UPDATE embedding e SET dense_vector = v.dense_vector, dense_dim = v.dense_dim, "
+        "sparse_vector = v.sparse_vector, sparse_dim = v.sparse_dim "
+        "FROM embedding_vector v WHERE {where} AND v.id = e.vector_id AND e.dense_dim IS NULL"
+    )
+    with op.get_context().autocommit_block():
+        if context.is_offline_mode():
+            op.execute(fill.format(where='true'))
+        else:
+            _batched(bind, fill.format(where='e.id = ANY(:ids)'))
+
+    with op.get_context().autocommit_block():
+        _create_ann_indexes(bind, 'embedding', 'ix_embedding_dense_ann')
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("ALTER TABLE embedding ALTER COLUMN dense_dim SET NOT NULL")
+    op.drop_column('embedding', 'vector_id')
+    op.drop_table('embedding_vector')
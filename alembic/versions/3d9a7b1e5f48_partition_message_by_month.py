@@ -0,0 +1,233 @@
+"""range-partition message by month on created_at
+
+Revision ID: 3d9a7b1e5f48
+Revises: 6e0b3a9f7c21
+Create Date: 2026-02-16 10:41:55.307962
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+from neutrino_database.models.partitions import (
+    MONTHS_AHEAD, add_months, default_partition_check_ddl, default_partition_constraint_name,
+    default_partition_ddl, default_partition_name, month_start, monthly_partition_ddl,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9a7b1e5f48'
+down_revision: Union[str, Sequence[str], None] = '6e0b3a9f7c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+INDEXES = {
+    'ix_message_chat_created_at': 'chat_id, created_at',
+    'ix_message_tenant_chat': 'tenant_id, chat_id',
+    'ix_message_user_id': 'user_id',
+}
+
+# Offline the server creates the months before the current one that have
+# messages, copies the foreign keys and fills in the mirror's columns when
+# the script runs
+PAST_PARTITIONS = """
+    DO $$
+    DECLARE
+        oldest timestamp := date_trunc('month', (SELECT min(created_at) FROM message) AT TIME ZONE 'UTC');
+        month timestamp;
+    BEGIN
+        oldest := LEAST(COALESCE(oldest, '{current}'), '{current}');
+        month := oldest;
+        WHILE month < '{current}' LOOP
+            EXECUTE 'CREATE TABLE IF NOT EXISTS message_y' || to_char(month, 'YYYY"m"MM')
+                || ' PARTITION OF message_new FOR VALUES FROM (' || quote_literal(month || '+00')
+                || ') TO (' || quote_literal((month + interval '1 month') || '+00') || ')';
+            month := month + interval '1 month';
+        END LOOP;
+        EXECUTE 'ALTER TABLE {default} DROP CONSTRAINT IF EXISTS {constraint}, ADD CONSTRAINT {constraint} '
+            || 'CHECK (NOT (created_at >= ' || quote_literal(oldest || '+00') || ' AND created_at < ''{end}''))';
+    END
+    $$
+"""
+COPY_FOREIGN_KEYS = """
+    DO $$
+    DECLARE
+        fk record;
+    BEGIN
+        FOR fk IN
+            SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+            WHERE conrelid = 'message'::regclass AND contype = 'f' AND conparentid = 0
+              AND conname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'message_new'::regclass)
+        LOOP
+            EXECUTE 'ALTER TABLE message_new ADD CONSTRAINT ' || quote_ident(fk.conname) || ' ' || fk.definition;
+        END LOOP;
+    END
+    $$
+"""
+MIRROR_ASSIGNMENTS = """
+    DO $mirror$
+    DECLARE
+        assignments text;
+    BEGIN
+        SELECT string_agg(quote_ident(attname) || ' = EXCLUDED.' || quote_ident(attname), ', ' ORDER BY attnum)
+        INTO assignments FROM pg_attribute
+        WHERE attrelid = 'message'::regclass AND attnum > 0 AND NOT attisdropped
+          AND attname NOT IN ('id', 'created_at');
+        EXECUTE replace($function${function}$function$, '@assignments@', assignments);
+    END
+    $mirror$
+"""
+
+
+def _create_copy(bind, partitioned: bool) -> None:
+    """Create ``message_new`` with the same columns, indexes and foreign keys."""
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS message_new "
+        "(LIKE message INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+        + (" PARTITION BY RANGE (created_at)" if partitioned else "")
+    )
+    if partitioned:
+        # Every month that has messages, up to MONTHS_AHEAD months from now,
+        # and the default partition's CHECK that it holds none of them
+        current = month_start(datetime.now(timezone.utc))
+        op.execute(default_partition_ddl('message', parent='message_new'))
+        if context.is_offline_mode():
+            months = [add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)]
+        else:
+            oldest = bind.execute(sa.text("SELECT min(created_at) FROM message")).scalar()
+            month = month_start(oldest) if oldest is not None and oldest < current else current
+            months = []
+            while month <= add_months(current, MONTHS_AHEAD):
+                months.append(month)
+                month = add_months(month, 1)
+        for month in months:
+            op.execute(monthly_partition_ddl('message', month, parent='message_new'))
+        if context.is_offline_mode():
+            op.execute(PAST_PARTITIONS.format(
+                current=f"{current:%Y-%m-%d %H:%M:%S}",
+                end=add_months(current, MONTHS_AHEAD + 1).isoformat(),
+                default=default_partition_name('message'),
+                constraint=default_partition_constraint_name('message'),
+            ))
+        else:
+            op.execute(default_partition_check_ddl('message', 'created_at', months))
+
+    existing = set() if context.is_offline_mode() else {row[0] for row in bind.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'message_new'::regclass"
+    ))}
+    if 'message_new_pkey' not in existing:
+        key = 'id, created_at' if partitioned else 'id'
+        op.execute(f"ALTER TABLE message_new ADD CONSTRAINT message_new_pkey PRIMARY KEY ({key})")
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name}_new ON message_new ({columns})")
+
+    if context.is_offline_mode():
+        op.execute(COPY_FOREIGN_KEYS)
+        return
+    foreign_keys = bind.execute(sa.text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = 'message'::regclass AND contype = 'f' AND conparentid = 0"
+    )).all()
+    for name, definition in foreign_keys:
+        if name not in existing:
+            op.execute(f"ALTER TABLE message_new ADD CONSTRAINT {name} {definition}")
+
+
+def _mirror(bind, partitioned: bool) -> None:
+    """Replay writes on ``message`` into ``message_new`` until the swap."""
+    key = 'id, created_at' if partitioned else 'id'
+    if context.is_offline_mode():
+        assignments = '@assignments@'
+    else:
+        columns = [row[0] for row in bind.execute(sa.text(
+            "SELECT attname FROM pg_attribute WHERE attrelid = 'message'::regclass "
+            "AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+        ))]
+        assignments = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in ('id', 'created_at'))
+    function = f"""
+        CREATE OR REPLACE FUNCTION message_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM message_new WHERE id = OLD.id AND created_at = OLD.created_at;
+                RETURN OLD;
+            END IF;
+            INSERT INTO message_new SELECT (NEW).*
+            ON CONFLICT ({key}) DO UPDATE SET {assignments};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """
+    if context.is_offline_mode():
+        function = MIRROR_ASSIGNMENTS.format(function=function)
+    op.execute(function)
+    op.execute("DROP TRIGGER IF EXISTS message_mirror ON message")
+    op.execute("""
+        CREATE TRIGGER message_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON message
+        FOR EACH ROW EXECUTE FUNCTION message_mirror()
+    """)
+
+
+def _backfill(bind) -> None:
+    """
+    Copy ``message`` into ``message_new`` in keyset batches, one commit each.
+
+    FOR KEY SHARE makes a batch wait for a concurrent DELETE of its rows and
+    then skip them, so the swap does not bring back deleted messages.
+    """
+    select_ids = sa.text(
+        "SELECT id FROM message WHERE id > :after ORDER BY id LIMIT :limit"
+    )
+    copy = sa.text(
+        "INSERT INTO message_new SELECT * FROM message WHERE id = ANY(CAST(:ids AS uuid[])) "
+        "FOR KEY SHARE ON CONFLICT DO NOTHING"
+    )
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        ids = [row[0] for row in bind.execute(select_ids, {"after": after, "limit": BATCH_SIZE})]
+        if not ids:
+            break
+        bind.execute(copy, {"ids": ids})
+        after = ids[-1]
+
+
+def _rebuild(partitioned: bool) -> None:
+    bind = op.get_bind()
+
+    # Step 1: Empty copy in the new layout, kept in sync by a trigger
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    _create_copy(bind, partitioned)
+    _mirror(bind, partitioned)
+
+    # Step 2: Backfill in individually committed batches
+    with op.get_context().autocommit_block():
+        if context.is_offline_mode():
+            op.execute("INSERT INTO message_new SELECT * FROM message FOR KEY SHARE ON CONFLICT DO NOTHING")
+        else:
+            _backfill(bind)
+
+    # Step 3: Swap (catalog-only, apart from unlinking the old heap)
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("LOCK TABLE message IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TABLE message")
+    op.execute("DROP FUNCTION message_mirror()")
+    op.execute("ALTER TABLE message_new RENAME TO message")
+    op.execute("ALTER TABLE message RENAME CONSTRAINT message_new_pkey TO message_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema - Range-partition message by month of created_at."""
+    _rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Turn message back into a plain table."""
+    _rebuild(partitioned=False)
@@ -0,0 +1,71 @@
+"""index the purge paths and cascade role deletes with their tenant
+
+Revision ID: 5c1e8f2a9b37
+Revises: 8b5e2c7d1a94
+Create Date: 2026-03-02 09:27:44.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8f2a9b37'
+down_revision: Union[str, Sequence[str], None] = '8b5e2c7d1a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Foreign key columns neutrino_database.purge deletes by (and Postgres
+# scans on every cascaded delete) that had no index; index_sync is
+# hash-partitioned
+INDEXES = {
+    'ix_files_workspace': ('files', 'workspace_id'),
+    'ix_datasources_workspace': ('datasources', 'workspace_id'),
+    'ix_ingestion_jobs_file': ('ingestion_jobs', 'file_id'),
+    'ix_strategies_file': ('strategies', 'file_id'),
+    'ix_index_sync_tenant_file': ('index_sync', 'tenant_id, file_id'),
+    'ix_index_sync_tenant_chunk': ('index_sync', 'tenant_id, chunk_id'),
+}
+
+
+def _replace_role_fk(on_delete: str) -> None:
+    # NOT VALID skips the full scan under the exclusive lock; the constraint
+    # is validated by _validate_role_fk once this transaction has committed.
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("ALTER TABLE role DROP CONSTRAINT IF EXISTS role_tenant_id_fkey")
+    op.execute(
+        "ALTER TABLE role ADD CONSTRAINT role_tenant_id_fkey FOREIGN KEY (tenant_id) "
+        f"REFERENCES tenant (id){on_delete} NOT VALID"
+    )
+
+
+def _validate_role_fk() -> None:
+    # In its own transaction (call inside autocommit_block): VALIDATE scans
+    # with a lock that lets reads and writes continue, which only helps once
+    # the exclusive locks of _replace_role_fk are released.
+    op.execute("ALTER TABLE role VALIDATE CONSTRAINT role_tenant_id_fkey")
+
+
+def upgrade() -> None:
+    """Upgrade schema - Index the purge paths and cascade role deletes with their tenant."""
+    _replace_role_fk(' ON DELETE CASCADE')
+
+    with op.get_context().autocommit_block():
+        _validate_role_fk()
+    for name, (table, columns) in INDEXES.items():
+        create_index_concurrently(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the purge indexes and restore the plain role foreign key."""
+    for name in INDEXES:
+        drop_index_concurrently(name)
+
+    _replace_role_fk('')
+    with op.get_context().autocommit_block():
+        _validate_role_fk()
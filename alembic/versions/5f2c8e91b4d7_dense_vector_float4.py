@@ -0,0 +1,136 @@
+"""store embedding.dense_vector as float4 (pgvector or packed bytea)
+
+Revision ID: 5f2c8e91b4d7
+Revises: 03a2611cda2a
+Create Date: 2026-01-12 10:04:51.218733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import numpy as np
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2c8e91b4d7'
+down_revision: Union[str, Sequence[str], None] = '03a2611cda2a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+# float8[] -> packed big-endian float4 bytea (float4send is big-endian)
+BYTEA_EXPR = (
+    "(SELECT string_agg(float4send(v::real), ''::bytea ORDER BY i) "
+    "FROM unnest({src}) WITH ORDINALITY AS u(v, i))"
+)
+VECTOR_EXPR = "{src}::real[]::vector"
+
+
+def _has_pgvector(bind) -> bool:
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'vector'"
+    )).first() is not None
+
+
+def _column_type(bind, column: str) -> str:
+    return bind.execute(sa.text(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = 'embedding'::regclass AND attname = :column AND NOT attisdropped"
+    ), {"column": column}).scalar()
+
+
+def upgrade() -> None:
+    """Upgrade schema - Convert dense_vector from float8[] to float4 storage."""
+    bind = op.get_bind()
+    use_pgvector = context.is_offline_mode() or _has_pgvector(bind)
+
+    if use_pgvector:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        new_type, expr = 'vector', VECTOR_EXPR
+    else:
+        new_type, expr = 'bytea', BYTEA_EXPR
+
+    # Step 1: Add the new column and keep it in sync with concurrent writers.
+    # Both are catalog-only changes; lock_timeout keeps us from queueing
+    # behind long transactions and blocking everyone else meanwhile.
+    # Everything is idempotent so an interrupted backfill can simply be re-run.
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(f"ALTER TABLE embedding ADD COLUMN IF NOT EXISTS dense_vector_f4 {new_type}")
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION embedding_dense_vector_f4_sync() RETURNS trigger AS $$
+        BEGIN
+            NEW.dense_vector_f4 := {expr.format(src='NEW.dense_vector')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS embedding_dense_vector_f4_sync ON embedding")
+    op.execute("""
+        CREATE TRIGGER embedding_dense_vector_f4_sync
+        BEFORE INSERT OR UPDATE OF dense_vector ON embedding
+        FOR EACH ROW EXECUTE FUNCTION embedding_dense_vector_f4_sync()
+    """)
+
+    # Step 2: Backfill existing rows in short, individually committed batches
+    backfill(
+        'embedding', f"dense_vector_f4 = {expr.format(src='dense_vector')}",
+        where="dense_vector IS NOT NULL AND dense_vector_f4 IS NULL", batch_size=BATCH_SIZE,
+    )
+
+    # Step 3: Swap columns (catalog-only)
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER embedding_dense_vector_f4_sync ON embedding")
+    op.execute("DROP FUNCTION embedding_dense_vector_f4_sync()")
+    op.drop_column('embedding', 'dense_vector')
+    op.alter_column('embedding', 'dense_vector_f4', new_column_name='dense_vector')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Convert dense_vector back to float8[]."""
+    bind = op.get_bind()
+    current = _column_type(bind, 'dense_vector')
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS dense_vector_f8 double precision[]")
+
+    if current.startswith('vector'):
+        backfill(
+            'embedding', "dense_vector_f8 = dense_vector::real[]::float8[]",
+            where="dense_vector IS NOT NULL AND dense_vector_f8 IS NULL", batch_size=BATCH_SIZE,
+        )
+    else:
+        with op.get_context().autocommit_block():
+            # No SQL function reads float4 back out of bytea, so decode in
+            # Python and send each batch back as array literals in one UPDATE.
+            select_rows = sa.text(
+                "SELECT id, CASE WHEN dense_vector_f8 IS NULL THEN dense_vector END FROM embedding "
+                "WHERE id > :after ORDER BY id LIMIT :limit"
+            )
+            update = sa.text(
+                "UPDATE embedding e SET dense_vector_f8 = u.vector::float8[] "
+                "FROM unnest(CAST(:ids AS uuid[]), CAST(:vectors AS text[])) AS u(id, vector) "
+                "WHERE e.id = u.id"
+            )
+            after = '00000000-0000-0000-0000-000000000000'
+            while True:
+                rows = bind.execute(select_rows, {"after": after, "limit": BATCH_SIZE}).all()
+                if not rows:
+                    break
+                decoded = [
+                    (row_id, "{" + ",".join(map(repr, np.frombuffer(payload, dtype='>f4').tolist())) + "}")
+                    for row_id, payload in rows if payload is not None
+                ]
+                if decoded:
+                    ids, vectors = zip(*decoded)
+                    bind.execute(update, {"ids": list(ids), "vectors": list(vectors)})
+                after = rows[-1][0]
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.drop_column('embedding', 'dense_vector')
+    op.alter_column('embedding', 'dense_vector_f8', new_column_name='dense_vector')
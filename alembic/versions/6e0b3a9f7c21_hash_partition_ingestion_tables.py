@@ -0,0 +1,255 @@
+"""hash-partition parsing, chunk, embedding and index_sync by tenant_id
+
+Revision ID: 6e0b3a9f7c21
+Revises: 2b8f0d6c4e13
+Create Date: 2026-02-09 15:12:08.640517
+
+"""
+from typing import Optional, Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e0b3a9f7c21'
+down_revision: Union[str, Sequence[str], None] = '2b8f0d6c4e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+# In foreign key order: index_sync references chunk
+TABLES = ('parsing', 'chunk', 'embedding', 'index_sync')
+PRIMARY_KEYS = {'parsing': 'id', 'chunk': 'id', 'embedding': 'id', 'index_sync': 'doc_id'}
+
+# name -> (unique, columns when partitioned, columns when not). Unique
+# indexes on a partitioned table must contain the partition key.
+INDEXES = {
+    'parsing': {
+        'idx_parsing_file_page': (True, 'tenant_id, file_id, page_no', 'file_id, page_no'),
+    },
+    'chunk': {
+        'idx_chunk_file_page_hash': (
+            True, 'tenant_id, file_id, page_no, chunk_hash', 'file_id, page_no, chunk_hash',
+        ),
+    },
+    'embedding': {
+        'idx_embedding_tenant_file_chunk_unique': (
+            True, 'tenant_id, file_id, chunk_hash', 'tenant_id, file_id, chunk_hash',
+        ),
+        'ix_embedding_tenant_workspace': (False, 'tenant_id, workspace_id', 'tenant_id, workspace_id'),
+        'ix_embedding_vector_id': (False, 'vector_id', 'vector_id'),
+    },
+    'index_sync': {},
+}
+
+# chunk's primary key gains tenant_id, so index_sync has to reference both
+CHUNK_FK = 'index_sync_chunk_id_fkey'
+
+# Offline the server copies the foreign keys and fills in the mirror's
+# columns when the script runs
+COPY_FOREIGN_KEYS = """
+    DO $$
+    DECLARE
+        fk record;
+    BEGIN
+        FOR fk IN
+            SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+            WHERE conrelid = '{table}'::regclass AND contype = 'f' AND conparentid = 0
+              AND conname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = '{new}'::regclass)
+        LOOP
+            EXECUTE 'ALTER TABLE {new} ADD CONSTRAINT ' || quote_ident(fk.conname) || ' '
+                || CASE WHEN fk.conname = '{chunk_fk}' THEN '{chunk_fk_definition}' ELSE fk.definition END;
+        END LOOP;
+    END
+    $$
+"""
+MIRROR_ASSIGNMENTS = """
+    DO $mirror$
+    DECLARE
+        assignments text;
+    BEGIN
+        SELECT string_agg(quote_ident(attname) || ' = EXCLUDED.' || quote_ident(attname), ', ' ORDER BY attnum)
+        INTO assignments FROM pg_attribute
+        WHERE attrelid = '{table}'::regclass AND attnum > 0 AND NOT attisdropped
+          AND attname NOT IN ('{pk}', 'tenant_id');
+        EXECUTE replace($function${function}$function$, '@assignments@', assignments);
+    END
+    $mirror$
+"""
+
+
+def _partition_count() -> int:
+    # `alembic -x partitions=32 upgrade head` overrides the setting
+    value = context.get_x_argument(as_dictionary=True).get('partitions')
+    return int(value) if value else settings.DB_TENANT_PARTITIONS
+
+
+def _new(table: str) -> str:
+    return f'{table}_new'
+
+
+def _key(table: str, partitioned: bool) -> str:
+    return f'{PRIMARY_KEYS[table]}, tenant_id' if partitioned else PRIMARY_KEYS[table]
+
+
+def _chunk_fk_definition(partitioned: bool) -> str:
+    local = 'chunk_id, tenant_id' if partitioned else 'chunk_id'
+    return (
+        f"FOREIGN KEY ({local}) REFERENCES {_new('chunk')} ({_key('chunk', partitioned)}) "
+        f"ON DELETE CASCADE"
+    )
+
+
+def _create_copy(bind, table: str, partitions: Optional[int]) -> None:
+    """Create ``<table>_new`` with the same columns, keys and foreign keys."""
+    new = _new(table)
+    partitioned = partitions is not None
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS {new} "
+        f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+        + (" PARTITION BY HASH (tenant_id)" if partitioned else "")
+    )
+    for remainder in range(partitions or 0):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{remainder} PARTITION OF {new} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+
+    existing = set() if context.is_offline_mode() else {row[0] for row in bind.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass)"
+    ), {"table": new})}
+    if f'{new}_pkey' not in existing:
+        op.execute(f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY ({_key(table, partitioned)})")
+
+    for name, (unique, partitioned_columns, plain_columns) in INDEXES[table].items():
+        columns = partitioned_columns if partitioned else plain_columns
+        op.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name}_new ON {new} ({columns})"
+        )
+
+    if context.is_offline_mode():
+        op.execute(COPY_FOREIGN_KEYS.format(
+            table=table, new=new, chunk_fk=CHUNK_FK, chunk_fk_definition=_chunk_fk_definition(partitioned),
+        ))
+        return
+    foreign_keys = bind.execute(sa.text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f' AND conparentid = 0"
+    ), {"table": table}).all()
+    for name, definition in foreign_keys:
+        if name in existing:
+            continue
+        if name == CHUNK_FK:
+            definition = _chunk_fk_definition(partitioned)
+        op.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name} {definition}")
+
+
+def _mirror(bind, table: str, partitioned: bool) -> None:
+    """Replay writes on ``table`` into ``<table>_new`` until the swap."""
+    new = _new(table)
+    pk = PRIMARY_KEYS[table]
+    if context.is_offline_mode():
+        assignments = '@assignments@'
+    else:
+        columns = [row[0] for row in bind.execute(sa.text(
+            "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) "
+            "AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+        ), {"table": table})]
+        assignments = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in (pk, 'tenant_id'))
+    function = f"""
+        CREATE OR REPLACE FUNCTION {table}_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM {new} WHERE {pk} = OLD.{pk} AND tenant_id = OLD.tenant_id;
+                RETURN OLD;
+            END IF;
+            INSERT INTO {new} SELECT (NEW).*
+            ON CONFLICT ({_key(table, partitioned)}) DO UPDATE SET {assignments};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """
+    if context.is_offline_mode():
+        function = MIRROR_ASSIGNMENTS.format(table=table, pk=pk, function=function)
+    op.execute(function)
+    op.execute(f"DROP TRIGGER IF EXISTS {table}_mirror ON {table}")
+    op.execute(f"""
+        CREATE TRIGGER {table}_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_mirror()
+    """)
+
+
+def _backfill(bind, table: str) -> None:
+    """
+    Copy ``table`` into ``<table>_new`` in keyset batches, one commit each.
+
+    FOR KEY SHARE makes a batch wait for a concurrent DELETE of its rows and
+    then skip them; without it the batch's snapshot would copy a row whose
+    mirror DELETE already ran, and the swap would bring it back.
+    """
+    pk = PRIMARY_KEYS[table]
+    select_ids = sa.text(
+        f"SELECT {pk} FROM {table} WHERE {pk} > :after ORDER BY {pk} LIMIT :limit"
+    )
+    copy = sa.text(
+        f"INSERT INTO {_new(table)} SELECT * FROM {table} WHERE {pk} = ANY(:ids) "
+        f"FOR KEY SHARE ON CONFLICT DO NOTHING"
+    )
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        ids = [row[0] for row in bind.execute(select_ids, {"after": after, "limit": BATCH_SIZE})]
+        if not ids:
+            break
+        bind.execute(copy, {"ids": ids})
+        after = ids[-1]
+
+
+def _rebuild(partitions: Optional[int]) -> None:
+    """Rebuild all ingestion tables, hash-partitioned by tenant or not."""
+    bind = op.get_bind()
+    partitioned = partitions is not None
+
+    # Step 1: Empty copies of the tables in the new layout
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    for table in TABLES:
+        _create_copy(bind, table, partitions)
+
+    # Step 2: Mirror and backfill table by table. The mirror is installed
+    # before the backfill starts and parents are complete before children,
+    # so index_sync never references a chunk that has not been copied yet.
+    for table in TABLES:
+        op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+        _mirror(bind, table, partitioned)
+        with op.get_context().autocommit_block():
+            if context.is_offline_mode():
+                op.execute(f"INSERT INTO {_new(table)} SELECT * FROM {table} FOR KEY SHARE ON CONFLICT DO NOTHING")
+            else:
+                _backfill(bind, table)
+
+    # Step 3: Swap (catalog-only, apart from unlinking the old heaps)
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(f"LOCK TABLE {', '.join(TABLES)} IN ACCESS EXCLUSIVE MODE")
+    for table in reversed(TABLES):
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"DROP FUNCTION {table}_mirror()")
+    for table in TABLES:
+        op.execute(f"ALTER TABLE {_new(table)} RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {_new(table)}_pkey TO {table}_pkey")
+        for name in INDEXES[table]:
+            op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema - Hash-partition the ingestion tables on tenant_id."""
+    _rebuild(_partition_count())
+
+
+def downgrade() -> None:
+    """Downgrade schema - Turn the ingestion tables back into plain tables."""
+    _rebuild(None)
@@ -0,0 +1,116 @@
+"""store embedding.sparse_vector as packed int4/float4 bytea
+
+Revision ID: 7a1e4c9d2f60
+Revises: 9c4d1a7e3b25
+Create Date: 2026-01-26 11:47:22.903114
+
+"""
+from typing import Sequence, Union
+import json
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1e4c9d2f60'
+down_revision: Union[str, Sequence[str], None] = '9c4d1a7e3b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+# {"indices": [...], "values": [...]} -> int4 indices || float4 values, both
+# big-endian and sorted by index (see neutrino_database.models.types.pack_sparse)
+PACK_EXPR = """
+    CASE WHEN {src} IS NULL THEN NULL ELSE (
+        SELECT COALESCE(string_agg(int4send(x.i), ''::bytea ORDER BY x.i), ''::bytea)
+            || COALESCE(string_agg(float4send(x.v), ''::bytea ORDER BY x.i), ''::bytea)
+        FROM (
+            SELECT i.value::int AS i, v.value::real AS v
+            FROM jsonb_array_elements_text({src}->'indices') WITH ORDINALITY AS i(value, n)
+            JOIN jsonb_array_elements_text({src}->'values') WITH ORDINALITY AS v(value, n) USING (n)
+        ) AS x
+    ) END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema - Convert sparse_vector from JSONB to packed bytea."""
+    # Step 1: New column plus a trigger covering concurrent writers
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS sparse_vector_packed bytea")
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION embedding_sparse_vector_packed_sync() RETURNS trigger AS $$
+        BEGIN
+            NEW.sparse_vector_packed := {PACK_EXPR.format(src='NEW.sparse_vector')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS embedding_sparse_vector_packed_sync ON embedding")
+    op.execute("""
+        CREATE TRIGGER embedding_sparse_vector_packed_sync
+        BEFORE INSERT OR UPDATE OF sparse_vector ON embedding
+        FOR EACH ROW EXECUTE FUNCTION embedding_sparse_vector_packed_sync()
+    """)
+
+    # Step 2: Backfill in individually committed batches
+    backfill(
+        'embedding', f"sparse_vector_packed = {PACK_EXPR.format(src='sparse_vector')}",
+        where="sparse_vector IS NOT NULL AND sparse_vector_packed IS NULL", batch_size=BATCH_SIZE,
+    )
+
+    # Step 3: Swap columns (catalog-only)
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER embedding_sparse_vector_packed_sync ON embedding")
+    op.execute("DROP FUNCTION embedding_sparse_vector_packed_sync()")
+    op.drop_column('embedding', 'sparse_vector')
+    op.alter_column('embedding', 'sparse_vector_packed', new_column_name='sparse_vector')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Convert sparse_vector back to JSONB."""
+    bind = op.get_bind()
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("ALTER TABLE embedding ADD COLUMN IF NOT EXISTS sparse_vector_json jsonb")
+
+    # float4 cannot be read back out of bytea in SQL, decode in Python
+    select_rows = sa.text(
+        "SELECT id, CASE WHEN sparse_vector_json IS NULL THEN sparse_vector END FROM embedding "
+        "WHERE id > :after ORDER BY id LIMIT :limit"
+    )
+    update = sa.text(
+        "UPDATE embedding e SET sparse_vector_json = u.doc::jsonb "
+        "FROM unnest(CAST(:ids AS uuid[]), CAST(:docs AS text[])) AS u(id, doc) "
+        "WHERE e.id = u.id"
+    )
+    with op.get_context().autocommit_block():
+        after = '00000000-0000-0000-0000-000000000000'
+        while True:
+            rows = bind.execute(select_rows, {"after": after, "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+            decoded = []
+            for row_id, payload in rows:
+                if payload is None:
+                    continue
+                nnz = len(payload) // 8
+                decoded.append((row_id, json.dumps({
+                    "indices": np.frombuffer(payload, dtype='>i4', count=nnz).tolist(),
+                    "values": np.frombuffer(payload, dtype='>f4', count=nnz, offset=4 * nnz).tolist(),
+                })))
+            if decoded:
+                ids, docs = zip(*decoded)
+                bind.execute(update, {"ids": list(ids), "docs": list(docs)})
+            after = rows[-1][0]
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.drop_column('embedding', 'sparse_vector')
+    op.alter_column('embedding', 'sparse_vector_json', new_column_name='sparse_vector')
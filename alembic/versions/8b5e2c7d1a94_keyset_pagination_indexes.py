@@ -0,0 +1,42 @@
+"""add id tie-breakers to chat and message pagination indexes
+
+Revision ID: 8b5e2c7d1a94
+Revises: 3d9a7b1e5f48
+Create Date: 2026-02-23 16:08:31.774120
+
+"""
+from typing import Sequence, Union
+
+from neutrino_database.migrations import create_index_concurrently, drop_index_concurrently, guarded
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b5e2c7d1a94'
+down_revision: Union[str, Sequence[str], None] = '3d9a7b1e5f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _replace_index(name: str, table: str, columns: str) -> None:
+    """
+    Build ``name`` on ``table (columns)`` without blocking writes, replacing
+    any old one. ``message`` is partitioned: the toolkit builds its
+    partitions one by one.
+    """
+    create_index_concurrently(f'{name}_new', table, columns)
+    drop_index_concurrently(name)
+    guarded(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add id tie-breakers to the chat and message pagination indexes."""
+    _replace_index('ix_chat_tenant_updated_at', 'chat', 'tenant_id, updated_at, id')
+    _replace_index('ix_chat_tenant_user_updated_at', 'chat', 'tenant_id, created_by, updated_at, id')
+    _replace_index('ix_message_chat_created_at', 'message', 'chat_id, created_at, id')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Restore the original chat and message indexes."""
+    drop_index_concurrently('ix_chat_tenant_user_updated_at')
+    _replace_index('ix_chat_tenant_updated_at', 'chat', 'tenant_id, updated_at')
+    _replace_index('ix_message_chat_created_at', 'message', 'chat_id, created_at')
@@ -0,0 +1,27 @@
+"""index message by tenant and creation time for retention deletes
+
+Revision ID: 92ebf790e4fc
+Revises: f2b9d4a6c158
+Create Date: 2026-10-18 09:41:27.215384
+
+"""
+from typing import Sequence, Union
+
+from neutrino_database.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = '92ebf790e4fc'
+down_revision: Union[str, Sequence[str], None] = 'f2b9d4a6c158'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add ix_message_tenant_created_at without blocking writes."""
+    create_index_concurrently('ix_message_tenant_created_at', 'message', 'tenant_id, created_at')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop ix_message_tenant_created_at."""
+    drop_index_concurrently('ix_message_tenant_created_at')
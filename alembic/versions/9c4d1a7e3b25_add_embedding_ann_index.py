@@ -0,0 +1,89 @@
+"""add ANN index on embedding.dense_vector
+
+Revision ID: 9c4d1a7e3b25
+Revises: 5f2c8e91b4d7
+Create Date: 2026-01-19 14:31:07.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from neutrino_database.migrations import drop_index_if_invalid
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4d1a7e3b25'
+down_revision: Union[str, Sequence[str], None] = '5f2c8e91b4d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Keep in sync with neutrino_database.search.ANN_INDEX_DIMS
+DIMS = (1024,)
+
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+BUILD_MAINTENANCE_WORK_MEM = '1GB'
+
+
+def _ann_index_name(dim: int) -> str:
+    return f'ix_embedding_dense_ann_{dim}'
+
+
+def _scalar(bind, sql: str, **params):
+    return bind.execute(sa.text(sql), params).scalar()
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add filter and ANN indexes to embedding."""
+    bind = op.get_bind()
+
+    if context.is_offline_mode():
+        uses_pgvector, has_hnsw, rows = True, True, 0
+    else:
+        uses_pgvector = _scalar(bind, (
+            "SELECT format_type(atttypid, NULL) = 'vector' FROM pg_attribute "
+            "WHERE attrelid = 'embedding'::regclass AND attname = 'dense_vector' AND NOT attisdropped"
+        ))
+        has_hnsw = _scalar(bind, "SELECT EXISTS (SELECT 1 FROM pg_am WHERE amname = 'hnsw')")
+        rows = _scalar(bind, "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'embedding'::regclass")
+
+    # Index builds must not block ingestion, so they run CONCURRENTLY, which
+    # is not allowed inside a transaction block.
+    with op.get_context().autocommit_block():
+        drop_index_if_invalid('ix_embedding_tenant_workspace')
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_embedding_tenant_workspace "
+            "ON embedding (tenant_id, workspace_id)"
+        )
+
+        if not uses_pgvector:
+            # bytea fallback: no ANN access method, search does an exact scan
+            return
+
+        op.execute(f"SET maintenance_work_mem = '{BUILD_MAINTENANCE_WORK_MEM}'")
+        for dim in DIMS:
+            name = _ann_index_name(dim)
+            drop_index_if_invalid(name)
+            if has_hnsw:
+                method = f"hnsw ((dense_vector::vector({dim})) vector_cosine_ops)"
+                options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+            else:
+                # IVFFlat wants ~rows/1000 lists; it is trained on existing rows
+                method = f"ivfflat ((dense_vector::vector({dim})) vector_cosine_ops)"
+                options = f"lists = {min(max(rows // 1000, 10), 4000)}"
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON embedding "
+                f"USING {method} WITH ({options}) WHERE dense_dim = {dim}"
+            )
+        op.execute("RESET maintenance_work_mem")
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop ANN and filter indexes from embedding."""
+    with op.get_context().autocommit_block():
+        for dim in DIMS:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {_ann_index_name(dim)}")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_embedding_tenant_workspace")
@@ -0,0 +1,42 @@
+"""add available_at and a pending-work index to index_sync
+
+Revision ID: a7d2c4e8f015
+Revises: 5c1e8f2a9b37
+Create Date: 2026-03-09 14:52:16.093387
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import create_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2c4e8f015'
+down_revision: Union[str, Sequence[str], None] = '5c1e8f2a9b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEX = 'ix_index_sync_pending'
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add index_sync.available_at and a partial index over unacknowledged rows."""
+    # now() is stable, so existing rows take it from the catalog without a rewrite
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(
+        "ALTER TABLE index_sync ADD COLUMN IF NOT EXISTS available_at "
+        "TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()"
+    )
+
+    create_index_concurrently(INDEX, 'index_sync', 'available_at', where='ack_at IS NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop index_sync.available_at and its index."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
+    op.execute("ALTER TABLE index_sync DROP COLUMN IF EXISTS available_at")
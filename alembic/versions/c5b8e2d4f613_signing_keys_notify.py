@@ -0,0 +1,34 @@
+"""notify key caches when signing_keys changes
+
+Revision ID: c5b8e2d4f613
+Revises: e3f6a1b9c802
+Create Date: 2026-03-23 10:18:02.735614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from neutrino_database.config import settings
+from neutrino_database.models.notify import signing_keys_notify_ddl
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5b8e2d4f613'
+down_revision: Union[str, Sequence[str], None] = 'e3f6a1b9c802'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add a statement-level NOTIFY trigger on signing_keys."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    for statement in signing_keys_notify_ddl():
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the signing_keys NOTIFY trigger."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER IF EXISTS signing_keys_notify ON signing_keys")
+    op.execute("DROP FUNCTION IF EXISTS signing_keys_notify()")
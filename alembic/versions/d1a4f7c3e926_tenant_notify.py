@@ -0,0 +1,35 @@
+"""notify tenant caches when a tenant or its identities change
+
+Revision ID: d1a4f7c3e926
+Revises: c5b8e2d4f613
+Create Date: 2026-03-30 15:41:27.208519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from neutrino_database.config import settings
+from neutrino_database.models.notify import tenant_identity_notify_ddl, tenant_notify_ddl
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1a4f7c3e926'
+down_revision: Union[str, Sequence[str], None] = 'c5b8e2d4f613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add NOTIFY triggers on tenant and tenant_identity."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    for statement in tenant_notify_ddl() + tenant_identity_notify_ddl():
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the tenant and tenant_identity NOTIFY triggers."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER IF EXISTS tenant_identity_notify ON tenant_identity")
+    op.execute("DROP TRIGGER IF EXISTS tenant_notify ON tenant")
+    op.execute("DROP FUNCTION IF EXISTS tenant_notify()")
@@ -0,0 +1,49 @@
+"""index ready ingestion jobs and notify workers when one arrives
+
+Revision ID: e3f6a1b9c802
+Revises: a7d2c4e8f015
+Create Date: 2026-03-16 11:05:39.461872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from neutrino_database.config import settings
+from neutrino_database.migrations import drop_index_if_invalid
+from neutrino_database.models.notify import READY_FOR_INGESTION, ingestion_jobs_notify_ddl
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f6a1b9c802'
+down_revision: Union[str, Sequence[str], None] = 'a7d2c4e8f015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEX = 'ix_ingestion_jobs_ready'
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add a partial index over ready ingestion jobs and a NOTIFY trigger."""
+    # CREATE TRIGGER briefly blocks writes to ingestion_jobs
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    for statement in ingestion_jobs_notify_ddl():
+        op.execute(statement)
+
+    with op.get_context().autocommit_block():
+        drop_index_if_invalid(INDEX)
+        op.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} ON ingestion_jobs (created_at) "
+            f"WHERE overall_status = '{READY_FOR_INGESTION}' AND is_deleted = false"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the ready-jobs index and the NOTIFY trigger."""
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX}")
+
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER IF EXISTS ingestion_jobs_notify ON ingestion_jobs")
+    op.execute("DROP FUNCTION IF EXISTS ingestion_jobs_notify()")
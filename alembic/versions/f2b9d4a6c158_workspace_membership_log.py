@@ -0,0 +1,56 @@
+"""log workspace membership changes under a per-tenant version
+
+Revision ID: f2b9d4a6c158
+Revises: d1a4f7c3e926
+Create Date: 2026-04-06 10:12:53.460871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from neutrino_database.config import settings
+from neutrino_database.models.notify import workspace_membership_ddl
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b9d4a6c158'
+down_revision: Union[str, Sequence[str], None] = 'd1a4f7c3e926'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add the membership version and change log tables and their triggers."""
+    op.create_table('workspace_membership_version',
+        sa.Column('tenant_id', sa.UUID(as_uuid=False), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('tenant_id')
+    )
+    op.create_table('workspace_member_change',
+        sa.Column('tenant_id', sa.UUID(as_uuid=False), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('workspace_id', sa.UUID(as_uuid=False), nullable=False),
+        sa.Column('user_id', sa.UUID(as_uuid=False), nullable=True),
+        sa.Column('is_workspace_admin', sa.Boolean(), nullable=True),
+        sa.Column('changed_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('tenant_id', 'version')
+    )
+    # Existing memberships need no backfill: indexes start from a snapshot
+    # at version 0
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    for statement in workspace_membership_ddl():
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the membership change log, its triggers and tables."""
+    op.execute(f"SET LOCAL lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+    op.execute("DROP TRIGGER IF EXISTS workspace_log ON workspace")
+    op.execute("DROP TRIGGER IF EXISTS workspace_member_log ON workspace_member")
+    op.execute("DROP FUNCTION IF EXISTS workspace_log()")
+    op.execute("DROP FUNCTION IF EXISTS workspace_member_log()")
+    op.execute("DROP FUNCTION IF EXISTS workspace_membership_log(uuid, uuid, uuid, boolean)")
+    op.drop_table('workspace_member_change')
+    op.drop_table('workspace_membership_version')
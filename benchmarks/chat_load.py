@@ -0,0 +1,384 @@
+"""
+Chat OLTP load test against a local PostgreSQL.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/chat_load.py --users 200 --duration 60 \\
+        [--mix resolve=10,send=30,history=40,sidebar=20] [--output chat_load.json] [--compare previous.json]
+
+``--users`` simulated users, spread over ``--tenants`` tenants, loop over the
+chat product's hot path until ``--duration`` seconds have passed, each
+picking its next operation from ``--mix`` (relative weights) and pausing an
+exponentially distributed ``--think`` milliseconds in between:
+
+    resolve   tenant by org_external_id, then the user by email (the auth path)
+    send      append a message and bump chat.updated_at, one transaction
+    history   the last --window messages of a chat (chats.recent_messages)
+    sidebar   the user's first page of chats (chats.list_chats)
+
+A ``--hot-fraction`` of sends goes to one of each tenant's ``--hot-chats``
+shared chats instead of the user's own, so concurrent writers queue on the
+same chat rows. Latencies include waiting for a pooled connection; size the
+pool with ``DB_POOL_SIZE``/``DB_MAX_OVERFLOW``. Operations finishing within
+the first ``--warmup`` seconds are not counted. All users share one process
+and event loop: the run warns when that process was CPU-bound, in which case
+latencies measure the client rather than the database.
+
+While the load runs, ``pg_stat_activity`` is sampled every
+``--sample-interval`` seconds for backends waiting on locks (how many, for
+how long, on which lock types). Deadlocks are counted from the
+``pg_stat_database`` counter and from the errors the users get.
+
+The dataset (users, chats, ``--history`` messages per chat) is deterministic
+for a given ``--seed`` and created under its own tenants, which are purged at
+the end unless ``--keep``. The report goes to ``--output`` as JSON,
+comparable with ``--compare`` like the ingestion benchmark's.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+import harness
+from neutrino_database import chats, db, queries
+from neutrino_database.config import settings
+from neutrino_database.models import tables
+from neutrino_database.models.enums import MessageRoleEnum
+from neutrino_database.purge import Purger
+from neutrino_database.retention import ensure_message_partitions
+
+OPERATIONS = ("resolve", "send", "history", "sidebar")
+DEFAULT_MIX = "resolve=10,send=30,history=40,sidebar=20"
+DEADLOCK = "40P01"
+# Share of one CPU used by this process above which results are client-bound
+CLIENT_BOUND = 0.8
+WORDS = "the a report budget meeting please summarize draft review contract email next steps why how when".split()
+
+LOCK_WAITS = text(
+    "SELECT wait_event, COALESCE(EXTRACT(EPOCH FROM now() - query_start), 0) FROM pg_stat_activity "
+    "WHERE datname = current_database() AND wait_event_type = 'Lock' AND pid <> pg_backend_pid()"
+)
+DEADLOCKS = text("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r}; expected {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"weight of {name} must be a number") from None
+        if mix[name] < 0:
+            raise ValueError(f"weight of {name} must not be negative")
+    if not sum(mix.values()):
+        raise ValueError("mix needs at least one positive weight")
+    return mix
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _content(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(5, 60)))
+
+
+@dataclass
+class SimUser:
+    id: str
+    tenant_id: str
+    org_external_id: str
+    email: str
+    chat_ids: List[str]
+    hot_chat_ids: List[str]
+
+
+@dataclass
+class Dataset:
+    tenants: List[dict] = field(default_factory=list)
+    users: List[SimUser] = field(default_factory=list)
+
+
+def generate(args: argparse.Namespace) -> Dataset:
+    rng = random.Random(f"{args.seed}:chat")
+    data = Dataset()
+    for i in range(args.tenants):
+        data.tenants.append({
+            "id": _uuid(rng), "name": f"load {i}", "org_external_id": f"load-{args.seed}-{i}", "status": "ACTIVE",
+        })
+    hot = {t["id"]: [_uuid(rng) for _ in range(args.hot_chats)] for t in data.tenants}
+    for i in range(args.users):
+        tenant = data.tenants[i % len(data.tenants)]
+        data.users.append(SimUser(
+            id=_uuid(rng), tenant_id=tenant["id"], org_external_id=tenant["org_external_id"],
+            email=f"user{i}@load.example", chat_ids=[_uuid(rng) for _ in range(args.chats_per_user)],
+            hot_chat_ids=hot[tenant["id"]],
+        ))
+    return data
+
+
+async def setup(engine: AsyncEngine, data: Dataset, args: argparse.Namespace) -> None:
+    await _purge(engine, data)
+    await ensure_message_partitions(engine)
+    rng = random.Random(f"{args.seed}:history")
+    now = datetime.now(timezone.utc)
+    # The history stays inside the current month's partition
+    oldest = max(now - timedelta(days=7), now.replace(day=1, hour=0, minute=0, second=0, microsecond=0))
+    span = (now - oldest).total_seconds()
+
+    owners = {}
+    for user in data.users:
+        owners.update((chat_id, user) for chat_id in user.chat_ids)
+        # Shared chats belong to the first user of their tenant
+        for chat_id in user.hot_chat_ids:
+            owners.setdefault(chat_id, user)
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(tables.tenant), data.tenants)
+        await conn.execute(insert(tables.user), [
+            {"id": u.id, "tenant_id": u.tenant_id, "email": u.email, "status": "ACTIVE"} for u in data.users
+        ])
+        await conn.execute(insert(tables.chat), [
+            {"id": chat_id, "tenant_id": user.tenant_id, "created_by": user.id, "title": f"chat {n}"}
+            for n, (chat_id, user) in enumerate(owners.items())
+        ])
+    messages = []
+    for chat_id, user in owners.items():
+        for _ in range(args.history):
+            messages.append({
+                "id": _uuid(rng), "tenant_id": user.tenant_id, "chat_id": chat_id, "user_id": user.id,
+                "role": rng.choice((MessageRoleEnum.USER, MessageRoleEnum.ASSISTANT)), "content": _content(rng),
+                "created_at": oldest + timedelta(seconds=rng.random() * span),
+            })
+    for start in range(0, len(messages), 5000):
+        async with engine.begin() as conn:
+            await conn.execute(insert(tables.message), messages[start:start + 5000])
+    async with engine.connect() as conn:
+        for name in ("chat", "message", "user", "tenant"):
+            await conn.exec_driver_sql(f'ANALYZE "{name}"')
+
+
+async def _purge(engine: AsyncEngine, data: Dataset) -> None:
+    t = tables.tenant
+    async with engine.connect() as conn:
+        existing = list((await conn.execute(
+            select(t.c.id).where(t.c.id.in_([tenant["id"] for tenant in data.tenants]))
+        )).scalars())
+    for tenant_id in existing:
+        await Purger(engine, batch_size=50_000, max_replication_lag=None).purge_tenant(tenant_id)
+
+
+class Load:
+    """The simulated users, their results and the lock monitor of one run."""
+
+    def __init__(self, engine: AsyncEngine, data: Dataset, args: argparse.Namespace):
+        self.engine = engine
+        self.data = data
+        self.args = args
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        self.mix = parse_mix(args.mix)
+        self.timings = {name: harness.Timings(name) for name in self.mix}
+        self.errors: Counter = Counter()
+        self.client_deadlocks = 0
+        self.lock_samples: List[int] = []
+        self.lock_wait_seconds: List[float] = []
+        self.lock_types: Counter = Counter()
+        self._measure_from = 0.0
+        self._deadline = 0.0
+        self._cpu_from = None
+        # CPU seconds this process spent during the measured window
+        self.client_cpu = 0.0
+
+    async def run(self) -> float:
+        start = time.monotonic()
+        self._measure_from = start + self.args.warmup
+        self._deadline = self._measure_from + self.args.duration
+        monitor = asyncio.create_task(self._monitor())
+        try:
+            await asyncio.gather(*(self._user(i, user) for i, user in enumerate(self.data.users)))
+        finally:
+            monitor.cancel()
+            await asyncio.gather(monitor, return_exceptions=True)
+        if self._cpu_from is not None:
+            self.client_cpu = time.process_time() - self._cpu_from
+        return time.monotonic() - self._measure_from
+
+    async def _user(self, index: int, user: SimUser) -> None:
+        rng = random.Random(f"{self.args.seed}:user:{index}")
+        names, weights = list(self.mix), list(self.mix.values())
+        # Users start spread over one think time instead of all at once
+        await asyncio.sleep(rng.random() * self.args.think / 1000)
+        while time.monotonic() < self._deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                await getattr(self, f"_{name}")(user, rng)
+            except (DBAPIError, PoolTimeout) as exc:
+                if getattr(getattr(exc, "orig", None), "sqlstate", None) == DEADLOCK:
+                    self.client_deadlocks += 1
+                if time.monotonic() >= self._measure_from:
+                    self.errors[name] += 1
+            else:
+                if self._measure_from <= time.monotonic() < self._deadline:
+                    self.timings[name].record(time.perf_counter() - started, 1)
+            if self.args.think:
+                await asyncio.sleep(rng.expovariate(1000 / self.args.think))
+
+    async def _resolve(self, user: SimUser, rng: random.Random) -> None:
+        async with self.sessions() as session:
+            tenant = (await session.execute(*queries.tenant_by_org(user.org_external_id))).first()
+            (await session.execute(*queries.user_by_email(tenant.id, user.email))).scalar_one()
+
+    async def _send(self, user: SimUser, rng: random.Random) -> None:
+        hot = user.hot_chat_ids and rng.random() < self.args.hot_fraction
+        chat_id = rng.choice(user.hot_chat_ids if hot else user.chat_ids)
+        c = tables.chat
+        async with self.sessions.begin() as session:
+            await session.execute(insert(tables.message).values(
+                tenant_id=user.tenant_id, chat_id=chat_id, user_id=user.id,
+                role=MessageRoleEnum.USER, content=_content(rng),
+            ))
+            await session.execute(update(c).where(c.c.id == chat_id).values(updated_at=func.now()))
+
+    async def _history(self, user: SimUser, rng: random.Random) -> None:
+        async with self.sessions() as session:
+            await chats.recent_messages(session, rng.choice(user.chat_ids + user.hot_chat_ids), self.args.window)
+
+    async def _sidebar(self, user: SimUser, rng: random.Random) -> None:
+        async with self.sessions() as session:
+            await chats.list_chats(session, user.tenant_id, user.id)
+
+    async def _monitor(self) -> None:
+        # Its own connection, so sampling never waits for the users' pool
+        async with self.engine.connect() as conn:
+            while True:
+                await asyncio.sleep(self.args.sample_interval)
+                if time.monotonic() < self._measure_from:
+                    continue
+                if self._cpu_from is None:
+                    self._cpu_from = time.process_time()
+                waits = (await conn.execute(LOCK_WAITS)).all()
+                await conn.rollback()
+                self.lock_samples.append(len(waits))
+                for lock_type, seconds in waits:
+                    self.lock_types[lock_type] += 1
+                    self.lock_wait_seconds.append(float(seconds))
+
+    def locks(self, server_deadlocks: int) -> dict:
+        samples = self.lock_samples
+        return {
+            "samples": len(samples),
+            "mean_waiting": round(sum(samples) / len(samples), 3) if samples else 0.0,
+            "max_waiting": max(samples, default=0),
+            "p99_wait_ms": round(harness.percentile(self.lock_wait_seconds, 99) * 1e3, 3),
+            "max_wait_ms": round(max(self.lock_wait_seconds, default=0.0) * 1e3, 3),
+            "lock_types": dict(self.lock_types),
+            "deadlocks": server_deadlocks,
+            "deadlocks_seen_by_clients": self.client_deadlocks,
+        }
+
+
+def _print(load: Load, seconds: float, locks: dict) -> None:
+    print(f"{'operation':<12}{'ops':>9}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    total = 0
+    for name, timings in load.timings.items():
+        s = timings.summary()
+        total += s["operations"]
+        print(f"{name:<12}{s['operations']:>9}{s['operations'] / seconds:>10.1f}{s['p50_ms']:>10.2f}"
+              f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}{load.errors[name]:>8}")
+    print(f"{'total':<12}{total:>9}{total / seconds:>10.1f}")
+    print(
+        f"\nlock waits: mean {locks['mean_waiting']} / max {locks['max_waiting']} backends waiting, "
+        f"p99 {locks['p99_wait_ms']:.1f} ms, max {locks['max_wait_ms']:.1f} ms {locks['lock_types'] or ''}"
+    )
+    print(f"deadlocks: {locks['deadlocks']} (clients saw {locks['deadlocks_seen_by_clients']})")
+    share = load.client_cpu / seconds
+    if share > CLIENT_BOUND:
+        print(f"\nwarning: the load generator used {share:.0%} of a CPU; latencies include its own queueing. "
+              "Run fewer users or more --think, or move the database to another machine.")
+
+
+async def run(args: argparse.Namespace) -> None:
+    harness.check_local(settings.DATABASE_URL, args.allow_remote)
+    engine = db.get_engine()
+    data = generate(args)
+    await setup(engine, data, args)
+
+    async with engine.connect() as conn:
+        deadlocks_before = await conn.scalar(DEADLOCKS)
+        env = await harness.environment(conn)
+    load = Load(engine, data, args)
+    seconds = await load.run()
+    async with engine.connect() as conn:
+        deadlocks = await conn.scalar(DEADLOCKS) - deadlocks_before
+
+    if not args.keep:
+        await _purge(engine, data)
+    await db.dispose_engines()
+
+    for timings in load.timings.values():
+        # Throughput over the measured window, not the sum of latencies
+        timings.seconds = seconds
+    locks = load.locks(deadlocks)
+    _print(load, seconds, locks)
+    config = {
+        name: getattr(args, name) for name in (
+            "users", "tenants", "chats_per_user", "hot_chats", "hot_fraction", "history", "window",
+            "mix", "think", "duration", "seed",
+        )
+    }
+    config["pool_size"] = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    report = harness.report(config, env, list(load.timings.values()), {})
+    report["errors"] = dict(load.errors)
+    report["locks"] = locks
+    report["client_cpu_share"] = round(load.client_cpu / seconds, 3)
+    harness.write_baseline(args.output, report)
+    print(f"\nwrote {args.output}")
+    if args.compare:
+        harness.compare(args.compare, report)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--chats-per-user", type=int, default=5)
+    parser.add_argument("--hot-chats", type=int, default=2, help="shared chats per tenant")
+    parser.add_argument("--hot-fraction", type=float, default=0.1, help="share of sends to a shared chat")
+    parser.add_argument("--history", type=int, default=50, help="messages per chat before the run")
+    parser.add_argument("--window", type=int, default=20, help="messages read by history")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--think", type=float, default=50.0, help="mean pause between operations, ms")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="pg_stat_activity sampling, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="chat_load.json")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--keep", action="store_true", help="leave the load-test tenants in place")
+    parser.add_argument("--allow-remote", action="store_true", help="allow a non-local DATABASE_URL")
+    args = parser.parse_args()
+    if min(args.users, args.tenants, args.chats_per_user, args.window) < 1 or args.duration <= 0:
+        parser.error("--users, --tenants, --chats-per-user, --window and --duration must be positive")
+    if min(args.hot_chats, args.history, args.think, args.warmup) < 0 or not 0 <= args.hot_fraction <= 1:
+        parser.error("--hot-chats, --history, --think and --warmup must not be negative; --hot-fraction is 0..1")
+    try:
+        parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
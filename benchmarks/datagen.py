@@ -0,0 +1,163 @@
+"""
+Deterministic synthetic ingestion data for the benchmarks.
+
+``Dataset(Scale(chunks=...))`` lays out tenants, workspaces (one datasource
+each) and ``files``, then yields each file's ``parsing`` pages, ``chunk``
+rows, embeddings (vectors included, as ``bulk.copy_embeddings`` takes them)
+and ``index_sync`` rows, one file at a time so 10M chunks never sit in
+memory together. Every id, text and vector derives from ``seed`` and the
+row's position: two runs with the same ``Scale`` produce identical data.
+
+``file_rows(file, revision)`` for ``revision > 0`` is the same file
+re-ingested with ``Scale.changed_pages`` of its pages rewritten. Unchanged
+pages keep their ids, hashes and vectors, and only the rewritten chunks get
+new ``index_sync`` rows.
+"""
+import hashlib
+import math
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Iterator, List
+
+import numpy as np
+
+WORDS = (
+    "account agreement analysis annual approval asset audit balance budget claim client compliance contract "
+    "cost customer data delivery department document employee estimate invoice ledger license market meeting "
+    "order partner payment policy price process product project quarter record report request review risk "
+    "revenue schedule service supplier tax team term total vendor"
+).split()
+MODEL = "bench-embedding"
+
+
+@dataclass(frozen=True)
+class Scale:
+    chunks: int
+    tenants: int = 2
+    workspaces_per_tenant: int = 2
+    pages_per_file: int = 8
+    chunks_per_page: int = 4
+    words_per_chunk: int = 80
+    dim: int = 256
+    # Fraction of pages rewritten by each re-ingest revision
+    changed_pages: float = 0.25
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.chunks < 1:
+            raise ValueError("chunks must be positive")
+        if min(self.tenants, self.workspaces_per_tenant, self.pages_per_file, self.chunks_per_page, self.dim) < 1:
+            raise ValueError("tenants, workspaces_per_tenant, pages_per_file, chunks_per_page and dim must be positive")
+        if not 0 <= self.changed_pages <= 1:
+            raise ValueError("changed_pages must be between 0 and 1")
+
+    @property
+    def chunks_per_file(self) -> int:
+        return self.pages_per_file * self.chunks_per_page
+
+    @property
+    def files(self) -> int:
+        return math.ceil(self.chunks / self.chunks_per_file)
+
+
+@dataclass(frozen=True)
+class FileSpec:
+    index: int
+    id: uuid.UUID
+    tenant_id: str
+    workspace_id: str
+    datasource_id: uuid.UUID
+
+
+@dataclass
+class FileRows:
+    parsing: List[dict]
+    chunks: List[dict]
+    embeddings: List[dict]
+    index_sync: List[dict]
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+class Dataset:
+    def __init__(self, scale: Scale):
+        self.scale = scale
+        rng = random.Random(f"{scale.seed}:layout")
+        self.tenants = [
+            {"id": str(_uuid(rng)), "name": f"bench {i}", "org_external_id": f"bench-{scale.seed}-{i}", "status": "ACTIVE"}
+            for i in range(scale.tenants)
+        ]
+        self.workspaces = [
+            {"id": str(_uuid(rng)), "tenant_id": tenant["id"], "name": f"bench {i}"}
+            for tenant in self.tenants for i in range(scale.workspaces_per_tenant)
+        ]
+        self.datasources = [
+            {"id": _uuid(rng), "tenant_id": w["tenant_id"], "workspace_id": w["id"], "name": "bench", "type": "bench"}
+            for w in self.workspaces
+        ]
+
+    def files(self) -> Iterator[FileSpec]:
+        """Every file, spread round-robin over the workspaces."""
+        rng = random.Random(f"{self.scale.seed}:files")
+        for index in range(self.scale.files):
+            datasource = self.datasources[index % len(self.datasources)]
+            yield FileSpec(index, _uuid(rng), datasource["tenant_id"], datasource["workspace_id"], datasource["id"])
+
+    def file_row(self, file: FileSpec) -> dict:
+        return {
+            "id": file.id, "tenant_id": file.tenant_id, "datasource_id": file.datasource_id,
+            "workspace_id": file.workspace_id, "original_filename": f"bench-{file.index}.pdf", "file_type": "pdf",
+            "storage_uri": f"bench://{file.id}", "file_size_bytes": 1 << 20,
+            "file_sha256": hashlib.sha256(file.id.bytes).hexdigest(), "created_by": "benchmark",
+        }
+
+    def _page_revision(self, file: FileSpec, page_no: int, revision: int) -> int:
+        """The latest revision (up to ``revision``) that rewrote the page; 0 for never."""
+        for r in range(revision, 0, -1):
+            if random.Random(f"{self.scale.seed}:{file.index}:{page_no}:{r}").random() < self.scale.changed_pages:
+                return r
+        return 0
+
+    def file_rows(self, file: FileSpec, revision: int = 0) -> FileRows:
+        scale = self.scale
+        # The last file is cut short so the dataset has exactly scale.chunks chunks
+        chunk_count = min(scale.chunks_per_file, scale.chunks - file.index * scale.chunks_per_file)
+        rows = FileRows([], [], [], [])
+        for page_no in range(math.ceil(chunk_count / scale.chunks_per_page)):
+            page_revision = self._page_revision(file, page_no, revision)
+            rng = random.Random(f"{scale.seed}:{file.index}:{page_no}:{page_revision}:text")
+            on_page = min(scale.chunks_per_page, chunk_count - page_no * scale.chunks_per_page)
+            texts = [" ".join(rng.choices(WORDS, k=scale.words_per_chunk)) for _ in range(on_page)]
+            page_text = "\n\n".join(texts)
+            rows.parsing.append({
+                "tenant_id": file.tenant_id, "file_id": file.id, "workspace_id": file.workspace_id,
+                "page_no": page_no, "page_text": page_text,
+                "page_hash": hashlib.sha256(page_text.encode()).hexdigest(),
+            })
+
+            vectors = np.random.default_rng([scale.seed, file.index, page_no, page_revision]).standard_normal(
+                (on_page, scale.dim), dtype=np.float32,
+            )
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            for ord_, (chunk_text, vector) in enumerate(zip(texts, vectors)):
+                chunk_id = _uuid(rng)
+                chunk_hash = hashlib.sha256(chunk_text.encode()).hexdigest()
+                rows.chunks.append({
+                    "id": chunk_id, "tenant_id": file.tenant_id, "file_id": file.id,
+                    "workspace_id": file.workspace_id, "page_no": page_no, "ord": ord_,
+                    "chunk_text": chunk_text, "chunk_hash": chunk_hash,
+                })
+                rows.embeddings.append({
+                    "tenant_id": file.tenant_id, "file_id": file.id, "workspace_id": file.workspace_id,
+                    "chunk_hash": chunk_hash, "model": MODEL, "dense_vector": vector, "dense_dim": scale.dim,
+                })
+                if page_revision == revision:
+                    rows.index_sync.append({
+                        "doc_id": uuid.uuid5(chunk_id, str(revision)), "tenant_id": file.tenant_id,
+                        "file_id": file.id, "chunk_id": chunk_id, "workspace_id": file.workspace_id,
+                        "chunk_hash": chunk_hash,
+                    })
+        return rows
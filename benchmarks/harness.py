@@ -0,0 +1,175 @@
+"""
+Shared plumbing for the benchmark scripts: timing, percentiles, table sizes
+and baseline files.
+
+A baseline file is the JSON a run writes with ``--output``. Pass an older one
+with ``--compare`` to print how throughput and p99 moved since; runs are only
+comparable on the same machine, PostgreSQL version and ``--chunks``/``--seed``.
+"""
+import json
+import math
+import platform
+import subprocess
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Hosts a benchmark may write to without --allow-remote
+LOCAL_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+
+# Heap (with TOAST) and index bytes over all partitions of a table
+TABLE_SIZE = text(
+    "WITH rels AS (SELECT relid FROM pg_partition_tree(CAST(:table AS regclass)) "
+    "UNION SELECT CAST(:table AS regclass)) "
+    "SELECT COALESCE(sum(pg_table_size(relid)), 0), COALESCE(sum(pg_indexes_size(relid)), 0), "
+    "(SELECT COALESCE(sum(c.reltuples) FILTER (WHERE c.reltuples > 0), 0) FROM rels JOIN pg_class c ON c.oid = relid) "
+    "FROM rels"
+)
+# Bytes per index of a table, partitions' indexes summed under their parent index
+INDEX_SIZES = text(
+    "SELECT i.indexrelid::regclass::text, "
+    "(SELECT COALESCE(sum(pg_relation_size(relid)), 0) FROM "
+    "(SELECT relid FROM pg_partition_tree(i.indexrelid) UNION SELECT i.indexrelid) AS parts) "
+    "FROM pg_index i WHERE i.indrelid = CAST(:table AS regclass) ORDER BY 1"
+)
+
+
+def check_local(url: str, allow_remote: bool) -> None:
+    """Refuse to write benchmark data anywhere but a local server unless asked to."""
+    parsed = make_url(url)
+    host = parsed.host or parsed.query.get("host")
+    if isinstance(host, tuple):
+        host = host[0]
+    if not allow_remote and host not in LOCAL_HOSTS and not str(host).startswith("/"):
+        raise SystemExit(f"refusing to run against {host}; pass --allow-remote to write benchmark data there")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank ``q`` percentile (0-100) of ``values``; 0 when empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+@dataclass
+class Timings:
+    """Latencies of one scenario's operations and the rows they moved."""
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    rows: int = 0
+    seconds: float = 0.0
+
+    def record(self, seconds: float, rows: int = 0) -> None:
+        self.latencies.append(seconds)
+        self.rows += rows
+
+    @contextmanager
+    def operation(self, rows: int = 0) -> Iterator[None]:
+        started = time.perf_counter()
+        yield
+        self.record(time.perf_counter() - started, rows)
+
+    @contextmanager
+    def wall_clock(self) -> Iterator[None]:
+        """Time the whole scenario, concurrency included, for throughput."""
+        started = time.perf_counter()
+        yield
+        self.seconds += time.perf_counter() - started
+
+    def summary(self) -> dict:
+        seconds = self.seconds or sum(self.latencies)
+        return {
+            "operations": len(self.latencies),
+            "rows": self.rows,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1e3, 3),
+            "p99_ms": round(percentile(self.latencies, 99) * 1e3, 3),
+            "max_ms": round(max(self.latencies, default=0.0) * 1e3, 3),
+        }
+
+
+async def table_sizes(conn: AsyncConnection, table_names: List[str]) -> Dict[str, dict]:
+    sizes = {}
+    for name in table_names:
+        heap, indexes, rows = (await conn.execute(TABLE_SIZE, {"table": name})).one()
+        per_index = {index: int(size) for index, size in await conn.execute(INDEX_SIZES, {"table": name})}
+        sizes[name] = {
+            "rows_estimate": int(rows),
+            "table_bytes": int(heap),
+            "index_bytes": int(indexes),
+            "indexes": per_index,
+        }
+    return sizes
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+async def environment(conn: AsyncConnection) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "postgres": await conn.scalar(text("SHOW server_version")),
+    }
+
+
+def write_baseline(path: str, report: dict) -> None:
+    Path(path).write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+
+
+def compare(previous_path: str, report: dict) -> None:
+    """Print throughput and p99 changes per scenario against an earlier baseline file."""
+    previous = json.loads(Path(previous_path).read_text())
+    if previous.get("config") != report.get("config"):
+        print(f"note: {previous_path} was run with a different configuration: {previous.get('config')}")
+    print(f"\n{'vs ' + previous_path:<28}{'rows/s':>12}{'change':>9}{'p99 ms':>12}{'change':>9}")
+    for name, now in report["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if before is None:
+            print(f"{name:<28}{'new':>12}")
+            continue
+        print(
+            f"{name:<28}{now['rows_per_second']:>12.1f}{_change(before['rows_per_second'], now['rows_per_second']):>9}"
+            f"{now['p99_ms']:>12.2f}{_change(before['p99_ms'], now['p99_ms']):>9}"
+        )
+
+
+def _change(before: float, now: float) -> str:
+    if not before:
+        return "-"
+    return f"{(now - before) / before * 100:+.1f}%"
+
+
+def print_summaries(timings: List[Timings]) -> None:
+    print(f"{'scenario':<28}{'ops':>8}{'rows':>11}{'rows/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for t in timings:
+        s = t.summary()
+        print(f"{t.name:<28}{s['operations']:>8}{s['rows']:>11}{s['rows_per_second']:>12.1f}"
+              f"{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+
+def report(config: dict, env: dict, timings: List[Timings], sizes: Dict[str, dict]) -> dict:
+    return {
+        "config": config,
+        "environment": env,
+        "scenarios": {t.name: t.summary() for t in timings},
+        "sizes": sizes,
+    }
+
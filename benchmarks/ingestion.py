@@ -0,0 +1,228 @@
+"""
+Ingestion-path benchmark against a local PostgreSQL.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/ingestion.py --chunks 100000 \\
+        [--output ingestion.json] [--compare previous.json]
+
+The schema must be migrated (``alembic upgrade head``). The run generates a
+deterministic dataset (``datagen``) of ``--chunks`` chunks (1k for a smoke
+run up to 10M) under its own tenants, then runs in order:
+
+    bulk_ingest     every file in one transaction: files row, parsing pages,
+                    chunks, embeddings and index_sync rows through
+                    neutrino_database.bulk, --concurrency files at a time
+    reingest        --sample files upserted again with a quarter of their
+                    pages rewritten (unchanged rows are not written)
+    embedding_fetch fetch_embedding_matrix of every workspace, --repeat times
+    outbox_drain    claim_batch + ack_batch of --drain-batch rows until the
+                    dataset's index_sync rows are all acked, --concurrency workers
+    file_delete     Purger.purge_file of --sample files
+
+Each scenario reports rows per second over its wall-clock time and p50/p99
+per operation (a file, a fetch, a claim+ack round). Table and index sizes are
+taken after the drain, before deleting; they cover the whole tables, so run
+on a database holding nothing else for numbers comparable across runs. The
+report goes to ``--output`` as JSON; ``--compare`` prints the change against
+an earlier one. The benchmark tenants are purged at the end unless ``--keep``.
+"""
+import argparse
+import asyncio
+import time
+from typing import Iterator, List
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import harness
+from datagen import MODEL, Dataset, FileSpec, Scale
+from neutrino_database import bulk, db, index_queue
+from neutrino_database.config import settings
+from neutrino_database.embeddings import fetch_embedding_matrix
+from neutrino_database.models import tables
+from neutrino_database.purge import Purger
+
+INDEX_SYNC = bulk.BulkTarget(table=tables.index_sync, conflict_columns=("doc_id", "tenant_id"), update_columns=())
+TABLES = ["files", "parsing", "chunk", "embedding", "embedding_vector", "index_sync"]
+
+
+def _purger(engine: AsyncEngine) -> Purger:
+    return Purger(engine, batch_size=50_000, max_replication_lag=None)
+
+
+async def setup(engine: AsyncEngine, dataset: Dataset) -> None:
+    """Remove what an earlier run with the same seed left behind, then create the tenants."""
+    t = tables.tenant
+    async with engine.connect() as conn:
+        existing = set((await conn.execute(
+            select(t.c.id).where(t.c.id.in_([tenant["id"] for tenant in dataset.tenants]))
+        )).scalars())
+    for tenant_id in existing:
+        await _purger(engine).purge_tenant(tenant_id)
+    async with engine.begin() as conn:
+        await conn.execute(insert(tables.tenant), dataset.tenants)
+        await conn.execute(insert(tables.workspace), dataset.workspaces)
+        await conn.execute(insert(tables.datasources), dataset.datasources)
+
+
+async def _ingest_file(
+    engine: AsyncEngine, dataset: Dataset, file: FileSpec, revision: int, timings: harness.Timings,
+) -> None:
+    rows = dataset.file_rows(file, revision)
+    with timings.operation(len(rows.chunks)):
+        async with engine.begin() as conn:
+            if revision == 0:
+                await conn.execute(insert(tables.files).values(dataset.file_row(file)))
+            await bulk.copy_parsing(conn, rows.parsing)
+            await bulk.copy_chunks(conn, rows.chunks)
+            await bulk.copy_embeddings(conn, rows.embeddings)
+            if rows.index_sync:
+                await bulk.bulk_upsert(conn, INDEX_SYNC, rows.index_sync)
+
+
+async def _concurrently(concurrency: int, files: Iterator[FileSpec], work) -> None:
+    async def worker():
+        # Plain iterator shared by the workers: next() never awaits
+        for file in files:
+            await work(file)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def bulk_ingest(engine: AsyncEngine, dataset: Dataset, concurrency: int) -> harness.Timings:
+    timings = harness.Timings("bulk_ingest")
+    with timings.wall_clock():
+        await _concurrently(
+            concurrency, dataset.files(), lambda file: _ingest_file(engine, dataset, file, 0, timings),
+        )
+    return timings
+
+
+def _sample(dataset: Dataset, n: int) -> List[FileSpec]:
+    """``n`` files spread evenly over the dataset."""
+    files = list(dataset.files())
+    step = max(len(files) // n, 1)
+    return files[::step][:n]
+
+
+async def reingest(engine: AsyncEngine, dataset: Dataset, sample: List[FileSpec], concurrency: int) -> harness.Timings:
+    timings = harness.Timings("reingest")
+    with timings.wall_clock():
+        await _concurrently(
+            concurrency, iter(sample), lambda file: _ingest_file(engine, dataset, file, 1, timings),
+        )
+    return timings
+
+
+async def embedding_fetch(engine: AsyncEngine, dataset: Dataset, repeat: int) -> harness.Timings:
+    timings = harness.Timings("embedding_fetch")
+    with timings.wall_clock():
+        for _ in range(repeat):
+            for workspace in dataset.workspaces:
+                async with engine.connect() as conn:
+                    with timings.operation():
+                        matrix = await fetch_embedding_matrix(
+                            conn, workspace["tenant_id"], workspace["id"], dim=dataset.scale.dim, model=MODEL,
+                        )
+                timings.rows += len(matrix.vectors)
+    return timings
+
+
+async def outbox_drain(engine: AsyncEngine, dataset: Dataset, batch: int, concurrency: int) -> harness.Timings:
+    timings = harness.Timings("outbox_drain")
+    tenant_ids = [tenant["id"] for tenant in dataset.tenants]
+
+    async def worker(offset: int):
+        # Each worker starts on a different tenant and moves on once it is drained
+        for i in range(len(tenant_ids)):
+            tenant_id = tenant_ids[(offset + i) % len(tenant_ids)]
+            while True:
+                started = time.perf_counter()
+                async with engine.begin() as conn:
+                    tasks = await index_queue.claim_batch(conn, batch, tenant_id=tenant_id)
+                if not tasks:
+                    break
+                async with engine.begin() as conn:
+                    await index_queue.ack_batch(conn, tasks)
+                timings.record(time.perf_counter() - started, len(tasks))
+
+    with timings.wall_clock():
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return timings
+
+
+async def file_delete(engine: AsyncEngine, sample: List[FileSpec]) -> harness.Timings:
+    timings = harness.Timings("file_delete")
+    purger = _purger(engine)
+    with timings.wall_clock():
+        for file in sample:
+            with timings.operation():
+                progress = await purger.purge_file(file.tenant_id, file.id)
+            timings.rows += progress.total
+    return timings
+
+
+async def run(args: argparse.Namespace) -> None:
+    harness.check_local(settings.DATABASE_URL, args.allow_remote)
+    scale = Scale(
+        chunks=args.chunks, tenants=args.tenants, workspaces_per_tenant=args.workspaces,
+        pages_per_file=args.pages_per_file, dim=args.dim, seed=args.seed,
+    )
+    dataset = Dataset(scale)
+    engine = db.get_engine()
+    sample = _sample(dataset, args.sample)
+
+    await setup(engine, dataset)
+    results = [await bulk_ingest(engine, dataset, args.concurrency)]
+    results.append(await reingest(engine, dataset, sample, args.concurrency))
+    results.append(await embedding_fetch(engine, dataset, args.repeat))
+    results.append(await outbox_drain(engine, dataset, args.drain_batch, args.concurrency))
+    async with engine.connect() as conn:
+        for name in TABLES:
+            await conn.exec_driver_sql(f'ANALYZE "{name}"')
+        sizes = await harness.table_sizes(conn, TABLES)
+        env = await harness.environment(conn)
+    results.append(await file_delete(engine, sample))
+
+    if not args.keep:
+        for tenant in dataset.tenants:
+            await _purger(engine).purge_tenant(tenant["id"])
+    await db.dispose_engines()
+
+    harness.print_summaries(results)
+    config = {
+        "chunks": scale.chunks, "tenants": scale.tenants, "workspaces_per_tenant": scale.workspaces_per_tenant,
+        "pages_per_file": scale.pages_per_file, "chunks_per_page": scale.chunks_per_page, "dim": scale.dim,
+        "seed": scale.seed, "concurrency": args.concurrency, "sample": len(sample),
+        "drain_batch": args.drain_batch, "repeat": args.repeat,
+    }
+    report = harness.report(config, env, results, sizes)
+    harness.write_baseline(args.output, report)
+    print(f"\nwrote {args.output}")
+    if args.compare:
+        harness.compare(args.compare, report)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--workspaces", type=int, default=2, help="per tenant")
+    parser.add_argument("--pages-per-file", type=int, default=8, help="4 chunks each")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sample", type=int, default=50, help="files re-ingested and deleted")
+    parser.add_argument("--repeat", type=int, default=3, help="embedding fetches per workspace")
+    parser.add_argument("--drain-batch", type=int, default=500)
+    parser.add_argument("--output", default="ingestion.json")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--keep", action="store_true", help="leave the benchmark tenants in place")
+    parser.add_argument("--allow-remote", action="store_true", help="allow a non-local DATABASE_URL")
+    args = parser.parse_args()
+    if min(args.concurrency, args.sample, args.repeat, args.drain_batch) < 1:
+        parser.error("--concurrency, --sample, --repeat and --drain-batch must be positive")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
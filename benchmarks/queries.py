@@ -0,0 +1,131 @@
+"""
+Per-call cost of the hot-path statements: select() built per call vs ``neutrino_database.queries``.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/queries.py [--iterations 2000]
+
+Every statement runs ``--iterations`` times on one session, three ways:
+
+    select   the expression built on every call, as services used to
+    queries  the prebuilt statement and its parameters from neutrino_database.queries
+    driver   the rendered SQL straight through asyncpg: network, server and
+             driver only, the floor both others sit on
+
+and the Python overhead above the floor is reported per call. Rows are taken
+from the database when it has any (first tenant, user, chat), otherwise the
+statements run against random ids and return nothing, which still measures
+the overhead. Compare runs on the same machine only.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Callable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from neutrino_database import chats, db, queries
+from neutrino_database.models import tables
+from neutrino_database.models.orm import User
+
+WARMUP = 50
+
+
+async def _sample_ids(session: AsyncSession) -> dict:
+    t, u, c, m = tables.tenant, tables.user, tables.chat, tables.workspace_member
+    ids = dict(
+        org_external_id=await session.scalar(select(t.c.org_external_id).limit(1)) or "benchmark",
+        tenant_id=await session.scalar(select(t.c.id).limit(1)) or str(uuid.uuid4()),
+        chat_id=await session.scalar(select(c.c.id).limit(1)) or str(uuid.uuid4()),
+    )
+    user = (await session.execute(select(u.c.tenant_id, u.c.email).limit(1))).first()
+    ids["user"] = tuple(user) if user else (ids["tenant_id"], "benchmark@example.com")
+    member = (await session.execute(select(m.c.workspace_id, m.c.user_id).limit(1))).first()
+    ids["member"] = tuple(member) if member else (str(uuid.uuid4()), str(uuid.uuid4()))
+    return ids
+
+
+def _cases(ids: dict) -> List[Tuple[str, Callable, Callable]]:
+    """``(name, build select(), bind queries statement)`` per hot-path statement."""
+    t, m = tables.tenant, tables.workspace_member
+    org, tenant_id, chat_id = ids["org_external_id"], ids["tenant_id"], ids["chat_id"]
+    email_tenant, email = ids["user"]
+    workspace_id, user_id = ids["member"]
+    return [
+        (
+            "tenant by org_external_id",
+            lambda: select(*queries.TENANT_COLUMNS).where(t.c.org_external_id == org),
+            lambda: queries.tenant_by_org(org),
+        ),
+        (
+            "user by (tenant_id, email)",
+            lambda: select(User).where(User.tenant_id == email_tenant, User.email == email),
+            lambda: queries.user_by_email(email_tenant, email),
+        ),
+        (
+            "chat list, first page",
+            # Same builder as the prebuilt statement, run per call
+            lambda: queries._chat_page(False, False).params(tenant_id=tenant_id, rows=chats.DEFAULT_PAGE_SIZE + 1),
+            lambda: queries.chat_page(tenant_id, None, None, chats.DEFAULT_PAGE_SIZE + 1),
+        ),
+        (
+            "message page",
+            lambda: queries._message_page(False).params(chat_id=chat_id, rows=chats.DEFAULT_PAGE_SIZE + 1),
+            lambda: queries.message_page(chat_id, None, chats.DEFAULT_PAGE_SIZE + 1),
+        ),
+        (
+            "workspace membership",
+            lambda: select(m.c.is_workspace_admin).where(m.c.workspace_id == workspace_id, m.c.user_id == user_id),
+            lambda: queries.workspace_membership(workspace_id, user_id),
+        ),
+    ]
+
+
+async def _per_call(iterations: int, call: Callable) -> float:
+    for _ in range(WARMUP):
+        await call()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def run(iterations: int) -> None:
+    async with db.get_sessionmaker()() as session:
+        ids = await _sample_ids(session)
+        raw = (await (await session.connection()).get_raw_connection()).driver_connection
+        dialect = session.bind.dialect
+
+        print(f"{'statement':<28}{'select us':>11}{'queries us':>12}{'driver us':>11}{'saved us':>10}{'overhead':>14}")
+        for name, build_select, bind in _cases(ids):
+            stmt, params = bind()
+            compiled = stmt.compile(dialect=dialect)
+            sql = str(compiled)
+            args = [compiled.construct_params(params)[key] for key in compiled.positiontup]
+
+            async def run_select():
+                (await session.execute(build_select())).all()
+
+            async def run_queries():
+                (await session.execute(*bind())).all()
+
+            async def run_driver():
+                await raw.fetch(sql, *args)
+
+            plain = await _per_call(iterations, run_select)
+            cached = await _per_call(iterations, run_queries)
+            floor = await _per_call(iterations, run_driver)
+            overhead = f"{plain - floor:.0f} -> {cached - floor:.0f}"
+            print(f"{name:<28}{plain:>11.1f}{cached:>12.1f}{floor:>11.1f}{plain - cached:>10.1f}{overhead:>14}")
+        await session.rollback()
+    await db.dispose_engines()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(run(parser.parse_args().iterations))
+
+
+if __name__ == "__main__":
+    main()
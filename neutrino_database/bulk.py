@@ -0,0 +1,252 @@
+"""
+Bulk loaders for the ingestion tables.
+
+Rows are streamed with binary ``COPY`` into a transaction-scoped staging table
+and then merged into the target with a single ``INSERT ... SELECT ... ON
+CONFLICT`` on the table's natural unique index. Compared to ORM flushes or
+``executemany`` this costs a handful of round trips per batch instead of one
+per row, and values are encoded once by asyncpg's binary codecs.
+
+All functions take an ``AsyncSession`` (or ``AsyncConnection``) and run inside
+the caller's transaction; nothing is committed here.
+"""
+import uuid
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Sequence, Union
+
+from sqlalchemy import Table, Text, cast, column, func, select, table as table_clause, text, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from neutrino_database.models import tables
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class BulkTarget:
+    """How rows for one table are merged after COPY."""
+    table: Table
+    # Columns of the unique index used as the ON CONFLICT arbiter
+    conflict_columns: tuple
+    # Columns overwritten when a row already exists
+    update_columns: tuple
+    # Whether the table has an updated_at column to bump on update
+    touch_updated_at: bool = False
+
+
+PARSING = BulkTarget(
+    table=tables.parsing,
+    conflict_columns=("tenant_id", "file_id", "page_no"),  # idx_parsing_file_page
+    update_columns=("page_text", "page_hash"),
+    touch_updated_at=True,
+)
+
+CHUNK = BulkTarget(
+    table=tables.chunk,
+    conflict_columns=("tenant_id", "file_id", "page_no", "chunk_hash"),  # idx_chunk_file_page_hash
+    update_columns=("ord", "chunk_text"),
+)
+
+EMBEDDING_VECTOR = BulkTarget(
+    table=tables.embedding_vector,
+    conflict_columns=("tenant_id", "model", "chunk_hash"),  # idx_embedding_vector_tenant_model_hash
+    update_columns=("dense_vector", "dense_dim", "sparse_vector", "sparse_dim"),
+)
+
+EMBEDDING = BulkTarget(
+    table=tables.embedding,
+    conflict_columns=("tenant_id", "file_id", "chunk_hash"),  # idx_embedding_tenant_file_chunk_unique
+    update_columns=("vector_id", "model"),
+)
+
+# Keys of an embedding row that are stored on its shared embedding_vector
+VECTOR_COLUMNS = ("dense_vector", "dense_dim", "sparse_vector", "sparse_dim")
+
+
+async def _get_connection(bind: Union[AsyncSession, AsyncConnection]) -> AsyncConnection:
+    if isinstance(bind, AsyncSession):
+        return await bind.connection()
+    return bind
+
+
+def _resolve_columns(target: BulkTarget, first_row: Mapping[str, Any]) -> list:
+    known = target.table.c
+    unknown = set(first_row) - set(known.keys())
+    if unknown:
+        raise ValueError(f"Unknown columns for {target.table.name}: {sorted(unknown)}")
+
+    missing = [name for name in target.conflict_columns if name not in first_row]
+    if missing:
+        raise ValueError(f"Rows for {target.table.name} must include {missing}")
+
+    # Keep table order so the staging table mirrors the target layout.
+    names = set(first_row) | {"id"}
+    return [c.name for c in target.table.columns if c.name in names]
+
+
+def _dedupe(target: BulkTarget, rows: Sequence[Mapping[str, Any]]) -> list:
+    # ON CONFLICT DO UPDATE cannot touch the same row twice in one statement,
+    # so collapse duplicates here (last one wins).
+    deduped = {}
+    for row in rows:
+        deduped[tuple(row.get(name) for name in target.conflict_columns)] = row
+    return list(deduped.values())
+
+
+async def bulk_upsert(
+    bind: Union[AsyncSession, AsyncConnection],
+    target: BulkTarget,
+    rows: Iterable[Mapping[str, Any]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    COPY ``rows`` into a staging table and merge them into ``target.table``.
+
+    Every row must carry the same keys. ``id`` is generated when absent.
+    Returns the number of rows inserted or changed; rows identical to what is
+    already stored are skipped without writing a new tuple version.
+    """
+    conn = await _get_connection(bind)
+    dialect = conn.dialect
+
+    iterator = iter(rows)
+    batch = _take(iterator, batch_size)
+    if not batch:
+        return 0
+
+    column_names = _resolve_columns(target, batch[0])
+    columns = [target.table.c[name] for name in column_names]
+    processors = [c.type.dialect_impl(dialect).bind_processor(dialect) for c in columns]
+
+    stage_name = f"_stage_{target.table.name}_{uuid.uuid4().hex[:12]}"
+    column_list = ", ".join(f'"{name}"' for name in column_names)
+    await conn.execute(text(
+        f'CREATE TEMP TABLE "{stage_name}" ON COMMIT DROP AS '
+        f'SELECT {column_list} FROM "{target.table.name}" WITH NO DATA'
+    ))
+
+    stage = table_clause(stage_name, *(column(name) for name in column_names))
+    merge = _build_merge(target, stage, column_names)
+
+    raw = await conn.get_raw_connection()
+    driver_connection = raw.driver_connection
+
+    affected = 0
+    while batch:
+        records = []
+        for row in _dedupe(target, batch):
+            record = []
+            for name, processor in zip(column_names, processors):
+                value = row.get(name)
+                if value is None and name == "id":
+                    value = uuid.uuid4()
+                if processor is not None and value is not None:
+                    value = processor(value)
+                record.append(value)
+            records.append(tuple(record))
+
+        await driver_connection.copy_records_to_table(stage_name, records=records, columns=column_names)
+        result = await conn.execute(merge)
+        affected += result.rowcount
+        await conn.execute(text(f'TRUNCATE "{stage_name}"'))
+
+        batch = _take(iterator, batch_size)
+
+    await conn.execute(text(f'DROP TABLE "{stage_name}"'))
+    return affected
+
+
+def _build_merge(target: BulkTarget, stage, column_names: list):
+    stmt = insert(target.table).from_select(column_names, select(*(stage.c[name] for name in column_names)))
+
+    update_columns = [name for name in target.update_columns if name in column_names]
+    if not update_columns:
+        return stmt.on_conflict_do_nothing(index_elements=list(target.conflict_columns))
+
+    set_ = {name: stmt.excluded[name] for name in update_columns}
+    if target.touch_updated_at:
+        set_["updated_at"] = func.now()
+
+    # Only rewrite rows whose payload actually changed.
+    current = tuple_(*(target.table.c[name] for name in update_columns))
+    incoming = tuple_(*(stmt.excluded[name] for name in update_columns))
+    return stmt.on_conflict_do_update(
+        index_elements=list(target.conflict_columns),
+        set_=set_,
+        where=current.is_distinct_from(incoming),
+    )
+
+
+def _take(iterator, n: int) -> list:
+    batch = []
+    for row in iterator:
+        batch.append(row)
+        if len(batch) >= n:
+            break
+    return batch
+
+
+async def copy_parsing(bind, rows: Iterable[Mapping[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Bulk upsert ``parsing`` pages on ``(tenant_id, file_id, page_no)``."""
+    return await bulk_upsert(bind, PARSING, rows, batch_size)
+
+
+async def copy_chunks(bind, rows: Iterable[Mapping[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Bulk upsert ``chunk`` rows on ``(tenant_id, file_id, page_no, chunk_hash)``."""
+    return await bulk_upsert(bind, CHUNK, rows, batch_size)
+
+
+async def copy_embeddings(bind, rows: Iterable[Mapping[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Bulk upsert embeddings given as ``embedding`` rows carrying their vectors.
+
+    Vectors are merged into ``embedding_vector`` on ``(tenant_id, model,
+    chunk_hash)``, then the ``embedding`` rows are merged on ``(tenant_id,
+    file_id, chunk_hash)`` pointing at them. Returns the number of embedding
+    rows inserted or changed.
+    """
+    conn = await _get_connection(bind)
+    iterator = iter(rows)
+    affected = 0
+    while True:
+        batch = _take(iterator, batch_size)
+        if not batch:
+            return affected
+
+        # Both sides use the canonical tenant spelling and '' for "no model",
+        # so the vector lookup below matches whatever form the caller passed.
+        keys = [_vector_key(row) for row in batch]
+        vectors = []
+        for row, (tenant_id, model, chunk_hash) in zip(batch, keys):
+            vector = {name: row[name] for name in VECTOR_COLUMNS if name in row}
+            vector.update(tenant_id=tenant_id, model=model, chunk_hash=chunk_hash)
+            vectors.append(vector)
+        await bulk_upsert(conn, EMBEDDING_VECTOR, vectors, batch_size)
+
+        vector_ids = await _vector_ids(conn, set(keys))
+        links = []
+        for row, key in zip(batch, keys):
+            link = {name: value for name, value in row.items() if name not in VECTOR_COLUMNS}
+            link.update(tenant_id=key[0], model=key[1], vector_id=vector_ids[key])
+            links.append(link)
+        affected += await bulk_upsert(conn, EMBEDDING, links, batch_size)
+
+
+def _vector_key(row: Mapping[str, Any]) -> tuple:
+    return str(uuid.UUID(str(row["tenant_id"]))), row.get("model") or "", row["chunk_hash"]
+
+
+async def _vector_ids(conn: AsyncConnection, keys: set) -> dict:
+    v = tables.embedding_vector
+    tenant_ids, models, hashes = zip(*keys)
+    keyed = select(
+        func.unnest(cast(list(tenant_ids), ARRAY(UUID(as_uuid=False)))).label("tenant_id"),
+        func.unnest(cast(list(models), ARRAY(Text))).label("model"),
+        func.unnest(cast(list(hashes), ARRAY(Text))).label("chunk_hash"),
+    ).subquery()
+    stmt = select(v.c.tenant_id, v.c.model, v.c.chunk_hash, v.c.id).join(
+        keyed,
+        (v.c.tenant_id == keyed.c.tenant_id) & (v.c.model == keyed.c.model) & (v.c.chunk_hash == keyed.c.chunk_hash),
+    )
+    return {(str(uuid.UUID(str(t))), m, h): vector_id for t, m, h, vector_id in await conn.execute(stmt)}
@@ -0,0 +1,216 @@
+"""
+Keyset pagination for the chat sidebar and message history.
+
+Pages are addressed by an opaque cursor holding the ``(timestamp, id)`` of
+the last row the client has seen, never by ``OFFSET``. Each page is a single
+backward range scan on the matching index, starting right after the cursor::
+
+    ix_chat_tenant_updated_at       (tenant_id, updated_at, id)
+    ix_chat_tenant_user_updated_at  (tenant_id, created_by, updated_at, id)
+    ix_message_chat_created_at      (chat_id, created_at, id)
+
+so page 1000 costs the same as page 1. ``id`` breaks ties between rows with
+the same timestamp, so no row is skipped or repeated across pages.
+
+``load_recent_messages`` loads just the tail of one or many chats (the newest
+N messages, optionally cut to a token budget) for assembling a model's
+context window. Prefer it over ``Chat.messages``, which loads the whole
+history.
+"""
+import base64
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import ARRAY, Select, cast, func, select, true
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from neutrino_database import queries
+from neutrino_database.models import tables
+from neutrino_database.models.orm import Chat, Message
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+DEFAULT_WINDOW_SIZE = 50
+# Rough characters per token for the token budget (no tokenizer in the database)
+CHARS_PER_TOKEN = 4
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Page(Generic[T]):
+    """One page of results; ``next_cursor`` is None on the last page."""
+    items: List[T]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    raw = json.dumps([timestamp.isoformat(), str(row_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), str(uuid.UUID(row_id))
+    except (ValueError, TypeError, AttributeError) as exc:
+        raise ValueError("Invalid pagination cursor") from exc
+
+
+def _page_size(limit: int) -> int:
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def chats_query(
+    tenant_id: str,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> queries.Bound:
+    """
+    Most recently updated chats first, starting after ``after``.
+
+    Selects one row more than ``limit`` so the caller can tell whether
+    another page exists. Returns the shared ``queries.chat_page`` statement
+    and its parameters, to run as ``session.execute(*chats_query(...))``.
+    """
+    position = decode_cursor(after) if after is not None else None
+    return queries.chat_page(tenant_id, user_id, position, _page_size(limit) + 1)
+
+
+def messages_query(
+    chat_id: str,
+    before: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> queries.Bound:
+    """Newest messages of ``chat_id`` first, starting before ``before``; one extra row, returned as in ``chats_query``."""
+    position = decode_cursor(before) if before is not None else None
+    return queries.message_page(chat_id, position, _page_size(limit) + 1)
+
+
+async def list_chats(
+    session: AsyncSession,
+    tenant_id: str,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[Chat]:
+    """Page through a tenant's chats (optionally one user's) by ``updated_at``, newest first."""
+    size = _page_size(limit)
+    rows = list((await session.execute(*chats_query(tenant_id, user_id, after, size))).scalars())
+    if len(rows) <= size:
+        return Page(rows, None)
+    rows = rows[:size]
+    return Page(rows, encode_cursor(rows[-1].updated_at, rows[-1].id))
+
+
+async def list_messages(
+    session: AsyncSession,
+    chat_id: str,
+    before: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[Message]:
+    """
+    Page backwards through a chat's history.
+
+    Items are in chronological order (oldest first) for display;
+    ``next_cursor`` fetches the messages preceding the first one.
+    """
+    size = _page_size(limit)
+    rows = list((await session.execute(*messages_query(chat_id, before, size))).scalars())
+    cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    rows.reverse()
+    return Page(rows, cursor)
+
+
+def _estimated_tokens(content):
+    return (func.char_length(content) + (CHARS_PER_TOKEN - 1)) // CHARS_PER_TOKEN
+
+
+def recent_messages_query(
+    chat_ids: Iterable[str],
+    limit: int = DEFAULT_WINDOW_SIZE,
+    max_tokens: Optional[int] = None,
+    since: Optional[datetime] = None,
+) -> Select:
+    """
+    The newest ``limit`` messages of every chat in ``chat_ids``, newest first per chat.
+
+    One ``LATERAL`` subquery per chat walks ``ix_message_chat_created_at``
+    backwards and stops after ``limit`` rows, so the cost does not depend on
+    the length of the history. With ``max_tokens`` a running total of
+    estimated tokens (``CHARS_PER_TOKEN``) is kept alongside, and messages
+    past the budget are dropped. ``since`` bounds ``created_at`` from below
+    so only the newest monthly partitions are visited.
+    """
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    if max_tokens is not None and max_tokens < 1:
+        raise ValueError("max_tokens must be positive")
+
+    m = tables.message
+    chats = func.unnest(cast(list(map(str, chat_ids)), ARRAY(UUID(as_uuid=False)))).table_valued("id").render_derived("chats")
+    newest_first = (m.c.created_at.desc(), m.c.id.desc())
+
+    window = select(
+        m, func.sum(_estimated_tokens(m.c.content)).over(order_by=newest_first).label("running_tokens"),
+    ).where(m.c.chat_id == chats.c.id, m.c.deleted_at.is_(None))
+    if since is not None:
+        window = window.where(m.c.created_at >= since)
+    window = window.order_by(*newest_first).limit(limit).lateral("recent")
+
+    recent = aliased(Message, window)
+    stmt = select(recent).select_from(chats).join(window, true())
+    if max_tokens is not None:
+        stmt = stmt.where(window.c.running_tokens <= max_tokens)
+    return stmt
+
+
+async def load_recent_messages(
+    session: AsyncSession,
+    chat_ids: Iterable[str],
+    limit: int = DEFAULT_WINDOW_SIZE,
+    max_tokens: Optional[int] = None,
+    since: Optional[datetime] = None,
+) -> Dict[str, List[Message]]:
+    """
+    The tail of each chat in one round trip, keyed by canonical chat id
+    (lowercase, hyphenated, as ``str(uuid.UUID(...))``).
+
+    Each list is in chronological order and holds at most ``limit``
+    messages; with ``max_tokens`` only the newest messages whose estimated
+    total stays within the budget (possibly none, if the newest message alone
+    exceeds it). Chats without messages map to an empty list.
+    """
+    windows: Dict[str, List[Message]] = {str(uuid.UUID(str(chat_id))): [] for chat_id in chat_ids}
+    if not windows:
+        return windows
+    stmt = recent_messages_query(list(windows), limit, max_tokens, since)
+    for message in (await session.execute(stmt)).scalars():
+        windows[message.chat_id].append(message)
+    for messages in windows.values():
+        messages.sort(key=lambda message: (message.created_at, message.id))
+    return windows
+
+
+async def recent_messages(
+    session: AsyncSession,
+    chat_id: str,
+    limit: int = DEFAULT_WINDOW_SIZE,
+    max_tokens: Optional[int] = None,
+    since: Optional[datetime] = None,
+) -> List[Message]:
+    """``load_recent_messages`` for a single chat."""
+    return (await load_recent_messages(session, [chat_id], limit, max_tokens, since))[str(uuid.UUID(str(chat_id)))]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from neutrino_database.paths import ProjectPath
 from pathlib import Path
@@ -6,6 +8,67 @@ class Settings(BaseSettings):
 
     DATABASE_URL: str
 
+    # Read replicas: comma-separated URLs, empty for none. Reads only go to a
+    # replica through neutrino_database.routing, and only while its replay
+    # lag (checked every DB_REPLICA_CHECK_INTERVAL seconds) stays within
+    # DB_REPLICA_MAX_LAG seconds.
+    DATABASE_REPLICA_URLS: str = ""
+    # "round_robin" or "least_connections"
+    DB_REPLICA_BALANCING: str = "round_robin"
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 5.0
+
+    # Connection pool (applies to both the async and the sync engine)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_USE_LIFO: bool = True
+
+    # asyncpg prepared statement cache, per connection. Room for every
+    # variant of the statements in neutrino_database.queries plus each
+    # service's own: an evicted statement is prepared again on next use.
+    DB_STATEMENT_CACHE_SIZE: int = 256
+    # Set when connecting through PgBouncer in transaction pooling mode:
+    # turns the statement caches off (a prepared statement would live on a
+    # server connection the next transaction may not get) and gives the
+    # statements asyncpg still prepares unique names.
+    DB_PGBOUNCER: bool = False
+
+    # Query instrumentation (neutrino_database.instrumentation): latency
+    # histograms for every engine built by neutrino_database.db and N+1
+    # detection in every Session. Off by default.
+    DB_INSTRUMENT: bool = False
+    # Statements at least this slow are logged; 0 disables the log
+    DB_SLOW_QUERY_SECONDS: float = 0.5
+    # Lazy loads of one relationship in one session reported as N+1
+    DB_N_PLUS_ONE_THRESHOLD: int = 10
+
+    # Hash partitions per ingestion table (parsing, chunk, embedding,
+    # index_sync), applied by migration 6e0b3a9f7c21 and metadata.create_all
+    DB_TENANT_PARTITIONS: int = 16
+
+    # Migrations (alembic/env.py and neutrino_database.migrations): how long a
+    # statement may wait for a lock before giving up, so writers do not queue
+    # behind it, and how many times it is tried before the migration fails.
+    # DB_MIGRATION_STATEMENT_TIMEOUT caps statements run under a lock that
+    # blocks writes (migrations.guarded), not the migration as a whole.
+    DB_MIGRATION_LOCK_TIMEOUT: str = "5s"
+    DB_MIGRATION_STATEMENT_TIMEOUT: str = "30s"
+    DB_MIGRATION_LOCK_RETRIES: int = 5
+    # neutrino_database.migration_plan fails revisions that block writes on a
+    # table of at least this size (heap and indexes) while doing more than a
+    # catalog update
+    DB_MIGRATION_BLOCKING_THRESHOLD_MB: int = 100
+    # Partition maintenance (neutrino_database.retention) and purge batches
+    # (neutrino_database.purge): how long their statements may wait for a
+    # lock before giving up, so writers do not queue behind them
+    DB_MAINTENANCE_LOCK_TIMEOUT: str = "5s"
+
+    DB_ECHO: bool = False
+    DB_APPLICATION_NAME: Optional[str] = None
+
     model_config = SettingsConfigDict(
         env_file=Path(ProjectPath.ROOT / ".env") if (ProjectPath.ROOT / ".env").exists() else None,
         env_file_encoding="utf-8",
@@ -14,4 +77,4 @@ class Settings(BaseSettings):
     )
 
 # Instantiate only once.
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,252 @@
+"""
+Process-wide engines and session factories.
+
+Every service should get its connections from here instead of calling
+``create_async_engine`` itself, so pool sizing, pre-ping, recycle and the
+asyncpg statement cache are configured in one place (see ``Settings``).
+
+Read replicas configured in ``DATABASE_REPLICA_URLS`` get one engine each
+(``get_replica_engines``); ``neutrino_database.routing`` decides when to use
+them.
+
+Engines are created lazily, once per process. Pools must never be shared
+across ``fork()``: the child drops the inherited connections without closing
+them (they still belong to the parent) and builds fresh engines on first use.
+"""
+import os
+import threading
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, List, Optional
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from neutrino_database import instrumentation
+from neutrino_database.config import settings
+from neutrino_database.models.types import register_vector_support
+
+ASYNC_DRIVER = "postgresql+asyncpg://"
+SYNC_DRIVER = "postgresql+psycopg2://"
+
+_lock = threading.Lock()
+_pid: Optional[int] = None
+
+_async_engine: Optional[AsyncEngine] = None
+_async_sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None
+_sync_engine: Optional[Engine] = None
+_sync_sessionmaker: Optional[sessionmaker[Session]] = None
+_replica_engines: Optional[List[AsyncEngine]] = None
+
+
+def sync_database_url(url: str) -> str:
+    """Convert the asyncpg URL from settings to its psycopg2 equivalent."""
+    return url.replace(ASYNC_DRIVER, SYNC_DRIVER)
+
+
+def async_database_url(url: str) -> str:
+    """Convert a psycopg2 (or driverless) URL to its asyncpg equivalent."""
+    if url.startswith(SYNC_DRIVER):
+        return url.replace(SYNC_DRIVER, ASYNC_DRIVER)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", ASYNC_DRIVER)
+    return url
+
+
+def replica_urls() -> List[str]:
+    """The read replica URLs from settings, in configured order."""
+    return [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+
+def _pool_kwargs() -> dict:
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_use_lifo=settings.DB_POOL_USE_LIFO,
+        echo=settings.DB_ECHO,
+    )
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def _async_connect_args() -> dict:
+    cache_size = 0 if settings.DB_PGBOUNCER else settings.DB_STATEMENT_CACHE_SIZE
+    connect_args = {
+        # asyncpg's own statement cache and SQLAlchemy's prepared statement
+        # cache are sized together; 0 disables both.
+        "statement_cache_size": cache_size,
+        "prepared_statement_cache_size": cache_size,
+    }
+    if settings.DB_PGBOUNCER:
+        connect_args["prepared_statement_name_func"] = _unique_statement_name
+    if settings.DB_APPLICATION_NAME:
+        connect_args["server_settings"] = {"application_name": settings.DB_APPLICATION_NAME}
+    return connect_args
+
+
+def _sync_connect_args() -> dict:
+    connect_args = {}
+    if settings.DB_APPLICATION_NAME:
+        connect_args["application_name"] = settings.DB_APPLICATION_NAME
+    return connect_args
+
+
+def _instrument(engine: Engine) -> None:
+    if settings.DB_INSTRUMENT:
+        instrumentation.instrument_engine(engine)
+        instrumentation.instrument_sessions()
+
+
+def create_pooled_async_engine(url: str) -> AsyncEngine:
+    """Build an ``AsyncEngine`` for ``url`` with the shared pool settings."""
+    engine = create_async_engine(
+        async_database_url(url),
+        connect_args=_async_connect_args(),
+        **_pool_kwargs(),
+    )
+    register_vector_support(engine.sync_engine)
+    _instrument(engine.sync_engine)
+    return engine
+
+
+def create_pooled_sync_engine(url: str) -> Engine:
+    """Build a psycopg2 ``Engine`` for ``url`` with the shared pool settings."""
+    engine = create_engine(
+        sync_database_url(url),
+        connect_args=_sync_connect_args(),
+        **_pool_kwargs(),
+    )
+    register_vector_support(engine)
+    _instrument(engine)
+    return engine
+
+
+def _check_pid() -> None:
+    # Covers forks that bypass os.register_at_fork (e.g. multiprocessing
+    # started from a C extension).
+    if _pid is not None and _pid != os.getpid():
+        _reset_after_fork()
+
+
+def get_engine() -> AsyncEngine:
+    """Return the process-wide ``AsyncEngine``, creating it on first use."""
+    global _async_engine, _pid
+    _check_pid()
+    if _async_engine is None:
+        with _lock:
+            if _async_engine is None:
+                _async_engine = create_pooled_async_engine(settings.DATABASE_URL)
+                _pid = os.getpid()
+    return _async_engine
+
+
+def get_replica_engines() -> List[AsyncEngine]:
+    """Return one process-wide ``AsyncEngine`` per read replica; empty without replicas."""
+    global _replica_engines, _pid
+    _check_pid()
+    if _replica_engines is None:
+        with _lock:
+            if _replica_engines is None:
+                _replica_engines = [create_pooled_async_engine(url) for url in replica_urls()]
+                _pid = os.getpid()
+    return _replica_engines
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Return the process-wide ``async_sessionmaker`` bound to ``get_engine()``."""
+    global _async_sessionmaker
+    engine = get_engine()
+    if _async_sessionmaker is None:
+        with _lock:
+            if _async_sessionmaker is None:
+                _async_sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+def get_sync_engine() -> Engine:
+    """Return the process-wide psycopg2 ``Engine``, creating it on first use."""
+    global _sync_engine, _pid
+    _check_pid()
+    if _sync_engine is None:
+        with _lock:
+            if _sync_engine is None:
+                _sync_engine = create_pooled_sync_engine(settings.DATABASE_URL)
+                _pid = os.getpid()
+    return _sync_engine
+
+
+def get_sync_sessionmaker() -> sessionmaker[Session]:
+    """Return the process-wide ``sessionmaker`` bound to ``get_sync_engine()``."""
+    global _sync_sessionmaker
+    engine = get_sync_engine()
+    if _sync_sessionmaker is None:
+        with _lock:
+            if _sync_sessionmaker is None:
+                _sync_sessionmaker = sessionmaker(engine, expire_on_commit=False)
+    return _sync_sessionmaker
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Yield a session that commits on success and rolls back on error."""
+    async with get_sessionmaker()() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+
+
+@contextmanager
+def sync_session_scope() -> Iterator[Session]:
+    """Synchronous counterpart of ``session_scope``."""
+    with get_sync_sessionmaker()() as session:
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+
+
+async def dispose_engines() -> None:
+    """Close all pooled connections; call on application shutdown."""
+    global _async_engine, _async_sessionmaker, _sync_engine, _sync_sessionmaker, _replica_engines
+    with _lock:
+        async_engine, sync_engine, replica_engines = _async_engine, _sync_engine, _replica_engines
+        _async_engine = _async_sessionmaker = None
+        _sync_engine = _sync_sessionmaker = None
+        _replica_engines = None
+    if async_engine is not None:
+        await async_engine.dispose()
+    for engine in replica_engines or ():
+        await engine.dispose()
+    if sync_engine is not None:
+        sync_engine.dispose()
+
+
+def _reset_after_fork() -> None:
+    """Forget engines inherited from the parent without closing their sockets."""
+    global _async_engine, _async_sessionmaker, _sync_engine, _sync_sessionmaker, _replica_engines, _lock, _pid
+    _lock = threading.Lock()
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+    for engine in _replica_engines or ():
+        engine.sync_engine.dispose(close=False)
+    if _sync_engine is not None:
+        _sync_engine.dispose(close=False)
+    _async_engine = _async_sessionmaker = None
+    _sync_engine = _sync_sessionmaker = None
+    _replica_engines = None
+    _pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,229 @@
+"""
+Readers and the content-addressed vector store behind ``embedding``.
+
+Vectors live in ``embedding_vector``, keyed by ``(tenant_id, model,
+chunk_hash)``; ``embedding`` rows only tie a chunk of a file to one of them.
+Before embedding a batch of chunks the pipeline asks ``missing_chunk_hashes``
+which ones actually need a model call, links the rest with
+``link_embeddings`` and writes new vectors with ``bulk.copy_embeddings``.
+
+``fetch_embedding_matrix`` is meant for reranking and index rebuilds, where
+every vector of a workspace (or of some of its files) is needed at once.
+Rows are streamed through a server-side cursor and the raw vector payloads
+are copied batch by batch into a single preallocated ``float32`` matrix, so
+no per-row Python list or array is ever built and memory stays at one batch
+plus the result.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from sqlalchemy import LargeBinary, exists, func, literal, select, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from neutrino_database.models import tables
+from neutrino_database.models.types import PGVECTOR_FLAG, WIRE_DTYPE
+
+DEFAULT_BATCH_SIZE = 2000
+LOOKUP_BATCH_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class EmbeddingMatrix:
+    """Row ``i`` of ``vectors`` belongs to ``chunk_hashes[i]`` in ``file_ids[i]``."""
+    vectors: np.ndarray
+    chunk_hashes: np.ndarray
+    file_ids: np.ndarray
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+
+def _empty(dim: int) -> EmbeddingMatrix:
+    return EmbeddingMatrix(
+        vectors=np.empty((0, dim), dtype=np.float32),
+        chunk_hashes=np.empty(0, dtype=object),
+        file_ids=np.empty(0, dtype=object),
+    )
+
+
+async def fetch_embedding_matrix(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    workspace_id: str,
+    file_ids: Optional[Sequence[Any]] = None,
+    dim: Optional[int] = None,
+    model: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> EmbeddingMatrix:
+    """
+    Load the dense vectors of a workspace into one ``(n, dim)`` float32 array.
+
+    When ``dim`` is not given it is taken from the first matching row; rows of
+    other dimensions are skipped. Row order is unspecified.
+    """
+    # read_only keeps a routing.RoutingSession on its replica
+    conn = await bind.connection(bind_arguments={"read_only": True}) if isinstance(bind, AsyncSession) else bind
+    e, v = tables.embedding, tables.embedding_vector
+    joined = e.join(v, v.c.id == e.c.vector_id)
+
+    where = [
+        e.c.tenant_id == tenant_id,
+        v.c.tenant_id == tenant_id,
+        e.c.workspace_id == workspace_id,
+        v.c.dense_vector.is_not(None),
+    ]
+    if file_ids is not None:
+        where.append(e.c.file_id.in_(list(file_ids)))
+    if model is not None:
+        where.append(v.c.model == model)
+
+    if dim is None:
+        dim = await conn.scalar(select(v.c.dense_dim).select_from(joined).where(*where).limit(1))
+        if dim is None:
+            return _empty(0)
+    where.append(v.c.dense_dim == dim)
+
+    capacity = await conn.scalar(select(func.count()).select_from(joined).where(*where))
+    if not capacity:
+        return _empty(dim)
+
+    # Fetch the undecoded payload. pgvector's send format has a 4-byte header
+    # (dim, unused) in front of the big-endian floats, i.e. one extra float
+    # slot per row; the bytea fallback is just the floats.
+    if getattr(conn.dialect, PGVECTOR_FLAG, True):
+        payload, header = func.vector_send(v.c.dense_vector), 1
+    else:
+        payload, header = v.c.dense_vector, 0
+    stmt = select(type_coerce(payload, LargeBinary), e.c.chunk_hash, e.c.file_id).select_from(joined).where(*where)
+
+    vectors = np.empty((capacity, dim), dtype=np.float32)
+    chunk_hashes = []
+    row_file_ids = []
+    n = 0
+
+    result = await conn.stream(stmt.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        m = len(rows)
+        if n + m > capacity:
+            # Rows committed after the count; grow rather than drop them.
+            capacity = max(n + m, capacity * 2)
+            vectors = np.resize(vectors, (capacity, dim))
+        block = np.frombuffer(b"".join(row[0] for row in rows), dtype=WIRE_DTYPE)
+        # Byte order is fixed up by the same copy that fills the matrix.
+        vectors[n:n + m] = block.reshape(m, dim + header)[:, header:]
+        chunk_hashes.extend(row[1] for row in rows)
+        row_file_ids.extend(row[2] for row in rows)
+        n += m
+
+    hashes_array = np.empty(n, dtype=object)
+    hashes_array[:] = chunk_hashes
+    files_array = np.empty(n, dtype=object)
+    files_array[:] = row_file_ids
+    if n < capacity:
+        # Rows deleted after the count; don't keep the unused tail alive.
+        vectors = vectors[:n].copy()
+    return EmbeddingMatrix(vectors=vectors, chunk_hashes=hashes_array, file_ids=files_array)
+
+
+def model_key(model: Optional[str]) -> str:
+    """``embedding_vector.model`` value for ``model`` (``None`` is stored as '')."""
+    return model or ""
+
+
+async def find_vector_ids(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    model: Optional[str],
+    chunk_hashes: Sequence[str],
+) -> Dict[str, Any]:
+    """Map each of ``chunk_hashes`` already stored for ``model`` to its ``embedding_vector`` id."""
+    conn = await bind.connection() if isinstance(bind, AsyncSession) else bind
+    v = tables.embedding_vector
+    hashes = list(dict.fromkeys(chunk_hashes))
+
+    found = {}
+    for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        stmt = select(v.c.chunk_hash, v.c.id).where(
+            v.c.tenant_id == tenant_id,
+            v.c.model == model_key(model),
+            v.c.chunk_hash.in_(hashes[start:start + LOOKUP_BATCH_SIZE]),
+        )
+        found.update((await conn.execute(stmt)).all())
+    return found
+
+
+async def missing_chunk_hashes(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    model: Optional[str],
+    chunk_hashes: Sequence[str],
+) -> List[str]:
+    """Return the distinct ``chunk_hashes`` with no stored vector for ``model``, in input order."""
+    found = await find_vector_ids(bind, tenant_id, model, chunk_hashes)
+    return [h for h in dict.fromkeys(chunk_hashes) if h not in found]
+
+
+async def link_embeddings(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    workspace_id: str,
+    file_id: Any,
+    model: Optional[str],
+    chunk_hashes: Sequence[str],
+) -> int:
+    """
+    Point ``file_id``'s embedding rows for ``chunk_hashes`` at stored vectors.
+
+    Hashes without a stored vector are ignored; write those with
+    ``bulk.copy_embeddings``. Returns the number of rows inserted or changed.
+    """
+    conn = await bind.connection() if isinstance(bind, AsyncSession) else bind
+    e, v = tables.embedding, tables.embedding_vector
+    hashes = list(dict.fromkeys(chunk_hashes))
+
+    linked = 0
+    for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        source = select(
+            func.gen_random_uuid(), v.c.tenant_id, literal(file_id, e.c.file_id.type), v.c.chunk_hash,
+            literal(workspace_id, e.c.workspace_id.type), v.c.id, literal(model, e.c.model.type),
+        ).where(
+            v.c.tenant_id == tenant_id,
+            v.c.model == model_key(model),
+            v.c.chunk_hash.in_(hashes[start:start + LOOKUP_BATCH_SIZE]),
+        )
+        stmt = insert(e).from_select(
+            ["id", "tenant_id", "file_id", "chunk_hash", "workspace_id", "vector_id", "model"], source,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["tenant_id", "file_id", "chunk_hash"],
+            set_={"vector_id": stmt.excluded.vector_id, "model": stmt.excluded.model},
+            where=tuple_(e.c.vector_id, e.c.model).is_distinct_from(
+                tuple_(stmt.excluded.vector_id, stmt.excluded.model)
+            ),
+        )
+        linked += (await conn.execute(stmt)).rowcount
+    return linked
+
+
+async def prune_vectors(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    limit: int = LOOKUP_BATCH_SIZE,
+) -> int:
+    """
+    Delete up to ``limit`` of the tenant's vectors no embedding row uses.
+
+    A vector linked concurrently with its deletion makes the linking
+    transaction fail on the foreign key, so run this between ingestion runs
+    or retry the ingestion batch. Returns the number of vectors deleted.
+    """
+    conn = await bind.connection() if isinstance(bind, AsyncSession) else bind
+    e, v = tables.embedding, tables.embedding_vector
+    orphans = select(v.c.id).where(
+        v.c.tenant_id == tenant_id,
+        ~exists().where(e.c.tenant_id == tenant_id, e.c.vector_id == v.c.id),
+    ).limit(limit).with_for_update(skip_locked=True)
+    result = await conn.execute(v.delete().where(v.c.id.in_(orphans)))
+    return result.rowcount
@@ -0,0 +1,159 @@
+"""
+Work queue over ``index_sync``, the outbox feeding the search indexer.
+
+A row is pending while ``ack_at`` is NULL and may be claimed once
+``available_at`` has passed. Any number of indexer workers can drain the
+queue in parallel:
+
+* ``claim_batch`` locks the next claimable rows with ``FOR UPDATE SKIP
+  LOCKED`` (workers never wait for, or get, each other's rows), increments
+  ``attempt_count`` and moves ``available_at`` past the lease. A worker that
+  dies simply lets the lease run out and the rows are claimed again.
+* ``ack_batch`` marks a whole batch as indexed in one statement.
+* ``fail_batch`` records the errors and schedules the next attempt with
+  exponential backoff on ``attempt_count``. After ``max_attempts`` a row is
+  parked (``available_at = 'infinity'``) with its ``last_error`` until
+  ``requeue_parked`` releases it.
+
+The ``attempt_count`` a claim returns acts as a fencing token: ack and fail
+only apply to rows still on that attempt, so a worker whose lease expired
+cannot settle rows another worker has claimed since.
+
+Commit right after each call; the claim's row locks are only held until
+then, the lease is what keeps the rows away from other workers.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import ARRAY, Integer, TIMESTAMP, Text, case, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from neutrino_database import queries
+from neutrino_database.models import tables
+
+DEFAULT_LEASE = timedelta(minutes=5)
+DEFAULT_BACKOFF_BASE = timedelta(seconds=10)
+DEFAULT_BACKOFF_MAX = timedelta(hours=1)
+DEFAULT_MAX_ATTEMPTS = 10
+
+_INFINITY = cast(literal("infinity"), TIMESTAMP(timezone=True))
+
+
+@dataclass(frozen=True)
+class SyncTask:
+    """One claimed ``index_sync`` row; pass it back to ``ack_batch`` or ``fail_batch``."""
+    doc_id: str
+    tenant_id: str
+    file_id: str
+    chunk_id: str
+    workspace_id: str
+    chunk_hash: str
+    attempt_count: int
+    last_error: Optional[str]
+    # End of the lease; settle the task before then
+    lease_until: datetime
+
+
+async def _connection(bind: Union[AsyncSession, AsyncConnection]) -> AsyncConnection:
+    return await bind.connection() if isinstance(bind, AsyncSession) else bind
+
+
+def _claimed(tasks: Iterable[SyncTask], *extra: Tuple[list, type]):
+    """Subquery of ``(doc_id, tenant_id, attempt_count, ...)`` rows to join ``index_sync`` against."""
+    tasks = list(tasks)
+    columns = [
+        func.unnest(cast([str(t.doc_id) for t in tasks], ARRAY(UUID(as_uuid=False)))).label("doc_id"),
+        func.unnest(cast([str(t.tenant_id) for t in tasks], ARRAY(UUID(as_uuid=False)))).label("tenant_id"),
+        func.unnest(cast([t.attempt_count for t in tasks], ARRAY(Integer))).label("attempt_count"),
+    ]
+    for name, values, type_ in extra:
+        columns.append(func.unnest(cast(values, ARRAY(type_))).label(name))
+    return select(*columns).subquery("claimed")
+
+
+async def claim_batch(
+    bind: Union[AsyncSession, AsyncConnection],
+    n: int,
+    lease: timedelta = DEFAULT_LEASE,
+    tenant_id: Optional[str] = None,
+) -> List[SyncTask]:
+    """
+    Claim up to ``n`` pending rows, longest-waiting first.
+
+    ``tenant_id`` restricts the claim to one tenant's partition; by default
+    all tenants are served from the ``ix_index_sync_pending`` partial index.
+    """
+    if n < 1:
+        raise ValueError("n must be positive")
+    conn = await _connection(bind)
+    return [SyncTask(*row) for row in await conn.execute(*queries.claim_index_sync(n, lease, tenant_id))]
+
+
+async def ack_batch(bind: Union[AsyncSession, AsyncConnection], tasks: Iterable[SyncTask]) -> int:
+    """Mark the tasks as indexed; returns how many were still held by this claim."""
+    tasks = list(tasks)
+    if not tasks:
+        return 0
+    conn = await _connection(bind)
+    s = tables.index_sync
+    claimed = _claimed(tasks)
+    stmt = update(s).where(
+        s.c.doc_id == claimed.c.doc_id,
+        s.c.tenant_id == claimed.c.tenant_id,
+        s.c.attempt_count == claimed.c.attempt_count,
+        s.c.ack_at.is_(None),
+    ).values(ack_at=func.now(), last_error=None)
+    return (await conn.execute(stmt)).rowcount
+
+
+async def fail_batch(
+    bind: Union[AsyncSession, AsyncConnection],
+    failures: Iterable[Tuple[SyncTask, str]],
+    backoff_base: timedelta = DEFAULT_BACKOFF_BASE,
+    backoff_max: timedelta = DEFAULT_BACKOFF_MAX,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> int:
+    """
+    Record ``(task, error)`` failures and schedule each task's next attempt.
+
+    The delay is ``backoff_base * 2 ** (attempt_count - 1)``, capped at
+    ``backoff_max`` and spread by +/-25% so tasks failing together do not
+    retry together. Tasks on their ``max_attempts``-th attempt are parked.
+    Returns how many tasks were still held by this claim.
+    """
+    failures = list(failures)
+    if not failures:
+        return 0
+    conn = await _connection(bind)
+    s = tables.index_sync
+    claimed = _claimed([task for task, _ in failures], ("error", [error for _, error in failures], Text))
+
+    delay = func.least(
+        backoff_base.total_seconds() * func.power(2, s.c.attempt_count - 1), backoff_max.total_seconds(),
+    ) * (0.75 + func.random() / 2)
+    stmt = update(s).where(
+        s.c.doc_id == claimed.c.doc_id,
+        s.c.tenant_id == claimed.c.tenant_id,
+        s.c.attempt_count == claimed.c.attempt_count,
+        s.c.ack_at.is_(None),
+    ).values(
+        last_error=claimed.c.error,
+        available_at=case(
+            (s.c.attempt_count >= max_attempts, _INFINITY),
+            else_=func.now() + delay * literal(timedelta(seconds=1)),
+        ),
+    )
+    return (await conn.execute(stmt)).rowcount
+
+
+async def requeue_parked(bind: Union[AsyncSession, AsyncConnection], tenant_id: Optional[str] = None) -> int:
+    """Make parked rows claimable again with a fresh attempt count; returns how many."""
+    conn = await _connection(bind)
+    s = tables.index_sync
+    stmt = update(s).where(s.c.ack_at.is_(None), s.c.available_at == _INFINITY)
+    if tenant_id is not None:
+        stmt = stmt.where(s.c.tenant_id == tenant_id)
+    stmt = stmt.values(available_at=func.now(), attempt_count=0)
+    return (await conn.execute(stmt)).rowcount
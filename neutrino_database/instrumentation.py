@@ -0,0 +1,362 @@
+"""
+Opt-in query instrumentation: latency histograms, slow-query log, N+1 detection.
+
+``instrument_engine`` hooks an engine's cursor events and records every
+statement in a ``MetricsRegistry`` under its normalized SQL (binds and
+literals replaced by ``?``, multi-row ``VALUES`` collapsed) and its primary
+table: a latency histogram, rows returned or affected, and errors.
+Statements slower than ``slow_query_seconds`` are logged on this module's
+logger with their bind parameters redacted to type names.
+
+``instrument_sessions`` hooks ORM execution and counts lazy loads per
+relationship within each session; once one relationship (say
+``User.workspace_memberships`` or ``Tenant.users``) was lazy-loaded
+``n_plus_one_threshold`` times in the same session, it is logged and counted
+in the registry. The fix is a ``selectinload`` on the query that loaded the
+parents.
+
+Nothing is hooked by default. ``DB_INSTRUMENT`` instruments every engine
+``db`` creates and every ``Session``; otherwise call the two functions
+yourself. Exporters read ``get_registry().queries()`` and
+``get_registry().n_plus_one()``, both snapshots safe to take from any thread.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import ORMExecuteState, Session, sessionmaker
+
+from neutrino_database.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; one more bucket catches everything slower
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Distinct statements tracked before the rest are pooled under OTHER
+DEFAULT_MAX_STATEMENTS = 2000
+OTHER = "<other>"
+
+# Connection.info key holding start times of the statements in flight
+_STARTED_KEY = "neutrino_database.started"
+# Session.info key holding the lazy load Counter
+_LAZY_LOADS_KEY = "neutrino_database.lazy_loads"
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_BIND = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_CAST = re.compile(r"\?::[\w ]+(?:\[\])?")
+_TUPLE = re.compile(r"\((?:\?|, )+\)")
+_ROWS = re.compile(r"\(\?\)(?:, \(\?\))+")
+_SPACE = re.compile(r"\s+")
+_DML_TABLE = re.compile(
+    r'\b(?:INSERT\s+INTO|DELETE\s+FROM)\s+([\w."]+)|\bUPDATE\s+([\w."]+)(?:\s+AS\s+\w+)?\s+SET\b', re.IGNORECASE,
+)
+_FROM_TABLE = re.compile(r'\bFROM\s+([\w."]+)\b(?!\s*\()', re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    """``statement`` with literals and bind markers replaced by ``?`` and whitespace collapsed."""
+    sql = _SPACE.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _BIND.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _CAST.sub("?", sql)
+    sql = _TUPLE.sub("(?)", sql)
+    return _ROWS.sub("(?), ...", sql)
+
+
+@lru_cache(maxsize=4096)
+def primary_table(statement: str) -> str:
+    """The table a statement writes to, else the first it reads from; ``""`` for neither."""
+    match = _DML_TABLE.search(statement) or _FROM_TABLE.search(statement)
+    if match is None:
+        return ""
+    return (match.group(1) or match.group(2)).replace('"', "")
+
+
+def redact(parameters: Any) -> Any:
+    """Bind parameters with every value replaced by its type name; fit for logs."""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: the shape of one set is enough
+            return [redact(parameters[0]), f"<{len(parameters)} parameter sets>"]
+        return tuple(redact(value) for value in parameters)
+    return None if parameters is None else f"<{type(parameters).__name__}>"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (not thread-safe; ``MetricsRegistry`` locks)."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self) -> Tuple[Tuple[float, int], ...]:
+        """``(upper bound, observations <= bound)`` pairs, ending with ``inf``."""
+        total, buckets = 0, []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return tuple(buckets)
+
+
+@dataclass(frozen=True)
+class QueryMetrics:
+    statement: str
+    table: str
+    calls: int
+    errors: int
+    rows: int
+    total_seconds: float
+    # Cumulative (upper bound, count) pairs as in Histogram.cumulative
+    buckets: Tuple[Tuple[float, int], ...]
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (``inf`` past the last bound)."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        target = q * self.calls
+        for bound, count in self.buckets:
+            if count >= target:
+                return bound
+        return float("inf")
+
+
+class _Stats:
+    __slots__ = ("histogram", "errors", "rows")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.histogram = Histogram(bounds)
+        self.errors = 0
+        self.rows = 0
+
+
+class MetricsRegistry:
+    """In-process store of query metrics, keyed by ``(normalized SQL, primary table)``."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, max_statements: int = DEFAULT_MAX_STATEMENTS):
+        if list(buckets) != sorted(set(buckets)) or not buckets:
+            raise ValueError("buckets must be strictly increasing")
+        if max_statements < 1:
+            raise ValueError("max_statements must be positive")
+        self.buckets = tuple(buckets)
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], _Stats] = {}
+        self._n_plus_one: Counter = Counter()
+
+    def record(self, statement: str, table: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+        key = (statement, table)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    key = (OTHER, OTHER)
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _Stats(self.buckets)
+            stats.histogram.observe(seconds)
+            stats.rows += max(rows, 0)
+            if error:
+                stats.errors += 1
+
+    def record_n_plus_one(self, relationship: str) -> None:
+        with self._lock:
+            self._n_plus_one[relationship] += 1
+
+    def queries(self) -> List[QueryMetrics]:
+        """Snapshot of every tracked statement, slowest total first."""
+        with self._lock:
+            metrics = [
+                QueryMetrics(
+                    statement=statement,
+                    table=table,
+                    calls=stats.histogram.count,
+                    errors=stats.errors,
+                    rows=stats.rows,
+                    total_seconds=stats.histogram.sum,
+                    buckets=stats.histogram.cumulative(),
+                )
+                for (statement, table), stats in self._stats.items()
+            ]
+        return sorted(metrics, key=lambda m: m.total_seconds, reverse=True)
+
+    def n_plus_one(self) -> Dict[str, int]:
+        """Sessions that crossed the N+1 threshold, per relationship (``"User.workspace_memberships"``)."""
+        with self._lock:
+            return dict(self._n_plus_one)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._n_plus_one.clear()
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """Return the process-wide ``MetricsRegistry``."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+
+def _rows(cursor) -> int:
+    if cursor.rowcount >= 0:
+        return cursor.rowcount
+    # asyncpg's adapter fetches SELECT results whole and leaves rowcount at -1
+    return len(getattr(cursor, "_rows", ()))
+
+
+# Engine -> its listeners, so instrumenting twice is a no-op and can be undone
+_engines: "WeakKeyDictionary[Engine, List[Tuple[str, Any]]]" = WeakKeyDictionary()
+
+
+def instrument_engine(
+    engine: Union[Engine, AsyncEngine],
+    registry: Optional[MetricsRegistry] = None,
+    slow_query_seconds: Optional[float] = None,
+) -> None:
+    """
+    Record every statement ``engine`` executes in ``registry`` (default ``get_registry()``).
+
+    Statements taking at least ``slow_query_seconds`` (default
+    ``DB_SLOW_QUERY_SECONDS``; 0 or less disables the log) are logged with
+    redacted parameters.
+    """
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if sync_engine in _engines:
+        return
+    registry = registry or get_registry()
+    slow = settings.DB_SLOW_QUERY_SECONDS if slow_query_seconds is None else slow_query_seconds
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_STARTED_KEY, []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info[_STARTED_KEY].pop()
+        normalized, table = normalize_sql(statement), primary_table(statement)
+        rows = _rows(cursor)
+        registry.record(normalized, table, seconds, rows)
+        if 0 < slow <= seconds:
+            logger.warning(
+                "slow query (%.3fs, %d rows, table %s): %s; parameters: %s",
+                seconds, rows, table or "-", normalized, redact(parameters),
+            )
+
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        started = conn.info.get(_STARTED_KEY) if conn is not None else None
+        # Only statements that reached the cursor have a start time
+        if not started or exception_context.statement is None:
+            return
+        statement = exception_context.statement
+        seconds = time.perf_counter() - started.pop()
+        registry.record(normalize_sql(statement), primary_table(statement), seconds, error=True)
+
+    listeners = [
+        ("before_cursor_execute", before_cursor_execute),
+        ("after_cursor_execute", after_cursor_execute),
+        ("handle_error", handle_error),
+    ]
+    for name, fn in listeners:
+        event.listen(sync_engine, name, fn)
+    _engines[sync_engine] = listeners
+
+
+def uninstrument_engine(engine: Union[Engine, AsyncEngine]) -> None:
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    for name, fn in _engines.pop(sync_engine, ()):
+        event.remove(sync_engine, name, fn)
+
+
+SessionTarget = Union[Type[Session], Session, sessionmaker]
+# Session class, sessionmaker or Session -> its listener
+_sessions: Dict[Any, Any] = {}
+
+
+def instrument_sessions(
+    target: SessionTarget = Session,
+    registry: Optional[MetricsRegistry] = None,
+    n_plus_one_threshold: Optional[int] = None,
+) -> None:
+    """
+    Detect N+1 lazy loading in the sessions of ``target``, by default all of them.
+
+    For one ``AsyncSession`` pass its ``sync_session``. A relationship is
+    reported once per session, when its ``n_plus_one_threshold``-th lazy
+    load (default ``DB_N_PLUS_ONE_THRESHOLD``) runs.
+    """
+    if target in _sessions:
+        return
+    registry = registry or get_registry()
+    threshold = settings.DB_N_PLUS_ONE_THRESHOLD if n_plus_one_threshold is None else n_plus_one_threshold
+    if threshold < 2:
+        raise ValueError("n_plus_one_threshold must be at least 2")
+
+    def do_orm_execute(state: ORMExecuteState) -> None:
+        if not state.is_select or state.lazy_loaded_from is None:
+            return
+        relationship = str(state.loader_strategy_path[-1])
+        loads = state.session.info.setdefault(_LAZY_LOADS_KEY, Counter())
+        loads[relationship] += 1
+        if loads[relationship] == threshold:
+            registry.record_n_plus_one(relationship)
+            logger.warning(
+                "possible N+1: %s lazy-loaded %d times in one session; load it with selectinload()",
+                relationship, threshold,
+            )
+
+    event.listen(target, "do_orm_execute", do_orm_execute)
+    _sessions[target] = do_orm_execute
+
+
+def uninstrument_sessions(target: SessionTarget = Session) -> None:
+    fn = _sessions.pop(target, None)
+    if fn is not None:
+        event.remove(target, "do_orm_execute", fn)
+
+
+def _reset_after_fork() -> None:
+    # The child's exporter must not report the parent's numbers again
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    if _registry is not None:
+        # Another thread may have held the lock at fork time
+        _registry._lock = threading.Lock()
+        _registry.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,148 @@
+"""
+Dispatch of ``ingestion_jobs`` to workers.
+
+``claim_next_job`` atomically takes the oldest ready job: it locks it with
+``FOR UPDATE SKIP LOCKED`` through the ``ix_ingestion_jobs_ready`` partial
+index, so concurrent workers never block on or receive the same job, and
+moves it to ``IN_PROGRESS``. ``JobDispatcher`` wraps that in a worker loop
+that sleeps on ``LISTEN`` (see ``models.notify``) while the queue is empty
+and wakes as soon as a job becomes ready; polling every ``poll_interval``
+only covers notifications lost while the listening connection was down::
+
+    async with JobDispatcher() as dispatcher:
+        async for job in dispatcher:
+            await ingest(job)
+
+Jobs of a worker that died stay ``IN_PROGRESS``; ``release_stale_jobs``
+makes them ready again (which notifies the other workers).
+"""
+import asyncio
+from datetime import timedelta
+from typing import AsyncIterator, Optional, Union
+
+from sqlalchemy import Row, false, func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from neutrino_database import db
+from neutrino_database.listen import Listener
+from neutrino_database.models import tables
+from neutrino_database.models.notify import INGESTION_JOBS_CHANNEL, READY_FOR_INGESTION
+
+IN_PROGRESS = "IN_PROGRESS"
+DEFAULT_POLL_INTERVAL = 30.0
+DEFAULT_STALE_AFTER = timedelta(minutes=30)
+
+
+def _status(value: str):
+    # Rendered inline: a bound parameter would keep generic (prepared) plans
+    # from matching the partial index predicate
+    return literal(value, literal_execute=True)
+
+
+async def claim_next_job(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: Optional[str] = None,
+    status: str = IN_PROGRESS,
+) -> Optional[Row]:
+    """
+    Move the oldest ready job (optionally of one tenant) to ``status`` and return it.
+
+    Returns None when no job is ready. Commit right away: the row lock is
+    held until then, the new status is what keeps other workers away.
+    """
+    conn = await bind.connection() if isinstance(bind, AsyncSession) else bind
+    j = tables.ingestion_jobs
+    ready = select(j.c.id).where(
+        j.c.overall_status == _status(READY_FOR_INGESTION), j.c.is_deleted == false(),
+    )
+    if tenant_id is not None:
+        ready = ready.where(j.c.tenant_id == tenant_id)
+    ready = ready.order_by(j.c.created_at).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+    stmt = (
+        update(j)
+        .where(j.c.id == ready)
+        .values(overall_status=status, updated_at=func.now())
+        .returning(*j.c)
+    )
+    return (await conn.execute(stmt)).first()
+
+
+async def release_stale_jobs(
+    engine: Optional[AsyncEngine] = None,
+    older_than: timedelta = DEFAULT_STALE_AFTER,
+    status: str = IN_PROGRESS,
+) -> int:
+    """
+    Make jobs stuck in ``status`` without an update for ``older_than`` ready again.
+
+    Workers should touch ``updated_at`` while processing long jobs so they
+    are not taken for dead. Returns the number of released jobs.
+    """
+    j = tables.ingestion_jobs
+    stmt = update(j).where(
+        j.c.overall_status == status,
+        j.c.is_deleted == false(),
+        j.c.updated_at < func.now() - older_than,
+    ).values(overall_status=READY_FOR_INGESTION, updated_at=func.now())
+    async with (engine or db.get_engine()).begin() as conn:
+        return (await conn.execute(stmt)).rowcount
+
+
+class JobDispatcher:
+    """
+    Hands out ready jobs one at a time, waiting on ``NOTIFY`` while there are none.
+
+    Holds one pooled connection for ``LISTEN`` while entered. With
+    ``tenant_id`` only that tenant's jobs are claimed and only its
+    notifications wake the dispatcher.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        tenant_id: Optional[str] = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        status: str = IN_PROGRESS,
+    ):
+        self.engine = engine or db.get_engine()
+        self.tenant_id = str(tenant_id) if tenant_id is not None else None
+        self.poll_interval = poll_interval
+        self.status = status
+        self._wakeup = asyncio.Event()
+        self._listener = Listener(INGESTION_JOBS_CHANNEL, self._notified, self.engine)
+
+    async def __aenter__(self) -> "JobDispatcher":
+        await self._listener.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._listener.stop()
+
+    def __aiter__(self) -> AsyncIterator[Row]:
+        return self._jobs()
+
+    async def _jobs(self) -> AsyncIterator[Row]:
+        while True:
+            yield await self.next_job()
+
+    async def next_job(self) -> Row:
+        """Claim the next ready job, waiting as long as it takes for one."""
+        while True:
+            # Cleared before claiming so a job arriving in between still wakes us
+            self._wakeup.clear()
+            async with self.engine.begin() as conn:
+                job = await claim_next_job(conn, self.tenant_id, self.status)
+            if job is not None:
+                return job
+            if not await self._listener.active():
+                # Polling keeps the dispatcher going until this succeeds
+                await self._listener.start()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _notified(self, payload: str) -> None:
+        if self.tenant_id is None or payload == self.tenant_id:
+            self._wakeup.set()
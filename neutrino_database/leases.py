@@ -0,0 +1,233 @@
+"""
+Named leases on ``mutex_locks`` with fencing tokens.
+
+A lease is held by one ``owner_id`` until ``lease_until``. Acquiring,
+renewing and releasing are each a single statement on the row's primary key:
+
+* acquire: ``INSERT ... ON CONFLICT (name) DO UPDATE ... WHERE`` the lease is
+  free, expired or already ours, ``RETURNING fencing_token``;
+* renew: ``UPDATE`` guarded by ``owner_id`` and ``fencing_token``;
+* release: the same ``UPDATE`` clearing ``owner_id`` and ``lease_until``.
+
+Rows are never deleted, so ``fencing_token`` grows with every acquisition.
+Pass it along with every write to the protected resource and have the
+resource reject tokens older than the newest it has seen: a holder that
+stalled past its lease (GC pause, network partition) is then fenced off even
+though it still believes it holds the lease.
+
+``LeaseManager.hold`` keeps a lease renewed in the background for the
+duration of an ``async with`` block, which is what leader-elected schedulers
+want. ``advisory_lock`` is the cheaper alternative when all contenders share
+the database and the critical section fits in one transaction.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import func, or_, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from neutrino_database import db
+from neutrino_database.models import tables
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = timedelta(seconds=30)
+DEFAULT_RETRY_INTERVAL = 1.0
+
+# SQLSTATE lock_not_available, raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def default_owner_id() -> str:
+    """Unique per process and manager: ``host:pid:random``."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class Lease:
+    name: str
+    owner_id: str
+    fencing_token: int
+    lease_until: datetime
+    # Set by LeaseManager.hold once a renewal finds the lease taken over or expired
+    lost: bool = False
+
+
+class LeaseManager:
+    """
+    Acquires, renews and releases leases for one owner.
+
+    Leases last ``ttl``; ``hold`` renews them every ``renew_every`` (a third
+    of ``ttl`` by default, so two renewals may fail before the lease lapses).
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        owner_id: Optional[str] = None,
+        ttl: timedelta = DEFAULT_TTL,
+        renew_every: Optional[timedelta] = None,
+    ):
+        if ttl <= timedelta(0):
+            raise ValueError("ttl must be positive")
+        self.engine = engine or db.get_engine()
+        self.owner_id = owner_id or default_owner_id()
+        self.ttl = ttl
+        self.renew_every = renew_every or ttl / 3
+
+    async def try_acquire(self, name: str) -> Optional[Lease]:
+        """Take the lease if it is free, expired or already ours; None if someone else holds it."""
+        m = tables.lock_lease
+        stmt = insert(m).values(
+            name=name, owner_id=self.owner_id, lease_until=func.now() + self.ttl, fencing_token=1,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[m.c.name],
+            set_=dict(
+                owner_id=stmt.excluded.owner_id,
+                lease_until=stmt.excluded.lease_until,
+                fencing_token=m.c.fencing_token + 1,
+            ),
+            where=or_(
+                m.c.lease_until.is_(None),
+                m.c.lease_until < func.now(),
+                m.c.owner_id == stmt.excluded.owner_id,
+            ),
+        ).returning(m.c.fencing_token, m.c.lease_until)
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(stmt)).first()
+        if row is None:
+            return None
+        return Lease(name, self.owner_id, row.fencing_token, row.lease_until)
+
+    async def acquire(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+    ) -> Lease:
+        """Wait until the lease can be taken; raises ``TimeoutError`` after ``timeout`` seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            lease = await self.try_acquire(name)
+            if lease is not None:
+                return lease
+            if deadline is not None and loop.time() + retry_interval > deadline:
+                raise TimeoutError(f"Lease {name!r} not acquired within {timeout}s")
+            await asyncio.sleep(retry_interval)
+
+    async def renew(self, lease: Lease) -> bool:
+        """Extend the lease by ``ttl``; False (and ``lease.lost``) if it is no longer ours."""
+        m = tables.lock_lease
+        stmt = update(m).where(
+            m.c.name == lease.name,
+            m.c.owner_id == lease.owner_id,
+            m.c.fencing_token == lease.fencing_token,
+        ).values(lease_until=func.now() + self.ttl).returning(m.c.lease_until)
+        async with self.engine.begin() as conn:
+            lease_until = (await conn.execute(stmt)).scalar()
+        if lease_until is None:
+            lease.lost = True
+            return False
+        lease.lease_until = lease_until
+        return True
+
+    async def release(self, lease: Lease) -> bool:
+        """Give the lease up early; False if it was no longer ours anyway."""
+        m = tables.lock_lease
+        stmt = update(m).where(
+            m.c.name == lease.name,
+            m.c.owner_id == lease.owner_id,
+            m.c.fencing_token == lease.fencing_token,
+        ).values(owner_id=None, lease_until=None)
+        async with self.engine.begin() as conn:
+            released = (await conn.execute(stmt)).rowcount > 0
+        lease.lost = True
+        return released
+
+    @asynccontextmanager
+    async def hold(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+    ) -> AsyncIterator[Lease]:
+        """
+        Acquire the lease, keep renewing it while the block runs, release it on exit.
+
+        The block is not interrupted when the lease is lost; check
+        ``lease.lost`` between units of work and rely on the fencing token
+        for the writes themselves.
+        """
+        lease = await self.acquire(name, timeout, retry_interval)
+        renewer = asyncio.create_task(self._keep_renewed(lease))
+        try:
+            yield lease
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+            if not lease.lost:
+                await self.release(lease)
+
+    async def _keep_renewed(self, lease: Lease) -> None:
+        interval = self.renew_every.total_seconds()
+        try:
+            while not lease.lost:
+                await asyncio.sleep(interval)
+                try:
+                    await self.renew(lease)
+                except Exception:
+                    # Database errors, pool timeouts or anything else: keep
+                    # trying until the lease would have lapsed anyway
+                    logger.warning("Renewing lease %r failed", lease.name, exc_info=True)
+                    if lease.lease_until <= datetime.now(lease.lease_until.tzinfo):
+                        lease.lost = True
+        except asyncio.CancelledError:
+            # hold() is done with the lease
+            raise
+        except BaseException:
+            # Nothing renews the lease any more
+            lease.lost = True
+            raise
+
+
+@asynccontextmanager
+async def advisory_lock(
+    name: str,
+    engine: Optional[AsyncEngine] = None,
+    timeout: Optional[timedelta] = None,
+) -> AsyncIterator[AsyncConnection]:
+    """
+    Hold a transaction-level ``pg_advisory_xact_lock`` on ``name`` for the block.
+
+    Yields the connection whose transaction holds the lock; run the critical
+    section's statements on it. The lock needs no table row and is released
+    with the transaction (also when the process dies), which also keeps it
+    correct behind a transaction-pooling PgBouncer. There is no fencing
+    token. Raises ``TimeoutError`` if the lock is not granted within
+    ``timeout`` (default: wait indefinitely).
+    """
+    async with (engine or db.get_engine()).begin() as conn:
+        if timeout is not None:
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{int(timeout.total_seconds() * 1000)}ms'"))
+        try:
+            await conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtextextended(:name, 0))"), {"name": name},
+            )
+        except DBAPIError as exc:
+            if getattr(exc.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE:
+                raise TimeoutError(f"Advisory lock {name!r} not acquired within {timeout}") from exc
+            raise
+        if timeout is not None:
+            await conn.execute(text("SET LOCAL lock_timeout = DEFAULT"))
+        yield conn
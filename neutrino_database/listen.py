@@ -0,0 +1,62 @@
+"""
+``LISTEN`` on a dedicated pooled connection.
+
+Notifications only reach a connection while it is listening, so anything
+built on them (``jobs.JobDispatcher``, ``signing_keys.SigningKeyCache``)
+keeps one connection checked out for ``Listener`` and has to assume it
+missed notifications whenever that connection was lost: ``active`` turns
+False, and callers re-``start`` it and re-read whatever they cache.
+"""
+from typing import Any, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from neutrino_database import db
+
+NotificationCallback = Callable[[str], None]
+
+
+class Listener:
+    """Calls ``callback(payload)`` for every notification on ``channel`` while started."""
+
+    def __init__(self, channel: str, callback: NotificationCallback, engine: Optional[AsyncEngine] = None):
+        self.channel = channel
+        self.callback = callback
+        self.engine = engine or db.get_engine()
+        self._conn: Optional[AsyncConnection] = None
+
+    async def active(self) -> bool:
+        if self._conn is None:
+            return False
+        raw = await self._conn.get_raw_connection()
+        return not raw.driver_connection.is_closed()
+
+    async def start(self) -> bool:
+        """(Re)start listening; False if the database could not be reached."""
+        await self.stop()
+        conn = None
+        try:
+            conn = await self.engine.connect()
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.add_listener(self.channel, self._notified)
+        except Exception:
+            if conn is not None:
+                await conn.invalidate()
+                await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def stop(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        raw = await conn.get_raw_connection()
+        if raw.driver_connection.is_closed():
+            await conn.invalidate()
+        else:
+            await raw.driver_connection.remove_listener(self.channel, self._notified)
+        await conn.close()
+
+    def _notified(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        self.callback(payload)
@@ -0,0 +1,326 @@
+"""
+In-memory workspace membership index for authorization checks.
+
+Almost every API call asks "is this user a member (an admin) of this
+workspace?". ``MembershipIndex`` answers from memory with one
+``TenantMembership`` per tenant: every workspace of the tenant gets a bit
+position and every user two Python ints used as bitsets (member, admin), so
+``is_member`` / ``is_admin`` are a dict lookup and a shift, and
+``workspaces_for`` walks the set bits.
+
+Each membership change is appended to ``workspace_member_change`` by
+triggers (see ``models.notify``) under a per-tenant ``version``. An index
+loads a tenant once from a consistent snapshot and afterwards only applies
+the changes past its version:
+
+* while started, right after the ``NOTIFY`` sent by each change;
+* on access once ``ttl`` seconds passed since the last check, as a safety
+  net (and as the only mechanism without ``start``);
+* for every loaded tenant after the listening connection was lost.
+
+Only a gap in the log (changes pruned by ``prune_membership_changes`` before
+the index saw them) forces a full reload. Soft-deleted workspaces have no
+members in the index.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from neutrino_database import db
+from neutrino_database.listen import Listener
+from neutrino_database.models import tables
+from neutrino_database.models.notify import MEMBERSHIP_CHANNEL
+
+DEFAULT_MAXSIZE = 1000
+DEFAULT_TTL = 60.0
+DEFAULT_CHECK_INTERVAL = 30.0
+DEFAULT_CHANGE_RETENTION = timedelta(days=7)
+
+
+class TenantMembership:
+    """Workspace memberships of one tenant as of ``version``."""
+
+    def __init__(self, tenant_id: str, version: int = 0):
+        self.tenant_id = tenant_id
+        self.version = version
+        # Set by MembershipIndex whenever the version was checked
+        self.checked_at = 0.0
+        self._slots: Dict[str, int] = {}
+        self._workspaces: List[Optional[str]] = []
+        self._free: List[int] = []
+        # user id -> bitset over slots
+        self._members: Dict[str, int] = {}
+        self._admins: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        """Number of users with at least one membership."""
+        return len(self._members)
+
+    def is_member(self, user_id: str, workspace_id: str) -> bool:
+        slot = self._slots.get(workspace_id)
+        return slot is not None and self._members.get(user_id, 0) >> slot & 1 == 1
+
+    def is_admin(self, user_id: str, workspace_id: str) -> bool:
+        slot = self._slots.get(workspace_id)
+        return slot is not None and self._admins.get(user_id, 0) >> slot & 1 == 1
+
+    def workspaces_for(self, user_id: str, admin: bool = False) -> List[str]:
+        """Ids of the workspaces the user belongs to (administers, with ``admin``)."""
+        bits = (self._admins if admin else self._members).get(user_id, 0)
+        workspaces = []
+        while bits:
+            lowest = bits & -bits
+            workspaces.append(self._workspaces[lowest.bit_length() - 1])
+            bits ^= lowest
+        return workspaces
+
+    def set(self, workspace_id: str, user_id: str, is_admin: Optional[bool]) -> None:
+        """Add or update a membership; ``is_admin`` None removes it."""
+        if is_admin is None:
+            slot = self._slots.get(workspace_id)
+            if slot is not None:
+                mask = ~(1 << slot)
+                self._clear(self._members, user_id, mask)
+                self._clear(self._admins, user_id, mask)
+            return
+        bit = 1 << self._slot(workspace_id)
+        self._members[user_id] = self._members.get(user_id, 0) | bit
+        if is_admin:
+            self._admins[user_id] = self._admins.get(user_id, 0) | bit
+        else:
+            self._clear(self._admins, user_id, ~bit)
+
+    def remove_workspace(self, workspace_id: str) -> None:
+        slot = self._slots.pop(workspace_id, None)
+        if slot is None:
+            return
+        mask = ~(1 << slot)
+        for bitsets in (self._members, self._admins):
+            for user_id in [u for u, bits in bitsets.items() if bits >> slot & 1]:
+                self._clear(bitsets, user_id, mask)
+        self._workspaces[slot] = None
+        self._free.append(slot)
+
+    def apply(self, version: int, workspace_id: str, user_id: Optional[str], is_admin: Optional[bool]) -> None:
+        """Apply one ``workspace_member_change`` row."""
+        if user_id is None:
+            self.remove_workspace(workspace_id)
+        else:
+            self.set(workspace_id, user_id, is_admin)
+        self.version = version
+
+    def _slot(self, workspace_id: str) -> int:
+        slot = self._slots.get(workspace_id)
+        if slot is None:
+            slot = self._free.pop() if self._free else len(self._workspaces)
+            if slot == len(self._workspaces):
+                self._workspaces.append(workspace_id)
+            else:
+                self._workspaces[slot] = workspace_id
+            self._slots[workspace_id] = slot
+        return slot
+
+    @staticmethod
+    def _clear(bitsets: Dict[str, int], user_id: str, mask: int) -> None:
+        bits = bitsets.get(user_id, 0) & mask
+        if bits:
+            bitsets[user_id] = bits
+        else:
+            bitsets.pop(user_id, None)
+
+
+async def load_membership(conn: AsyncConnection, tenant_id: str) -> TenantMembership:
+    """
+    Snapshot of the tenant's memberships.
+
+    ``conn`` must be in a ``REPEATABLE READ`` (or stricter) transaction so the
+    version and the rows are read from the same snapshot.
+    """
+    v, w, m = tables.workspace_membership_version, tables.workspace, tables.workspace_member
+    version = await conn.scalar(select(v.c.version).where(v.c.tenant_id == tenant_id))
+    rows = await conn.execute(
+        select(m.c.workspace_id, m.c.user_id, m.c.is_workspace_admin)
+        .join(w, w.c.id == m.c.workspace_id)
+        .where(w.c.tenant_id == tenant_id, w.c.deleted_at.is_(None))
+    )
+    membership = TenantMembership(tenant_id, version or 0)
+    for row in rows:
+        membership.set(row.workspace_id, row.user_id, row.is_workspace_admin)
+    return membership
+
+
+async def prune_membership_changes(
+    engine: Optional[AsyncEngine] = None,
+    older_than: timedelta = DEFAULT_CHANGE_RETENTION,
+) -> int:
+    """
+    Delete change log rows older than ``older_than``; return how many.
+
+    Indexes lagging further behind than that reload their tenant instead of
+    catching up.
+    """
+    c = tables.workspace_member_change
+    stmt = c.delete().where(c.c.changed_at < func.now() - older_than)
+    async with (engine or db.get_engine()).begin() as conn:
+        return (await conn.execute(stmt)).rowcount
+
+
+class MembershipIndex:
+    """
+    ``TenantMembership`` per tenant, kept current from the change log.
+
+    Holds at most ``maxsize`` tenants, evicting the least recently used.
+    Use as ``async with MembershipIndex() as index`` (or ``start``/``stop``)
+    for the lifetime of the service to apply changes as they are notified.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        maxsize: int = DEFAULT_MAXSIZE,
+        ttl: float = DEFAULT_TTL,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.engine = engine or db.get_engine()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.clock = clock
+        self._tenants: "OrderedDict[str, TenantMembership]" = OrderedDict()
+        # One lock per tenant serializes its load and catch-ups
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._dirty: Set[str] = set()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._listener = Listener(MEMBERSHIP_CHANNEL, self._notified, self.engine)
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "MembershipIndex":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        await self._listener.start()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._watcher, *self._pending.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._watcher = None
+        self._pending.clear()
+        await self._listener.stop()
+
+    async def get(self, tenant_id: str) -> TenantMembership:
+        """The tenant's memberships, loading them or catching up first when needed."""
+        tenant_id = str(tenant_id)
+        membership = self._tenants.get(tenant_id)
+        if membership is not None and self.clock() - membership.checked_at < self.ttl:
+            self._tenants.move_to_end(tenant_id)
+            return membership
+        return await self.refresh(tenant_id)
+
+    async def is_member(self, tenant_id: str, user_id: str, workspace_id: str) -> bool:
+        return (await self.get(tenant_id)).is_member(str(user_id), str(workspace_id))
+
+    async def is_admin(self, tenant_id: str, user_id: str, workspace_id: str) -> bool:
+        return (await self.get(tenant_id)).is_admin(str(user_id), str(workspace_id))
+
+    async def workspaces_for(self, tenant_id: str, user_id: str, admin: bool = False) -> List[str]:
+        return (await self.get(tenant_id)).workspaces_for(str(user_id), admin)
+
+    async def refresh(self, tenant_id: str) -> TenantMembership:
+        """Load the tenant, or apply the changes logged since its version."""
+        tenant_id = str(tenant_id)
+        lock = self._locks.setdefault(tenant_id, asyncio.Lock())
+        started = self.clock()
+        async with lock:
+            membership = self._tenants.get(tenant_id)
+            if membership is not None and membership.checked_at >= started:
+                # Checked by a concurrent caller while we waited
+                self._tenants.move_to_end(tenant_id)
+                return membership
+            checked_at = self.clock()
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+                async with conn.begin():
+                    if membership is None or not await self._catch_up(conn, membership):
+                        membership = await load_membership(conn, tenant_id)
+            membership.checked_at = checked_at
+            self._store(membership)
+            return membership
+
+    def evict(self, tenant_ids: Optional[Iterable[str]] = None) -> None:
+        """Forget the given tenants (all when None); they are reloaded on next access."""
+        for tenant_id in list(self._tenants) if tenant_ids is None else tenant_ids:
+            self._tenants.pop(str(tenant_id), None)
+            lock = self._locks.get(str(tenant_id))
+            if lock is not None and not lock.locked():
+                del self._locks[str(tenant_id)]
+
+    async def _catch_up(self, conn: AsyncConnection, membership: TenantMembership) -> bool:
+        """Apply the changes past ``membership.version``; False if some are missing from the log."""
+        v, c = tables.workspace_membership_version, tables.workspace_member_change
+        latest = await conn.scalar(select(v.c.version).where(v.c.tenant_id == membership.tenant_id)) or 0
+        if latest == membership.version:
+            return True
+        rows = (await conn.execute(
+            select(c.c.version, c.c.workspace_id, c.c.user_id, c.c.is_workspace_admin)
+            .where(c.c.tenant_id == membership.tenant_id, c.c.version > membership.version)
+            .order_by(c.c.version)
+        )).all()
+        if latest < membership.version or not rows or rows[0].version != membership.version + 1:
+            return False
+        for row in rows:
+            membership.apply(row.version, row.workspace_id, row.user_id, row.is_workspace_admin)
+        return True
+
+    def _store(self, membership: TenantMembership) -> None:
+        self._tenants[membership.tenant_id] = membership
+        self._tenants.move_to_end(membership.tenant_id)
+        while len(self._tenants) > self.maxsize:
+            self.evict([next(iter(self._tenants))])
+
+    def _notified(self, payload: str) -> None:
+        if payload not in self._tenants:
+            return
+        self._dirty.add(payload)
+        if payload not in self._pending:
+            task = asyncio.get_running_loop().create_task(self._apply_notified(payload))
+            self._pending[payload] = task
+
+    async def _apply_notified(self, tenant_id: str) -> None:
+        # Notifications arriving while catching up are folded into one more round
+        try:
+            while tenant_id in self._dirty:
+                self._dirty.discard(tenant_id)
+                if tenant_id in self._tenants:
+                    await self.refresh(tenant_id)
+        except (DBAPIError, OSError):
+            # The next access past ttl, or the watcher, catches up instead
+            pass
+        finally:
+            self._pending.pop(tenant_id, None)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                if not await self._listener.active() and await self._listener.start():
+                    # Notifications may have been missed while disconnected
+                    for tenant_id in list(self._tenants):
+                        await self.refresh(tenant_id)
+            except (DBAPIError, OSError):
+                continue
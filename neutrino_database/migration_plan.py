@@ -0,0 +1,777 @@
+"""
+Lock and rewrite planner for pending Alembic revisions.
+
+    python -m neutrino_database.migration_plan [-c alembic.ini] [--threshold-mb 100] [--json plan.json]
+
+Run before ``alembic upgrade``: it renders every revision between the
+database's current version and ``--to`` (default: the heads) the way
+``alembic upgrade --sql`` does, without touching the schema, and classifies
+each operation by the lock it takes and the work done under it:
+
+    catalog  only the catalog changes, the lock is held for an instant
+    scan     every row is read (validating a constraint, ``SET NOT NULL``)
+    rewrite  the table and its indexes are rewritten (most type changes,
+             volatile defaults, ``SET TABLESPACE``)
+    index    an index is built
+    data     rows are inserted, updated or deleted
+    unknown  a statement the planner does not recognise
+
+Live row counts and sizes then turn the work into a duration estimate
+(``--scan-mb-per-second`` and friends; defaults are rough, measure on the
+target hardware). A lock that blocks writes is held until its transaction
+commits, so it is charged with all the work after it in the same
+transaction: ``ADD CONSTRAINT ... NOT VALID`` followed by ``VALIDATE`` in one
+revision still blocks writes for the whole scan. The check fails (exit status
+1) when writes on a table of at least ``DB_MIGRATION_BLOCKING_THRESHOLD_MB``
+would be blocked while anything but a catalog update runs, and when a
+revision cannot be rendered offline (code that needs rows from the database),
+since what follows is then unknown; pass ``--allow-incomplete`` to accept the
+latter. neutrino_database.migrations has the helpers that avoid blocking
+writes. A revision that copies or updates rows in batches online should
+render them offline as one statement in the same place, inside its
+``autocommit_block`` (``migrations.backfill`` does), so the plan sees the
+transactions the online run commits.
+
+The classification knows the ``op`` directives and the SQL statements
+migrations run through ``op.execute``; it does not look at the columns'
+current types, so a binary-coercible type change (``varchar`` to ``text``)
+is reported as a rewrite.
+"""
+import argparse
+import io
+import json
+import re
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from alembic.config import Config
+from alembic.operations import Operations, ops
+from alembic.runtime.environment import EnvironmentContext
+from alembic.runtime.migration import MigrationContext
+from alembic.script import Script, ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection, Engine
+
+from neutrino_database import db
+from neutrino_database.config import settings
+
+# PostgreSQL table lock modes, weakest first
+LOCK_MODES = (
+    "ACCESS SHARE", "ROW SHARE", "ROW EXCLUSIVE", "SHARE UPDATE EXCLUSIVE",
+    "SHARE", "SHARE ROW EXCLUSIVE", "EXCLUSIVE", "ACCESS EXCLUSIVE",
+)
+BLOCKS_WRITES = frozenset(LOCK_MODES[4:])
+
+CATALOG, SCAN, REWRITE, INDEX, DATA, UNKNOWN = "catalog", "scan", "rewrite", "index", "data", "unknown"
+# Marks a new table while recording; not kept as a step
+CREATE = "create"
+
+# Heap (with TOAST) and index bytes and estimated rows over all partitions of a table
+TABLE_SIZE = text(
+    "WITH rels AS (SELECT relid FROM pg_partition_tree(CAST(:table AS regclass)) "
+    "UNION SELECT CAST(:table AS regclass)) "
+    "SELECT COALESCE(sum(pg_table_size(relid)), 0), COALESCE(sum(pg_indexes_size(relid)), 0), "
+    "(SELECT COALESCE(sum(c.reltuples) FILTER (WHERE c.reltuples > 0), 0) FROM rels JOIN pg_class c ON c.oid = relid) "
+    "FROM rels"
+)
+INDEX_TABLE = text("SELECT indrelid::regclass::text FROM pg_index WHERE indexrelid = to_regclass(:name)")
+
+_IDENT = r'(?:"[^"]+"|[\w$]+)(?:\.(?:"[^"]+"|[\w$]+))?'
+# A default calling one of these is evaluated per row: the table is rewritten
+_VOLATILE = re.compile(
+    r"\b(gen_random_uuid|uuid_generate_v\w+|random|clock_timestamp|timeofday|nextval|txid_current)\s*\(", re.I,
+)
+# Statements that take no lock worth reporting on an existing table
+_IGNORED = re.compile(
+    r"^(SET|RESET|SHOW|SELECT|ANALYZE|VACUUM(?! FULL)|COMMENT|GRANT|REVOKE|NOTIFY|LISTEN|DO|SAVEPOINT|RELEASE|"
+    r"CREATE (OR REPLACE )?(FUNCTION|PROCEDURE|VIEW|TYPE|EXTENSION|SCHEMA|SEQUENCE|AGGREGATE|DOMAIN)|"
+    r"DROP (FUNCTION|PROCEDURE|VIEW|TYPE|EXTENSION|SCHEMA|SEQUENCE|AGGREGATE|DOMAIN)|"
+    r"ALTER (TYPE|SEQUENCE|FUNCTION|PROCEDURE|SCHEMA|EXTENSION|DOMAIN))\b", re.I,
+)
+
+
+@dataclass
+class Step:
+    """One operation of a revision, classified."""
+    description: str
+    # Table the work scales with, and the lock taken on it
+    table: Optional[str] = None
+    lock: Optional[str] = None
+    work: str = CATALOG
+    # Locks on other tables (a foreign key's referenced table)
+    other_locks: Dict[str, str] = field(default_factory=dict)
+    # Index named by the statement, for finding ``table`` in the live catalog
+    index: Optional[str] = None
+    # UPDATE/DELETE without WHERE: every row stays locked until commit
+    all_rows: bool = False
+    # Constraint added or validated, and the column a CHECK (column IS NOT
+    # NULL) covers or SET NOT NULL changes: a validated check spares the scan
+    constraint: Optional[str] = None
+    not_null: Optional[str] = None
+    rows: Optional[int] = None
+    note: Optional[str] = None
+    # Filled in by measure()
+    table_bytes: Optional[int] = None
+    seconds: Optional[float] = None
+
+    def blocked_tables(self) -> Iterator[Tuple[str, str]]:
+        """The tables this step blocks writes on, with the lock (or row locks) doing it."""
+        if self.table and self.lock in BLOCKS_WRITES:
+            yield self.table, self.lock
+        elif self.table and self.all_rows:
+            yield self.table, "ROW EXCLUSIVE (every row)"
+        for table, lock in self.other_locks.items():
+            if lock in BLOCKS_WRITES:
+                yield table, lock
+
+
+@dataclass
+class RevisionPlan:
+    revision: str
+    doc: str
+    # Steps by transaction, in order: a lock is held until the end of its transaction
+    transactions: List[List[Step]] = field(default_factory=list)
+    # Tables the revision creates: empty whatever the live database holds
+    created: List[str] = field(default_factory=list)
+    # Why rendering stopped early, if it did
+    incomplete: Optional[str] = None
+
+    @property
+    def steps(self) -> List[Step]:
+        return [step for transaction in self.transactions for step in transaction]
+
+    @property
+    def seconds(self) -> float:
+        return sum(step.seconds or 0.0 for step in self.steps)
+
+
+@dataclass
+class Violation:
+    revision: str
+    table: str
+    lock: str
+    table_bytes: int
+    # Estimated time writes are blocked; None when some of the work is unknown
+    seconds: Optional[float]
+    # The work run while the lock is held
+    work: List[str]
+
+
+@dataclass(frozen=True)
+class Rates:
+    """Throughput assumed for the duration estimates."""
+    scan_bytes_per_second: float = 200e6
+    rewrite_bytes_per_second: float = 50e6
+    index_bytes_per_second: float = 30e6
+    rows_per_second: float = 20_000
+
+
+def _name(identifier: str) -> str:
+    name = identifier.replace('"', "")
+    return name[len("public."):] if name.startswith("public.") else name
+
+
+def _statements(sql: str) -> List[str]:
+    """Split ``sql`` on semicolons outside quotes and dollar-quoted bodies, without comments."""
+    statements, current = [], []
+    tokens = re.finditer(
+        r"\$(\w*)\$.*?\$\1\$|'(?:[^']|'')*'|\"[^\"]*\"|--[^\n]*|/\*.*?\*/|;|[^$'\";/-]+|.", sql, re.S,
+    )
+    for token in tokens:
+        value = token.group(0)
+        if value.startswith("--") or value.startswith("/*"):
+            current.append(" ")
+        elif value == ";":
+            statements.append("".join(current))
+            current = []
+        else:
+            current.append(value)
+    statements.append("".join(current))
+    return [" ".join(s.split()) for s in statements if s.strip()]
+
+
+def _split_top_level(clause: str) -> List[str]:
+    """Split the subcommands of an ALTER TABLE on commas outside parentheses and quotes."""
+    parts, depth, current, quote = [], 0, [], None
+    for char in clause:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _column_definition(description: str, table: str, definition: str) -> Step:
+    """``ADD COLUMN`` from its SQL definition."""
+    step = Step(description, table, "ACCESS EXCLUSIVE")
+    default = re.search(r"\bDEFAULT\b(.*)", definition, re.I)
+    if re.search(r"\bGENERATED ALWAYS AS\b.*\bSTORED\b|\b(SMALL|BIG)?SERIAL\b|\bGENERATED\b.*\bAS IDENTITY\b", definition, re.I):
+        step.work, step.note = REWRITE, "generated, serial or identity column"
+    elif default and _VOLATILE.search(default.group(1)):
+        step.work, step.note = REWRITE, "volatile default"
+    elif re.search(r"\bNOT NULL\b", definition, re.I) and not default:
+        step.work, step.note = SCAN, "NOT NULL without a default fails if the table has rows"
+    elif re.search(r"\b(PRIMARY KEY|UNIQUE)\b", definition, re.I):
+        step.work = INDEX
+    references = re.search(rf"\bREFERENCES ({_IDENT})", definition, re.I)
+    if references:
+        step.other_locks[_name(references.group(1))] = "SHARE ROW EXCLUSIVE"
+        step.lock = "ACCESS EXCLUSIVE"
+        if step.work == CATALOG:
+            step.work = SCAN
+    return step
+
+
+def _alter_table_command(description: str, table: str, command: str) -> Step:
+    c = command.upper()
+    if re.match(r"ADD (CONSTRAINT \S+ )?FOREIGN KEY\b", c):
+        referent = re.search(rf"\bREFERENCES ({_IDENT})", command, re.I)
+        step = Step(description, table, "SHARE ROW EXCLUSIVE", CATALOG if "NOT VALID" in c else SCAN)
+        if referent:
+            step.other_locks[_name(referent.group(1))] = "SHARE ROW EXCLUSIVE"
+        return step
+    match = re.match(r"ADD (CONSTRAINT (\S+) )?CHECK \((.*)\)", command, re.I)
+    if match:
+        step = Step(description, table, "ACCESS EXCLUSIVE", CATALOG if "NOT VALID" in c else SCAN)
+        step.constraint = match.group(2) and _name(match.group(2))
+        not_null = re.fullmatch(r"\(?(\S+) IS NOT NULL\)?( NOT VALID)?", match.group(3), re.I)
+        step.not_null = not_null and _name(not_null.group(1))
+        return step
+    if re.match(r"ADD (CONSTRAINT \S+ )?(UNIQUE|PRIMARY KEY|EXCLUDE)\b", c):
+        return Step(description, table, "ACCESS EXCLUSIVE", CATALOG if "USING INDEX" in c else INDEX)
+    if c.startswith("VALIDATE CONSTRAINT"):
+        return Step(description, table, "SHARE UPDATE EXCLUSIVE", SCAN, constraint=_name(command.split()[2]))
+    if c.startswith("ADD "):
+        definition = re.sub(r"^ADD (COLUMN )?(IF NOT EXISTS )?", "", command, flags=re.I)
+        return _column_definition(description, table, definition)
+    if re.match(r"ALTER (COLUMN )?\S+ (SET DATA )?TYPE\b", c):
+        return Step(description, table, "ACCESS EXCLUSIVE", REWRITE, note="unless the types are binary-coercible")
+    match = re.match(r"ALTER (COLUMN )?(\S+) SET NOT NULL\b", command, re.I)
+    if match:
+        return Step(description, table, "ACCESS EXCLUSIVE", SCAN, not_null=_name(match.group(2)),
+                    note="no scan if a valid CHECK (column IS NOT NULL) exists")
+    if re.match(r"ALTER (COLUMN )?\S+ SET STATISTICS\b", c) or re.match(r"SET \(", c):
+        return Step(description, table, "SHARE UPDATE EXCLUSIVE")
+    if re.match(r"SET (TABLESPACE|LOGGED|UNLOGGED|ACCESS METHOD)\b", c):
+        return Step(description, table, "ACCESS EXCLUSIVE", REWRITE)
+    if c.startswith("ATTACH PARTITION"):
+        partition = _name(command.split()[2])
+        return Step(description, partition, "ACCESS EXCLUSIVE", SCAN, other_locks={table: "SHARE UPDATE EXCLUSIVE"},
+                    note="no scan if a valid constraint implies the partition bound")
+    if c.startswith("DETACH PARTITION"):
+        return Step(description, table, "SHARE UPDATE EXCLUSIVE" if c.endswith("CONCURRENTLY") else "ACCESS EXCLUSIVE")
+    if re.match(r"(ENABLE|DISABLE) TRIGGER\b", c):
+        return Step(description, table, "SHARE ROW EXCLUSIVE")
+    # DROP, RENAME, OWNER TO, DROP NOT NULL, SET DEFAULT, ...
+    return Step(description, table, "ACCESS EXCLUSIVE")
+
+
+def classify_sql(sql: str) -> List[Step]:
+    """Classify the statements of a raw SQL string (``op.execute``)."""
+    steps = []
+    for statement in _statements(sql):
+        description = statement if len(statement) <= 100 else statement[:97] + "..."
+        s = statement.upper()
+        if _IGNORED.match(statement) or re.match(r"^(BEGIN|START TRANSACTION|COMMIT|END|ROLLBACK)\b", s):
+            continue
+
+        match = re.match(
+            rf"CREATE (UNIQUE )?INDEX (CONCURRENTLY )?(IF NOT EXISTS )?({_IDENT} )?ON (ONLY )?({_IDENT})", statement, re.I,
+        )
+        if match:
+            table = _name(match.group(6))
+            if match.group(2):
+                steps.append(Step(description, table, "SHARE UPDATE EXCLUSIVE", INDEX))
+            elif match.group(5):
+                # Parent of a partitioned table: no build, partitions follow
+                steps.append(Step(description, table, "SHARE"))
+            else:
+                steps.append(Step(description, table, "SHARE", INDEX))
+            continue
+
+        match = re.match(rf"(DROP|ALTER) INDEX (CONCURRENTLY )?(IF (NOT )?EXISTS )?({_IDENT})(.*)", statement, re.I)
+        if match:
+            verb, concurrently, index, rest = match.group(1).upper(), match.group(2), _name(match.group(5)), match.group(6)
+            if verb == "DROP":
+                lock = "SHARE UPDATE EXCLUSIVE" if concurrently else "ACCESS EXCLUSIVE"
+                steps.append(Step(description, lock=lock, index=index))
+            elif re.search(r"\bSET TABLESPACE\b", rest, re.I):
+                steps.append(Step(description, lock="ACCESS EXCLUSIVE", work=REWRITE, index=index))
+            else:
+                # RENAME, ATTACH PARTITION, SET (...)
+                steps.append(Step(description, lock="SHARE UPDATE EXCLUSIVE", index=index))
+            continue
+
+        match = re.match(rf"ALTER TABLE (IF EXISTS )?(ONLY )?({_IDENT}) (.*)", statement, re.I)
+        if match:
+            table = _name(match.group(3))
+            for command in _split_top_level(match.group(4)):
+                steps.append(_alter_table_command(description, table, command))
+            continue
+
+        match = re.match(r"LOCK (TABLE )?(ONLY )?(.+?)( IN ([A-Z ]+) MODE)?( NOWAIT)?$", statement, re.I)
+        if match:
+            lock = (match.group(5) or "ACCESS EXCLUSIVE").upper()
+            for table in match.group(3).split(","):
+                steps.append(Step(description, _name(table.strip()), lock))
+            continue
+
+        match = re.match(rf"(CREATE|DROP) (CONSTRAINT )?TRIGGER .*? ON ({_IDENT})", statement, re.I)
+        if match:
+            lock = "SHARE ROW EXCLUSIVE" if match.group(1).upper() == "CREATE" else "ACCESS EXCLUSIVE"
+            steps.append(Step(description, _name(match.group(3)), lock))
+            continue
+
+        match = re.match(rf"CREATE (UNLOGGED )?TABLE (IF NOT EXISTS )?{_IDENT} PARTITION OF ({_IDENT})", statement, re.I)
+        if match:
+            steps.append(Step(description, _name(match.group(3)), "ACCESS EXCLUSIVE"))
+            continue
+        match = re.match(rf"CREATE (UNLOGGED |TEMP |TEMPORARY )?TABLE (IF NOT EXISTS )?({_IDENT})", statement, re.I)
+        if match:
+            # A new table: nobody is waiting on it
+            steps.append(Step(description, _name(match.group(3)), work=CREATE))
+            continue
+
+        match = re.match(r"(DROP TABLE|TRUNCATE)( TABLE)?( IF EXISTS)?( ONLY)? (.+?)( CASCADE| RESTRICT)?$", statement, re.I)
+        if match:
+            for table in match.group(5).split(","):
+                steps.append(Step(description, _name(table.strip()), "ACCESS EXCLUSIVE"))
+            continue
+
+        match = re.match(rf"(UPDATE (ONLY )?|DELETE FROM (ONLY )?)({_IDENT})", statement, re.I)
+        if match:
+            whole = not re.search(r"\bWHERE\b", s)
+            steps.append(Step(description, _name(match.group(4)), "ROW EXCLUSIVE", DATA, all_rows=whole,
+                              note="every row in one transaction" if whole else "rows matching WHERE, estimated as all"))
+            continue
+        match = re.match(rf"(INSERT INTO|COPY) ({_IDENT})", statement, re.I)
+        if match:
+            source = re.search(rf"\bFROM ({_IDENT})", statement, re.I) if s.startswith("INSERT") else None
+            step = Step(description, _name(match.group(2)), "ROW EXCLUSIVE", DATA)
+            if source:
+                # Sized by what is read
+                step.other_locks[_name(source.group(1))] = "ACCESS SHARE"
+                step.note = f"rows read from {_name(source.group(1))}"
+            steps.append(step)
+            continue
+
+        match = re.match(rf"(VACUUM (\(.*?\) )?FULL|CLUSTER)( VERBOSE)? ({_IDENT})", statement, re.I)
+        if match:
+            steps.append(Step(description, _name(match.group(4)), "ACCESS EXCLUSIVE", REWRITE))
+            continue
+        match = re.match(rf"REINDEX (\(.*?\) )?(INDEX|TABLE) (CONCURRENTLY )?({_IDENT})", statement, re.I)
+        if match:
+            lock = "SHARE UPDATE EXCLUSIVE" if match.group(3) else "SHARE"
+            if match.group(2).upper() == "INDEX":
+                steps.append(Step(description, lock=lock, work=INDEX, index=_name(match.group(4))))
+            else:
+                steps.append(Step(description, _name(match.group(4)), lock, INDEX))
+            continue
+        match = re.match(rf"REFRESH MATERIALIZED VIEW (CONCURRENTLY )?({_IDENT})", statement, re.I)
+        if match:
+            lock = "EXCLUSIVE" if match.group(1) else "ACCESS EXCLUSIVE"
+            steps.append(Step(description, _name(match.group(2)), lock, REWRITE))
+            continue
+
+        steps.append(Step(description, work=UNKNOWN, note="not recognised, review by hand"))
+    return steps
+
+
+def _server_default(column) -> Optional[str]:
+    default = column.server_default
+    if default is None:
+        return None
+    arg = getattr(default, "arg", default)
+    return str(arg.compile(dialect=postgresql.dialect())) if hasattr(arg, "compile") else str(arg)
+
+
+def classify_operation(operation: ops.MigrateOperation) -> List[Step]:
+    """Classify one ``op`` directive."""
+    if isinstance(operation, ops.ExecuteSQLOp):
+        sql = operation.sqltext
+        if not isinstance(sql, str):
+            sql = str(sql.compile(dialect=postgresql.dialect()))
+        return classify_sql(sql)
+
+    if isinstance(operation, ops.AddColumnOp):
+        column = operation.column
+        description = f"add_column {operation.table_name}.{column.name}"
+        step = Step(description, operation.table_name, "ACCESS EXCLUSIVE")
+        default = _server_default(column)
+        if (column.computed is not None and column.computed.persisted is not False) or column.identity is not None:
+            step.work, step.note = REWRITE, "generated or identity column"
+        elif default is not None and _VOLATILE.search(default):
+            step.work, step.note = REWRITE, f"volatile default {default}"
+        elif not column.nullable and default is None:
+            step.work, step.note = SCAN, "NOT NULL without a server default fails if the table has rows"
+        elif column.primary_key or column.unique:
+            step.work = INDEX
+        for foreign_key in column.foreign_keys:
+            step.other_locks[_name(foreign_key.target_fullname.rsplit(".", 1)[0])] = "SHARE ROW EXCLUSIVE"
+            if step.work == CATALOG:
+                step.work = SCAN
+        return [step]
+
+    if isinstance(operation, ops.AlterColumnOp):
+        description = f"alter_column {operation.table_name}.{operation.column_name}"
+        if operation.modify_type is not None:
+            return [Step(description, operation.table_name, "ACCESS EXCLUSIVE", REWRITE,
+                         note=f"type {operation.modify_type!r}, a rewrite unless binary-coercible")]
+        if operation.modify_nullable is False:
+            return [Step(description, operation.table_name, "ACCESS EXCLUSIVE", SCAN, not_null=operation.column_name,
+                         note="SET NOT NULL")]
+        return [Step(description, operation.table_name, "ACCESS EXCLUSIVE")]
+
+    if isinstance(operation, ops.CreateIndexOp):
+        description = f"create_index {operation.index_name} on {operation.table_name}"
+        if operation.kw.get("postgresql_concurrently"):
+            return [Step(description, operation.table_name, "SHARE UPDATE EXCLUSIVE", INDEX)]
+        return [Step(description, operation.table_name, "SHARE", INDEX)]
+
+    if isinstance(operation, ops.DropIndexOp):
+        description = f"drop_index {operation.index_name}"
+        lock = "SHARE UPDATE EXCLUSIVE" if operation.kw.get("postgresql_concurrently") else "ACCESS EXCLUSIVE"
+        return [Step(description, operation.table_name, lock, index=None if operation.table_name else operation.index_name)]
+
+    if isinstance(operation, ops.CreateForeignKeyOp):
+        description = f"create_foreign_key {operation.constraint_name} on {operation.source_table}"
+        not_valid = operation.kw.get("postgresql_not_valid")
+        return [Step(description, operation.source_table, "SHARE ROW EXCLUSIVE", CATALOG if not_valid else SCAN,
+                     other_locks={operation.referent_table: "SHARE ROW EXCLUSIVE"})]
+
+    if isinstance(operation, ops.CreateCheckConstraintOp):
+        description = f"create_check_constraint {operation.constraint_name} on {operation.table_name}"
+        not_valid = operation.kw.get("postgresql_not_valid")
+        return [Step(description, operation.table_name, "ACCESS EXCLUSIVE", CATALOG if not_valid else SCAN)]
+
+    if isinstance(operation, (ops.CreateUniqueConstraintOp, ops.CreatePrimaryKeyOp)):
+        description = f"{type(operation).__name__} {operation.constraint_name} on {operation.table_name}"
+        return [Step(description, operation.table_name, "ACCESS EXCLUSIVE", INDEX)]
+
+    if isinstance(operation, ops.BulkInsertOp):
+        return [Step(f"bulk_insert {operation.table.name}", operation.table.name, "ROW EXCLUSIVE", DATA,
+                     rows=len(operation.rows))]
+
+    if isinstance(operation, ops.CreateTableOp):
+        return [Step(f"create_table {operation.table_name}", operation.table_name, work=CREATE)]
+
+    if isinstance(operation, (ops.CreateTableCommentOp, ops.DropTableCommentOp)):
+        return [Step(f"{type(operation).__name__} {operation.table_name}", operation.table_name, "SHARE UPDATE EXCLUSIVE")]
+
+    if isinstance(operation, ops.RenameTableOp):
+        return [Step(f"rename_table {operation.table_name}", operation.table_name, "ACCESS EXCLUSIVE")]
+
+    table = getattr(operation, "table_name", None)
+    if isinstance(operation, (ops.DropColumnOp, ops.DropConstraintOp, ops.DropTableOp)):
+        return [Step(f"{type(operation).__name__} on {table}", table, "ACCESS EXCLUSIVE")]
+
+    return [Step(type(operation).__name__, table, work=UNKNOWN, note="not recognised, review by hand")]
+
+
+class _Recorder:
+    """
+    Classifies every directive of one revision as ``op`` invokes it, and
+    follows the transactions they run in.
+    """
+
+    def __init__(self, plan: RevisionPlan, checks: Dict[Tuple[str, str], str], proven: Set[Tuple[str, str]]):
+        self.plan = plan
+        # Shared by the revisions of one plan: the column of each
+        # CHECK (column IS NOT NULL) by (table, constraint), and the
+        # (table, column) pairs a validated one covers
+        self.checks = checks
+        self.proven = proven
+        # In autocommit mode every statement outside an explicit BEGIN is its own transaction
+        self.autocommit = False
+        self.explicit = False
+
+    @contextmanager
+    def attach(self, operations: Operations) -> Iterator[None]:
+        # The instance attributes shadow the methods for the bound ones the
+        # op proxy calls. autocommit_block() ends and restarts the migration
+        # transaction through emit_commit/emit_begin, bypassing invoke().
+        impl = operations.migration_context.impl
+        invoke, emit_begin, emit_commit = operations.invoke, impl.emit_begin, impl.emit_commit
+
+        def record(operation: ops.MigrateOperation):
+            self.record(operation)
+            return invoke(operation)
+
+        def begin() -> None:
+            self.autocommit = False
+            self.plan.transactions.append([])
+            emit_begin()
+
+        def commit() -> None:
+            self.autocommit = True
+            emit_commit()
+
+        operations.invoke, impl.emit_begin, impl.emit_commit = record, begin, commit
+        try:
+            yield
+        finally:
+            del operations.invoke, impl.emit_begin, impl.emit_commit
+
+    def record(self, operation: ops.MigrateOperation) -> None:
+        if isinstance(operation, ops.ExecuteSQLOp) and isinstance(operation.sqltext, str):
+            keyword = operation.sqltext.strip().rstrip(";").upper()
+            if self.autocommit and keyword in ("BEGIN", "START TRANSACTION"):
+                self.explicit = True
+                self.plan.transactions.append([])
+            elif self.autocommit and keyword in ("COMMIT", "END", "ROLLBACK"):
+                self.explicit = False
+        for step in classify_operation(operation):
+            if step.work == CREATE:
+                self.plan.created.append(step.table)
+                continue
+            self._prove_not_null(step)
+            if self.autocommit and not self.explicit:
+                self.plan.transactions.append([step])
+            else:
+                self.plan.transactions[-1].append(step)
+
+
+    def _prove_not_null(self, step: Step) -> None:
+        if step.constraint and step.not_null:
+            self.checks[(step.table, step.constraint)] = step.not_null
+            if step.work == SCAN:
+                # Added without NOT VALID: validated right away
+                self.proven.add((step.table, step.not_null))
+        elif step.constraint and (step.table, step.constraint) in self.checks:
+            self.proven.add((step.table, self.checks[(step.table, step.constraint)]))
+        elif step.not_null and (step.table, step.not_null) in self.proven:
+            step.work, step.note = CATALOG, "proven by a validated CHECK"
+
+
+def pending_revisions(config: Config, lower: Union[str, Tuple[str, ...], None], upper: str = "heads") -> List[Script]:
+    """Revisions ``alembic upgrade upper`` would run from ``lower`` (None: the base), in order."""
+    script = ScriptDirectory.from_config(config)
+    return list(reversed(list(script.iterate_revisions(upper, lower))))
+
+
+def plan_revisions(config: Config, revisions: List[Script]) -> List[RevisionPlan]:
+    """Render ``revisions`` offline, recording and classifying their operations."""
+    script = ScriptDirectory.from_config(config)
+    plans = []
+    with EnvironmentContext(config, script) as environment:
+        environment.configure(
+            dialect_name="postgresql",
+            as_sql=True,
+            output_buffer=io.StringIO(),
+            transaction_per_migration=True,
+            literal_binds=True,
+        )
+        migration_context = environment.get_context()
+        checks: Dict[Tuple[str, str], str] = {}
+        proven: Set[Tuple[str, str]] = set()
+        with Operations.context(migration_context) as operations:
+            for revision in revisions:
+                doc = (revision.doc or "").strip().splitlines()
+                plan = RevisionPlan(revision.revision, doc[0] if doc else "", transactions=[[]])
+                with _Recorder(plan, checks, proven).attach(operations):
+                    try:
+                        revision.module.upgrade()
+                    except Exception as exc:
+                        plan.incomplete = f"{type(exc).__name__}: {exc}"
+                plan.transactions = [transaction for transaction in plan.transactions if transaction]
+                plans.append(plan)
+    return plans
+
+
+def _estimate(step: Step, sizes: Dict[str, Tuple[int, int, int]], rates: Rates) -> Optional[float]:
+    if step.work == CATALOG:
+        return 0.0
+    if step.work == UNKNOWN:
+        return None
+    table_bytes, index_bytes, rows = sizes.get(step.table, (0, 0, 0))
+    if step.work == SCAN:
+        return table_bytes / rates.scan_bytes_per_second
+    if step.work == REWRITE:
+        return (table_bytes + index_bytes) / rates.rewrite_bytes_per_second
+    if step.work == INDEX:
+        return table_bytes / rates.index_bytes_per_second
+    # DATA: INSERT ... SELECT is sized by the table it reads
+    source = next(iter(step.other_locks), None)
+    if step.rows is None:
+        step.rows = sizes.get(source, (0, 0, 0))[2] if source else rows
+    return step.rows / rates.rows_per_second
+
+
+def measure(plans: List[RevisionPlan], rates: Rates = Rates(), engine: Optional[Engine] = None) -> Dict[str, Tuple[int, int, int]]:
+    """
+    Fill in each step's table size and estimated seconds from the live
+    database. Returns (table bytes, index bytes, estimated rows) by table;
+    tables that do not exist yet or that ``plans`` create count as empty.
+    """
+    engine = engine or db.get_sync_engine()
+    sizes: Dict[str, Tuple[int, int, int]] = {table: (0, 0, 0) for plan in plans for table in plan.created}
+    with engine.connect() as conn:
+        for plan in plans:
+            for step in plan.steps:
+                if step.index and not step.table:
+                    step.table = conn.scalar(INDEX_TABLE, {"name": step.index})
+                for table in filter(None, [step.table, *step.other_locks]):
+                    if table not in sizes:
+                        sizes[table] = _size(conn, table)
+                step.table_bytes = sizes[step.table][0] if step.table else None
+                step.seconds = _estimate(step, sizes, rates)
+    return sizes
+
+
+def _size(conn: Connection, table: str) -> Tuple[int, int, int]:
+    if conn.scalar(text("SELECT to_regclass(:table)"), {"table": table}) is None:
+        return 0, 0, 0
+    heap, indexes, rows = conn.execute(TABLE_SIZE, {"table": table}).one()
+    return int(heap), int(indexes), int(rows)
+
+
+def check(
+    plans: List[RevisionPlan], sizes: Dict[str, Tuple[int, int, int]], threshold_bytes: Optional[int] = None,
+) -> List[Violation]:
+    """
+    Writes blocked on a table of at least ``threshold_bytes`` (default
+    ``DB_MIGRATION_BLOCKING_THRESHOLD_MB``, heap and indexes) while anything
+    but a catalog update runs in the same transaction, one per revision and
+    table (the longest).
+    """
+    if threshold_bytes is None:
+        threshold_bytes = settings.DB_MIGRATION_BLOCKING_THRESHOLD_MB * 1024 * 1024
+    violations: Dict[Tuple[str, str], Violation] = {}
+    for plan in plans:
+        for transaction in plan.transactions:
+            for i, step in enumerate(transaction):
+                held = [s for s in transaction[i:] if s.work != CATALOG]
+                if not held:
+                    continue
+                estimates = [s.seconds for s in held]
+                seconds = None if None in estimates else sum(estimates)
+                for table, lock in step.blocked_tables():
+                    table_bytes = sum(sizes.get(table, (0, 0, 0))[:2])
+                    if table_bytes < threshold_bytes:
+                        continue
+                    previous = violations.get((plan.revision, table))
+                    if previous is None or _longer(seconds, previous.seconds):
+                        violations[(plan.revision, table)] = Violation(
+                            plan.revision, table, lock, table_bytes, seconds,
+                            [f"{s.work}: {s.description}" for s in held],
+                        )
+    return list(violations.values())
+
+
+def _longer(a: Optional[float], b: Optional[float]) -> bool:
+    # None (unknown work) counts as longest
+    return b is not None and (a is None or a > b)
+
+
+def _format_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "-"
+    for unit in ("B", "kB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    if seconds < 1:
+        return "<1s" if seconds else "0s"
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    return f"{seconds / 60:.0f}min"
+
+
+def print_plan(plans: List[RevisionPlan], violations: List[Violation]) -> None:
+    failing = {v.revision for v in violations}
+    for plan in plans:
+        status = "FAIL" if plan.revision in failing else "incomplete" if plan.incomplete else "ok"
+        print(f"\n{plan.revision}  {plan.doc}  (~{_format_seconds(plan.seconds)})  {status}")
+        for transaction in plan.transactions:
+            for i, step in enumerate(transaction):
+                mark = "  " if i == 0 else " |"
+                print(
+                    f"{mark} {step.lock or '-':<23}{step.work:<9}{step.table or '-':<24}"
+                    f"{_format_bytes(step.table_bytes):>9}{'-' if step.work == CATALOG else _format_seconds(step.seconds):>7}  {step.description}"
+                    + (f"  [{step.note}]" if step.note else "")
+                )
+        if plan.incomplete:
+            print(f"   ! rendering stopped: {plan.incomplete}")
+        for v in violations:
+            if v.revision == plan.revision:
+                print(f"   ! blocks writes on {v.table} ({_format_bytes(v.table_bytes)}, {v.lock}) "
+                      f"for ~{_format_seconds(v.seconds)}: {'; '.join(v.work)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-c", "--config", default="alembic.ini")
+    parser.add_argument("--from", dest="lower", help="plan from this revision instead of the database's (base for all)")
+    parser.add_argument("--to", dest="upper", default="heads")
+    parser.add_argument("--threshold-mb", type=float, help="default DB_MIGRATION_BLOCKING_THRESHOLD_MB")
+    parser.add_argument("--scan-mb-per-second", type=float, default=Rates.scan_bytes_per_second / 1e6)
+    parser.add_argument("--rewrite-mb-per-second", type=float, default=Rates.rewrite_bytes_per_second / 1e6)
+    parser.add_argument("--index-mb-per-second", type=float, default=Rates.index_bytes_per_second / 1e6)
+    parser.add_argument("--rows-per-second", type=float, default=Rates.rows_per_second)
+    parser.add_argument("--json", help="also write the plan to this file")
+    parser.add_argument("--allow-incomplete", action="store_true",
+                        help="do not fail on revisions that cannot be rendered offline")
+    args = parser.parse_args()
+    if min(args.scan_mb_per_second, args.rewrite_mb_per_second, args.index_mb_per_second, args.rows_per_second) <= 0:
+        parser.error("rates must be positive")
+    rates = Rates(
+        args.scan_mb_per_second * 1e6, args.rewrite_mb_per_second * 1e6, args.index_mb_per_second * 1e6,
+        args.rows_per_second,
+    )
+    threshold_mb = settings.DB_MIGRATION_BLOCKING_THRESHOLD_MB if args.threshold_mb is None else args.threshold_mb
+
+    config = Config(args.config)
+    engine = db.get_sync_engine()
+    lower = args.lower
+    if lower is None:
+        with engine.connect() as conn:
+            heads = MigrationContext.configure(conn).get_current_heads()
+        lower = heads[0] if len(heads) == 1 else heads or None
+    elif lower == "base":
+        lower = None
+
+    revisions = pending_revisions(config, lower, args.upper)
+    print(f"{len(revisions)} pending revision(s) from {lower or 'base'} to {args.upper}, "
+          f"blocking threshold {threshold_mb:g} MB")
+    plans = plan_revisions(config, revisions)
+    sizes = measure(plans, rates, engine)
+    violations = check(plans, sizes, int(threshold_mb * 1024 * 1024))
+    engine.dispose()
+    print_plan(plans, violations)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "threshold_mb": threshold_mb,
+                "rates": asdict(rates),
+                "revisions": [asdict(plan) for plan in plans],
+                "violations": [asdict(v) for v in violations],
+            }, f, indent=2)
+    incomplete = [plan.revision for plan in plans if plan.incomplete]
+    if violations or (incomplete and not args.allow_incomplete):
+        print(f"\nfailed: {len(violations)} blocking step(s) over the threshold, "
+              f"{len(incomplete)} revision(s) not fully planned")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Building blocks for Alembic revisions that change live tables.
+
+The plain ``op`` directives hold their lock for as long as the statement
+runs: ``op.create_index`` blocks writes for the whole build,
+``op.create_foreign_key`` and ``op.add_column(..., nullable=False)`` scan the
+table under an exclusive lock, and every query arriving meanwhile queues
+behind them. On ``chunk`` or ``embedding`` that is minutes of downtime. The
+helpers here split such changes so that no step holding a lock that blocks
+writes does more than a catalog update:
+
+* ``create_index_concurrently`` / ``drop_index_concurrently`` run outside the
+  migration transaction, building partitioned tables partition by partition;
+* ``add_foreign_key`` / ``add_check_constraint`` add the constraint
+  ``NOT VALID`` and ``validate_constraint`` then checks the existing rows
+  under a lock that lets reads and writes continue;
+* ``set_not_null`` proves the column with a validated ``CHECK`` first, so
+  ``SET NOT NULL`` needs no scan;
+* ``backfill`` updates rows in keyset batches, one commit each.
+
+Adding a ``NOT NULL`` column to a populated table is then: add it nullable
+(with ``guarded``), ``backfill`` it, ``set_not_null``.
+
+Statements that need a lock which blocks writes run through ``guarded``:
+each attempt is a transaction of its own that gives up after
+``DB_MIGRATION_LOCK_TIMEOUT`` instead of queueing writers behind it, and
+after ``DB_MIGRATION_STATEMENT_TIMEOUT`` if it unexpectedly scans or
+rewrites. Lock timeouts are retried ``DB_MIGRATION_LOCK_RETRIES`` times with
+doubling pauses. alembic/env.py applies the same lock timeout to the whole
+migration session and retries a revision that failed on one.
+
+Revisions import these helpers and take their lock timeout from
+``DB_MIGRATION_LOCK_TIMEOUT`` rather than carrying their own copies;
+``drop_index_if_invalid`` is the one for a hand-written concurrent build.
+
+The helpers commit the migration transaction before they start (like
+``autocommit_block``) and only do work that is not done yet, so a revision
+built from them can be run again after a failure. In offline mode they emit
+their SQL without looking at the catalog: partitions and leftovers of an
+earlier attempt are not handled there, and ``backfill`` is one ``UPDATE`` in
+its own transaction.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+import sqlalchemy as sa
+from alembic import context, op
+from sqlalchemy.exc import DBAPIError
+
+from neutrino_database.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_NOT_AVAILABLE = "55P03"
+# First pause between attempts, in seconds; doubled after every failure
+RETRY_BACKOFF = 1.0
+DEFAULT_BATCH_SIZE = 5000
+
+
+def is_lock_timeout(exc: BaseException) -> bool:
+    """Whether ``exc`` is PostgreSQL giving up on a lock (``lock_timeout``, ``NOWAIT``)."""
+    orig = getattr(exc, "orig", None)
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) == LOCK_NOT_AVAILABLE
+
+
+def retry_on_lock_timeout(work: Callable[[], T], attempts: Optional[int] = None) -> T:
+    """
+    Call ``work`` until it does not fail on a lock timeout, up to ``attempts``
+    times (default ``DB_MIGRATION_LOCK_RETRIES``), pausing ``RETRY_BACKOFF``
+    seconds after the first failure and twice as long after each next one.
+    ``work`` must leave no transaction open when it raises.
+    """
+    attempts = attempts or settings.DB_MIGRATION_LOCK_RETRIES
+    if attempts < 1:
+        raise ValueError("attempts must be positive")
+    for attempt in range(1, attempts + 1):
+        try:
+            return work()
+        except DBAPIError as exc:
+            if not is_lock_timeout(exc) or attempt == attempts:
+                raise
+            pause = RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.warning("Lock not available (attempt %d of %d), retrying in %.0fs", attempt, attempts, pause)
+            time.sleep(pause)
+
+
+def _in_autocommit() -> bool:
+    if context.is_offline_mode():
+        return False
+    return op.get_bind().get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+
+
+# Depth of _autocommit blocks opened by the helpers; offline there is no
+# connection to ask whether one is open
+_autocommit_depth = 0
+
+
+@contextmanager
+def _autocommit() -> Iterator[None]:
+    """``autocommit_block``, unless already inside one."""
+    global _autocommit_depth
+    if _autocommit_depth or _in_autocommit():
+        yield
+        return
+    with op.get_context().autocommit_block():
+        _autocommit_depth += 1
+        try:
+            yield
+        finally:
+            _autocommit_depth -= 1
+
+
+@contextmanager
+def _unlimited() -> Iterator[None]:
+    # For work that takes no lock blocking writes but may run long (concurrent
+    # builds, validation scans): waiting is harmless, giving up is not.
+    op.execute("SET lock_timeout = 0")
+    op.execute("SET statement_timeout = 0")
+    try:
+        yield
+    finally:
+        # Back to the session defaults set by alembic/env.py (in offline
+        # mode at the top of the script, so RESET would not restore it)
+        op.execute(f"SET lock_timeout = '{settings.DB_MIGRATION_LOCK_TIMEOUT}'")
+        op.execute("RESET statement_timeout")
+
+
+def guarded(
+    *statements: str,
+    lock_timeout: Optional[str] = None,
+    statement_timeout: Optional[str] = None,
+    attempts: Optional[int] = None,
+) -> None:
+    """
+    Run ``statements`` in one short transaction of their own, retried while
+    their locks are not available.
+
+    ``lock_timeout`` and ``statement_timeout`` (PostgreSQL intervals such as
+    ``'5s'``; default ``DB_MIGRATION_LOCK_TIMEOUT`` and
+    ``DB_MIGRATION_STATEMENT_TIMEOUT``) apply to the transaction only.
+    ``attempts`` defaults to ``DB_MIGRATION_LOCK_RETRIES``.
+    """
+    lock_timeout = lock_timeout or settings.DB_MIGRATION_LOCK_TIMEOUT
+    statement_timeout = statement_timeout or settings.DB_MIGRATION_STATEMENT_TIMEOUT
+
+    def attempt() -> None:
+        op.execute("BEGIN")
+        try:
+            op.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+            op.execute(f"SET LOCAL statement_timeout = '{statement_timeout}'")
+            for statement in statements:
+                op.execute(statement)
+        except DBAPIError:
+            op.execute("ROLLBACK")
+            raise
+        op.execute("COMMIT")
+
+    with _autocommit():
+        retry_on_lock_timeout(attempt, attempts)
+
+
+def _scalar(sql: str, **params):
+    return op.get_bind().execute(sa.text(sql), params).scalar()
+
+
+def _is_partitioned(table: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    return bool(_scalar(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:table AS regclass)", table=table,
+    ))
+
+
+def _partitions(table: str) -> List[str]:
+    return [row[0] for row in op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+    ), {"table": table})]
+
+
+def drop_index_if_invalid(index_name: str) -> None:
+    """
+    Drop ``index_name`` if a failed ``CREATE INDEX CONCURRENTLY`` left it
+    behind INVALID, which ``IF NOT EXISTS`` would silently keep. Call it
+    before such a build; nothing happens in offline mode.
+    """
+    if context.is_offline_mode():
+        return
+    invalid = _scalar(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND c.relkind = 'i'", name=index_name,
+    )
+    if invalid:
+        with _autocommit():
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def _index_sql(name: str, table: str, columns: str, unique: bool, using: Optional[str], where: Optional[str]) -> str:
+    return (
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX{{concurrently}} IF NOT EXISTS {name} ON {{only}}{table}"
+        f"{f' USING {using}' if using else ''} ({columns}){f' WHERE {where}' if where else ''}"
+    )
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: str,
+    unique: bool = False,
+    using: Optional[str] = None,
+    where: Optional[str] = None,
+) -> None:
+    """
+    Build index ``name`` on ``table (columns)`` without blocking writes.
+
+    ``columns`` is the SQL column list, expressions and operator classes
+    included; ``using`` the access method and ``where`` the predicate of a
+    partial index. A partitioned ``table`` gets an index ``ON ONLY`` the
+    parent (invalid until complete), then each partition's index is built
+    concurrently and attached, which makes the parent valid.
+    """
+    sql = _index_sql(name, table, columns, unique, using, where)
+    with _autocommit():
+        if not _is_partitioned(table):
+            drop_index_if_invalid(name)
+            with _unlimited():
+                op.execute(sql.format(concurrently=" CONCURRENTLY", only=""))
+            return
+
+        guarded(sql.format(concurrently="", only="ONLY "))
+        for partition in _partitions(table):
+            # Same naming Postgres uses for indexes it creates on new partitions
+            index = f"{partition}_{re.sub(r'[^a-z0-9_]+', '_', columns.lower()).strip('_')}_idx"[:63]
+            drop_index_if_invalid(index)
+            with _unlimited():
+                op.execute(
+                    _index_sql(index, partition, columns, unique, using, where).format(concurrently=" CONCURRENTLY", only="")
+                )
+            attached = _scalar(
+                "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = CAST(:index AS regclass))", index=index,
+            )
+            if not attached:
+                guarded(f"ALTER INDEX {name} ATTACH PARTITION {index}")
+
+
+def drop_index_concurrently(name: str) -> None:
+    """Drop index ``name`` if it exists without blocking writes (briefly, for a partitioned index)."""
+    with _autocommit():
+        partitioned = not context.is_offline_mode() and _scalar(
+            "SELECT relkind = 'I' FROM pg_class WHERE relname = :name AND relkind IN ('i', 'I')", name=name,
+        )
+        if partitioned:
+            # Partitioned indexes cannot be dropped concurrently
+            guarded(f"DROP INDEX IF EXISTS {name}")
+        else:
+            with _unlimited():
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _constraints(table: str, name: str) -> Dict[str, bool]:
+    """Whether constraint ``name`` on ``table`` is validated, by table; empty when it does not exist."""
+    if context.is_offline_mode():
+        return {}
+    return {row[0]: row[1] for row in op.get_bind().execute(sa.text(
+        "SELECT conrelid::regclass::text, convalidated FROM pg_constraint "
+        "WHERE conname = :name AND conrelid = CAST(:table AS regclass)"
+    ), {"name": name, "table": table})}
+
+
+def validate_constraint(table: str, name: str) -> None:
+    """
+    Check the existing rows against ``NOT VALID`` constraint ``name``.
+
+    The scan holds ``SHARE UPDATE EXCLUSIVE`` on ``table`` (and ``ROW SHARE``
+    on the referenced table of a foreign key), so reads and writes continue.
+    """
+    if _constraints(table, name).get(table):
+        return
+    with _autocommit(), _unlimited():
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+
+def add_foreign_key(
+    name: str,
+    table: str,
+    columns: str,
+    referent: str,
+    referent_columns: str = "id",
+    ondelete: Optional[str] = None,
+    validate: bool = True,
+) -> None:
+    """
+    Add foreign key ``name`` on ``table (columns)`` referencing ``referent
+    (referent_columns)`` without scanning under an exclusive lock.
+
+    The constraint is added ``NOT VALID`` (only new rows are checked) and
+    then validated unless ``validate`` is false; call ``validate_constraint``
+    in a later revision in that case. PostgreSQL does not take ``NOT VALID``
+    foreign keys on a partitioned table, so there each partition gets the
+    constraint and validates it, and adding it to the parent then only
+    attaches them.
+    """
+    sql = (
+        f"ALTER TABLE {{table}} ADD CONSTRAINT {name} FOREIGN KEY ({columns}) "
+        f"REFERENCES {referent} ({referent_columns}){f' ON DELETE {ondelete}' if ondelete else ''}"
+    )
+    if not _is_partitioned(table):
+        if not _constraints(table, name):
+            guarded(sql.format(table=table) + " NOT VALID")
+        if validate:
+            validate_constraint(table, name)
+        return
+
+    if not validate:
+        raise ValueError(f"{table} is partitioned: its foreign keys cannot be left NOT VALID")
+    if _constraints(table, name):
+        return
+    for partition in _partitions(table):
+        if not _constraints(partition, name):
+            guarded(sql.format(table=partition) + " NOT VALID")
+        validate_constraint(partition, name)
+    guarded(sql.format(table=table))
+
+
+def add_check_constraint(name: str, table: str, condition: str, validate: bool = True) -> None:
+    """
+    Add ``CHECK (condition)`` as ``name`` on ``table`` without scanning under
+    an exclusive lock: ``NOT VALID`` first, then validated unless ``validate``
+    is false.
+    """
+    if not _constraints(table, name):
+        guarded(f"ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({condition}) NOT VALID")
+    if validate:
+        validate_constraint(table, name)
+
+
+def set_not_null(table: str, column: str) -> None:
+    """
+    ``ALTER COLUMN column SET NOT NULL`` without a scan under an exclusive
+    lock. A validated ``CHECK (column IS NOT NULL)`` proves the column first,
+    which lets PostgreSQL skip the scan, and is dropped afterwards.
+    """
+    check = f"{table}_{column}_not_null"[:63]
+    add_check_constraint(check, table, f"{column} IS NOT NULL")
+    guarded(
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL",
+        f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}",
+    )
+
+
+def backfill(
+    table: str,
+    assignments: str,
+    where: Optional[str] = None,
+    key: str = "id",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = 0.0,
+    params: Optional[dict] = None,
+) -> int:
+    """
+    ``UPDATE table SET assignments [WHERE where]`` in keyset batches of
+    ``batch_size`` rows by the unique column ``key``, one commit each.
+
+    Each batch locks only its own rows, briefly; a batch that cannot get its
+    locks is retried (``retry_on_lock_timeout``). Make ``where`` exclude rows
+    that are already done (``workspace_id IS NULL``) so an interrupted
+    backfill resumes cheaply when run again. ``pause`` seconds between
+    batches cap the WAL rate for the replicas. ``params`` are bound into
+    ``assignments`` and ``where``. Returns the number of rows updated.
+
+    In offline mode it emits a single ``UPDATE`` in a transaction of its own
+    (the batches need the keys) and returns 0.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+
+    condition = f" AND ({where})" if where else ""
+    if context.is_offline_mode():
+        with _autocommit():
+            op.execute(sa.text(f"UPDATE {table} SET {assignments} WHERE TRUE{condition}").bindparams(**(params or {})))
+        return 0
+    first = sa.text(f"SELECT {key} FROM {table} WHERE TRUE{condition} ORDER BY {key} LIMIT :limit")
+    following = sa.text(f"SELECT {key} FROM {table} WHERE {key} > :after{condition} ORDER BY {key} LIMIT :limit")
+    update = sa.text(f"UPDATE {table} SET {assignments} WHERE {key} = ANY(:keys){condition}")
+    params = dict(params or {}, limit=batch_size)
+
+    updated = 0
+    after = None
+    with _autocommit():
+        bind = op.get_bind()
+        while True:
+            select_keys = first if after is None else following
+            keys = [row[0] for row in bind.execute(select_keys, dict(params, after=after))]
+            if not keys:
+                break
+            # Autocommit: the UPDATE is its own transaction
+            updated += retry_on_lock_timeout(lambda: bind.execute(update, dict(params, keys=keys)).rowcount)
+            after = keys[-1]
+            if pause:
+                time.sleep(pause)
+    logger.info("Backfilled %d rows of %s", updated, table)
+    return updated
@@ -0,0 +1,227 @@
+"""
+``NOTIFY`` triggers.
+
+``ingestion_jobs`` notifies ``INGESTION_JOBS_CHANNEL`` whenever a job becomes
+ready (inserted, or its ``overall_status`` set back, to
+``READY_FOR_INGESTION``) so idle workers wake up at once instead of polling
+(see ``neutrino_database.jobs``). The payload is the job's ``tenant_id``;
+Postgres folds identical notifications within a transaction, so a bulk
+upload sends one per tenant, not one per job.
+
+``signing_keys`` notifies ``SIGNING_KEYS_CHANNEL`` once per statement that
+changes it, so every ``signing_keys.SigningKeyCache`` reloads right after a
+rotation.
+
+``tenant`` (on changes to what ``tenants.TenantRecord`` holds) and
+``tenant_identity`` notify ``TENANTS_CHANNEL`` with the tenant id, so
+``tenants.TenantCache`` drops that tenant's entries.
+
+``workspace_member`` (and ``workspace`` deletion, soft or hard) appends every
+membership change to ``workspace_member_change`` under a per-tenant version
+from ``workspace_membership_version`` and notifies ``MEMBERSHIP_CHANNEL``
+with the tenant id, so ``memberships.MembershipIndex`` applies just the new
+changes.
+
+The triggers are created by migrations (``e3f6a1b9c802``, ``c5b8e2d4f613``,
+``d1a4f7c3e926``, ``f2b9d4a6c158``) and by ``metadata.create_all``.
+"""
+from typing import Callable, List
+
+from sqlalchemy import DDL, Table
+
+INGESTION_JOBS_CHANNEL = "ingestion_jobs_ready"
+SIGNING_KEYS_CHANNEL = "signing_keys_changed"
+TENANTS_CHANNEL = "tenant_changed"
+MEMBERSHIP_CHANNEL = "workspace_membership_changed"
+READY_FOR_INGESTION = "READY_FOR_INGESTION"
+
+
+def ingestion_jobs_notify_ddl() -> List[str]:
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION ingestion_jobs_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{INGESTION_JOBS_CHANNEL}', NEW.tenant_id::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS ingestion_jobs_notify ON ingestion_jobs",
+        f"""
+        CREATE TRIGGER ingestion_jobs_notify
+        AFTER INSERT OR UPDATE OF overall_status ON ingestion_jobs
+        FOR EACH ROW WHEN (NEW.overall_status = '{READY_FOR_INGESTION}' AND NOT NEW.is_deleted)
+        EXECUTE FUNCTION ingestion_jobs_notify()
+        """,
+    ]
+
+
+def signing_keys_notify_ddl() -> List[str]:
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION signing_keys_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{SIGNING_KEYS_CHANNEL}', '');
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS signing_keys_notify ON signing_keys",
+        """
+        CREATE TRIGGER signing_keys_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON signing_keys
+        FOR EACH STATEMENT EXECUTE FUNCTION signing_keys_notify()
+        """,
+    ]
+
+
+def _tenant_notify_function() -> str:
+    # TG_ARGV[0] names the column holding the tenant id
+    return f"""
+        CREATE OR REPLACE FUNCTION tenant_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{TENANTS_CHANNEL}', to_jsonb(OLD) ->> TG_ARGV[0]);
+            ELSE
+                PERFORM pg_notify('{TENANTS_CHANNEL}', to_jsonb(NEW) ->> TG_ARGV[0]);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def tenant_notify_ddl() -> List[str]:
+    return [
+        _tenant_notify_function(),
+        "DROP TRIGGER IF EXISTS tenant_notify ON tenant",
+        """
+        CREATE TRIGGER tenant_notify
+        AFTER INSERT OR DELETE OR UPDATE OF name, org_external_id, status, allowed_modules, deleted_at
+        ON tenant FOR EACH ROW EXECUTE FUNCTION tenant_notify('id')
+        """,
+    ]
+
+
+def tenant_identity_notify_ddl() -> List[str]:
+    return [
+        _tenant_notify_function(),
+        "DROP TRIGGER IF EXISTS tenant_identity_notify ON tenant_identity",
+        """
+        CREATE TRIGGER tenant_identity_notify
+        AFTER INSERT OR UPDATE OR DELETE ON tenant_identity
+        FOR EACH ROW EXECUTE FUNCTION tenant_notify('tenant_id')
+        """,
+    ]
+
+
+def workspace_membership_ddl() -> List[str]:
+    # Bumping the version row locks it until commit, so a tenant's versions
+    # become visible in order and without gaps. A removed user has
+    # is_workspace_admin NULL; a removed workspace has user_id NULL too.
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION workspace_membership_log(t uuid, ws uuid, usr uuid, adm boolean)
+        RETURNS void AS $$
+        DECLARE
+            v bigint;
+        BEGIN
+            INSERT INTO workspace_membership_version AS m (tenant_id, version) VALUES (t, 1)
+            ON CONFLICT (tenant_id) DO UPDATE SET version = m.version + 1
+            RETURNING m.version INTO v;
+            INSERT INTO workspace_member_change (tenant_id, version, workspace_id, user_id, is_workspace_admin)
+            VALUES (t, v, ws, usr, adm);
+            PERFORM pg_notify('{MEMBERSHIP_CHANNEL}', t::text);
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        # Members of deleted workspaces (being deleted, or soft-deleted) are
+        # not logged: the workspace's own removal covers them
+        """
+        CREATE OR REPLACE FUNCTION workspace_member_log() RETURNS trigger AS $$
+        DECLARE
+            t uuid;
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (OLD.workspace_id, OLD.user_id)
+                    IS DISTINCT FROM (NEW.workspace_id, NEW.user_id)) THEN
+                SELECT tenant_id INTO t FROM workspace WHERE id = OLD.workspace_id AND deleted_at IS NULL;
+                IF t IS NOT NULL THEN
+                    PERFORM workspace_membership_log(t, OLD.workspace_id, OLD.user_id, NULL);
+                END IF;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                SELECT tenant_id INTO t FROM workspace WHERE id = NEW.workspace_id AND deleted_at IS NULL;
+                IF t IS NOT NULL THEN
+                    PERFORM workspace_membership_log(t, NEW.workspace_id, NEW.user_id, NEW.is_workspace_admin);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION workspace_log() RETURNS trigger AS $$
+        DECLARE
+            r record;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                IF OLD.deleted_at IS NULL THEN
+                    PERFORM workspace_membership_log(OLD.tenant_id, OLD.id, NULL, NULL);
+                END IF;
+            ELSIF OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL THEN
+                PERFORM workspace_membership_log(NEW.tenant_id, NEW.id, NULL, NULL);
+            ELSIF OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL THEN
+                FOR r IN SELECT user_id, is_workspace_admin FROM workspace_member WHERE workspace_id = NEW.id LOOP
+                    PERFORM workspace_membership_log(NEW.tenant_id, NEW.id, r.user_id, r.is_workspace_admin);
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS workspace_member_log ON workspace_member",
+        """
+        CREATE TRIGGER workspace_member_log
+        AFTER INSERT OR DELETE OR UPDATE OF workspace_id, user_id, is_workspace_admin
+        ON workspace_member FOR EACH ROW EXECUTE FUNCTION workspace_member_log()
+        """,
+        "DROP TRIGGER IF EXISTS workspace_log ON workspace",
+        """
+        CREATE TRIGGER workspace_log
+        AFTER DELETE OR UPDATE OF deleted_at ON workspace
+        FOR EACH ROW EXECUTE FUNCTION workspace_log()
+        """,
+    ]
+
+
+def _after_create(ddl: Callable[[], List[str]]) -> dict:
+    def create_trigger(target: Table, connection, **kw) -> None:
+        for statement in ddl():
+            connection.execute(DDL(statement))
+
+    return dict(listeners=[("after_create", create_trigger)])
+
+
+def notifies_ready_jobs() -> dict:
+    """``Table`` keyword arguments installing the ``ingestion_jobs`` notify trigger."""
+    return _after_create(ingestion_jobs_notify_ddl)
+
+
+def notifies_key_changes() -> dict:
+    """``Table`` keyword arguments installing the ``signing_keys`` notify trigger."""
+    return _after_create(signing_keys_notify_ddl)
+
+
+def notifies_tenant_changes() -> dict:
+    """``Table`` keyword arguments installing the ``tenant`` notify trigger."""
+    return _after_create(tenant_notify_ddl)
+
+
+def notifies_tenant_identity_changes() -> dict:
+    """``Table`` keyword arguments installing the ``tenant_identity`` notify trigger."""
+    return _after_create(tenant_identity_notify_ddl)
+
+
+def logs_membership_changes() -> dict:
+    """``Table`` keyword arguments installing the ``workspace_member`` and ``workspace`` change log triggers."""
+    return _after_create(workspace_membership_ddl)
@@ -103,7 +103,8 @@ class Tenant(Base):
     roles: Mapped[List["Role"]] = relationship(
         "Role",
         back_populates="tenant",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     workspaces: Mapped[List["Workspace"]] = relationship(
@@ -116,13 +117,15 @@ class Tenant(Base):
     invitations: Mapped[List["UserInvitation"]] = relationship(
         "UserInvitation",
         back_populates="tenant",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     identities: Mapped[List["TenantIdentity"]] = relationship(
         "TenantIdentity",
         back_populates="tenant",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     chats: Mapped[List["Chat"]] = relationship(
@@ -388,6 +391,8 @@ class Chat(Base):
         back_populates="chats"
     )
 
+    # Loads the entire history; for a context window use
+    # neutrino_database.chats.load_recent_messages instead
     messages: Mapped[List["Message"]] = relationship(
         "Message",
         back_populates="chat",
@@ -465,20 +470,23 @@ class Workspace(Base):
     members: Mapped[List["WorkspaceMember"]] = relationship(
         "WorkspaceMember",
         back_populates="workspace",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     access_requests: Mapped[List["WorkspaceAccessRequest"]] = relationship(
         "WorkspaceAccessRequest",
         foreign_keys="WorkspaceAccessRequest.workspace_id",
         back_populates="workspace",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     invitations: Mapped[List["WorkspaceInvitation"]] = relationship(
         "WorkspaceInvitation",
         back_populates="workspace",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
 
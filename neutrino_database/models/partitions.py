@@ -0,0 +1,157 @@
+"""
+Declarative partitioning helpers.
+
+``parsing``, ``chunk``, ``embedding`` and ``index_sync`` are declared
+``PARTITION BY HASH (tenant_id)`` (see migration ``6e0b3a9f7c21``). Postgres
+only enforces primary and unique keys that contain the partition key, so all
+of them include ``tenant_id``, and every query on these tables should filter
+on it: with ``tenant_id = ...`` the planner scans a single partition instead
+of all ``DB_TENANT_PARTITIONS`` of them.
+
+``message`` is declared ``PARTITION BY RANGE (created_at)`` with one
+partition per calendar month (UTC) plus a default partition for rows outside
+every month (see migration ``3d9a7b1e5f48``). Future months are created by
+``neutrino_database.retention.ensure_message_partitions`` and old ones are
+dropped or detached as a whole by the retention API. A CHECK on the default
+partition (``default_partition_check_ddl``) states which months it holds no
+rows of, so attaching it or a partition for one of those months does not scan
+it.
+"""
+import re
+from datetime import datetime, timezone
+from functools import partial
+from typing import Iterable, List, Optional
+
+from sqlalchemy import DDL, Table
+
+PARTITION_KEY = "tenant_id"
+
+_MONTH_SUFFIX = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def partition_name(table_name: str, remainder: int) -> str:
+    return f"{table_name}_p{remainder}"
+
+
+def hash_partition_ddl(table_name: str, count: int) -> List[str]:
+    """``CREATE TABLE ... PARTITION OF`` statements for ``count`` hash partitions."""
+    return [
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table_name, remainder)} PARTITION OF {table_name} "
+        f"FOR VALUES WITH (MODULUS {count}, REMAINDER {remainder})"
+        for remainder in range(count)
+    ]
+
+
+def _create_partitions(target: Table, connection, **kw) -> None:
+    # Imported here so the models can be loaded without a configured database
+    from neutrino_database.config import settings
+
+    for statement in hash_partition_ddl(target.name, settings.DB_TENANT_PARTITIONS):
+        connection.execute(DDL(statement))
+
+
+def tenant_partitioned() -> dict:
+    """``Table`` keyword arguments for a table hash-partitioned on ``tenant_id``."""
+    return dict(
+        postgresql_partition_by=f"HASH ({PARTITION_KEY})",
+        # metadata.create_all creates the partitions too; production schemas
+        # get them from the migration.
+        listeners=[("after_create", _create_partitions)],
+    )
+
+
+def month_start(value: datetime) -> datetime:
+    """First instant (UTC) of the month containing ``value``."""
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def monthly_partition_name(table_name: str, month: datetime) -> str:
+    return f"{table_name}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(partition_name: str) -> Optional[datetime]:
+    """Month a partition named by ``monthly_partition_name`` covers (None for others)."""
+    match = _MONTH_SUFFIX.search(partition_name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def monthly_partition_ddl(table_name: str, month: datetime, parent: Optional[str] = None) -> str:
+    """``CREATE TABLE ... PARTITION OF`` for the month starting at ``month``."""
+    month = month_start(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {monthly_partition_name(table_name, month)} "
+        f"PARTITION OF {parent or table_name} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def default_partition_name(table_name: str) -> str:
+    return f"{table_name}_default"
+
+
+def default_partition_ddl(table_name: str, parent: Optional[str] = None) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {default_partition_name(table_name)} "
+        f"PARTITION OF {parent or table_name} DEFAULT"
+    )
+
+
+def default_partition_constraint_name(table_name: str) -> str:
+    return f"{default_partition_name(table_name)}_months"
+
+
+def default_partition_check_ddl(
+    table_name: str, column: str, months: Iterable[datetime], not_valid: bool = False,
+) -> str:
+    """
+    ``ALTER TABLE`` replacing the default partition's CHECK that it has no row
+    in any of ``months``.
+
+    ``months`` must be exactly the monthly partitions attached: a month
+    listed without a partition would reject its rows instead of defaulting
+    them. Consecutive months are merged into one range.
+    """
+    ranges: List[List[datetime]] = []
+    for month in sorted(set(month_start(m) for m in months)):
+        if ranges and ranges[-1][1] == month:
+            ranges[-1][1] = add_months(month, 1)
+        else:
+            ranges.append([month, add_months(month, 1)])
+
+    name = default_partition_constraint_name(table_name)
+    ddl = f"ALTER TABLE {default_partition_name(table_name)} DROP CONSTRAINT IF EXISTS {name}"
+    if not ranges:
+        return ddl
+    check = " AND ".join(
+        f"NOT ({column} >= '{lower.isoformat()}' AND {column} < '{upper.isoformat()}')" for lower, upper in ranges
+    )
+    return f"{ddl}, ADD CONSTRAINT {name} CHECK ({check}){' NOT VALID' if not_valid else ''}"
+
+
+# Months created ahead of the current one by create_all and the migration
+MONTHS_AHEAD = 3
+
+
+def _create_monthly_partitions(column: str, target: Table, connection, **kw) -> None:
+    current = month_start(datetime.now(timezone.utc))
+    months = [add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)]
+    connection.execute(DDL(default_partition_ddl(target.name)))
+    for month in months:
+        connection.execute(DDL(monthly_partition_ddl(target.name, month)))
+    connection.execute(DDL(default_partition_check_ddl(target.name, column, months)))
+
+
+def monthly_partitioned(column: str) -> dict:
+    """``Table`` keyword arguments for a table range-partitioned by month on ``column``."""
+    return dict(
+        postgresql_partition_by=f"RANGE ({column})",
+        listeners=[("after_create", partial(_create_monthly_partitions, column))],
+    )
@@ -1,11 +1,17 @@
 from sqlalchemy import (
-    Table, Column, Integer, String, Text, TIMESTAMP, Index, Float, ForeignKey, BigInteger, Enum as PgEnum,
-    UniqueConstraint
+    Table, Column, Integer, String, Text, TIMESTAMP, Index, ForeignKey, BigInteger, Enum as PgEnum,
+    UniqueConstraint, ForeignKeyConstraint
 )
-from sqlalchemy.dialects.postgresql import JSONB, UUID, ARRAY
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func, text
 from sqlalchemy import Boolean
 from neutrino_database.models.base import metadata
+from neutrino_database.models.notify import (
+    READY_FOR_INGESTION, logs_membership_changes, notifies_key_changes, notifies_ready_jobs,
+    notifies_tenant_changes, notifies_tenant_identity_changes,
+)
+from neutrino_database.models.partitions import monthly_partitioned, tenant_partitioned
+from neutrino_database.models.types import DenseVector, SparseVector
 
 from neutrino_database.models.enums import ConnectionStatus, KeyStatusEnum, TenantStatusEnum, AllowedModuleEnum, \
     UserStatusEnum, IdpProviderEnum, MemberSourceEnum, MessageRoleEnum, WorkspaceStatusEnum, WorkspaceAccessStatusEnum
@@ -41,6 +47,8 @@ files = Table(
     Column("is_deleted", Boolean, nullable=False, server_default=text("false")),
 
     Column("permission_mirroring_status", String(50), nullable=False, server_default=text("'NOT INITIATED'")),
+
+    Index("ix_files_workspace", "workspace_id"),
 )
 
 
@@ -56,6 +64,8 @@ datasources = Table(
     Column("config", JSONB, nullable=True),
     Column("created_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
     Column("updated_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()),
+
+    Index("ix_datasources_workspace", "workspace_id"),
 )
 
 
@@ -81,6 +91,13 @@ ingestion_jobs = Table(
     Column("created_by", String, nullable=False),
     Column("is_deleted", Boolean, nullable=False, server_default=text("false")),
 
+    Index("ix_ingestion_jobs_file", "file_id"),
+    # Ready jobs in arrival order, see neutrino_database.jobs
+    Index(
+        "ix_ingestion_jobs_ready", "created_at",
+        postgresql_where=text(f"overall_status = '{READY_FOR_INGESTION}' AND is_deleted = false"),
+    ),
+    **notifies_ready_jobs(),
 )
 
 parsing = Table(
@@ -88,7 +105,7 @@ parsing = Table(
     metadata,
 
     Column("id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
-    Column("tenant_id", UUID(as_uuid=False),ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
+    Column("tenant_id", UUID(as_uuid=False),ForeignKey("tenant.id", ondelete="CASCADE"), primary_key=True),
     Column("file_id", UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
     Column("workspace_id", UUID(as_uuid=False), ForeignKey("workspace.id", ondelete="CASCADE"), nullable=False),
 
@@ -99,7 +116,8 @@ parsing = Table(
     Column("created_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
     Column("updated_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()),
 
-    Index("idx_parsing_file_page", "file_id", "page_no", unique=True)
+    Index("idx_parsing_file_page", "tenant_id", "file_id", "page_no", unique=True),
+    **tenant_partitioned(),
 )
 
 chunk = Table(
@@ -108,7 +126,7 @@ chunk = Table(
 
     # Identifiers
     Column("id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
-    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
+    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), primary_key=True),
     Column("file_id", UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
     Column("workspace_id", UUID(as_uuid=False), ForeignKey("workspace.id", ondelete="CASCADE"), nullable=False),
 
@@ -119,33 +137,58 @@ chunk = Table(
 
     Column("created_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
 
-    Index("idx_chunk_file_page_hash", "file_id", "page_no", "chunk_hash", unique=True)
+    Index("idx_chunk_file_page_hash", "tenant_id", "file_id", "page_no", "chunk_hash", unique=True),
+    **tenant_partitioned(),
+)
+
+embedding_vector = Table(
+    "embedding_vector",
+    metadata,
+
+    # Content address: one row per (tenant_id, model, chunk_hash), shared by
+    # every file of the tenant containing that chunk
+    Column("id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
+    Column("model", String(100), nullable=False, server_default=text("''")),
+    Column("chunk_hash", String, nullable=False),
+
+    # Dense vector - float32, pgvector `vector` or packed bytea (see models.types)
+    Column("dense_vector", DenseVector(), nullable=True),
+    Column("dense_dim", Integer, nullable=False),
+
+    # Sparse vector - packed int4 indices + float4 values (see models.types)
+    Column("sparse_vector", SparseVector(), nullable=True),
+    Column("sparse_dim", Integer, nullable=True),
+
+    Column("created_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
+
+    Index("idx_embedding_vector_tenant_model_hash", "tenant_id", "model", "chunk_hash", unique=True),
+    # ANN indexes on dense_vector are created by migration only (see neutrino_database.search)
 )
 
+
 embedding = Table(
     "embedding",
     metadata,
 
     # Identifiers
     Column("id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
-    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
+    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), primary_key=True),
     Column("file_id", UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
     Column("chunk_hash", String, nullable=False),
     Column("workspace_id", UUID(as_uuid=False), ForeignKey("workspace.id", ondelete="CASCADE"), nullable=False),
 
-    # Dense vector - simple float array
-    Column("dense_vector", ARRAY(Float), nullable=True),
-    Column("dense_dim", Integer, nullable=False),
-
-    # Sparse vector - JSONB with indices/values
-    Column("sparse_vector", JSONB, nullable=True),
-    Column("sparse_dim", Integer, nullable=True),
+    # Shared vectors (see embedding_vector)
+    Column("vector_id", UUID(as_uuid=True), ForeignKey("embedding_vector.id"), nullable=False),
 
     # Metadata
     Column("model", String(100), nullable=True),
     Column("created_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
 
-    Index("idx_embedding_tenant_file_chunk_unique", "tenant_id", "file_id", "chunk_hash", unique=True)
+    Index("idx_embedding_tenant_file_chunk_unique", "tenant_id", "file_id", "chunk_hash", unique=True),
+    Index("ix_embedding_tenant_workspace", "tenant_id", "workspace_id"),
+    Index("ix_embedding_vector_id", "vector_id"),
+    **tenant_partitioned(),
 )
 
 
@@ -153,15 +196,27 @@ index_sync = Table(
     "index_sync",
     metadata,
     Column("doc_id", UUID(as_uuid=True), primary_key=True),
-    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
+    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), primary_key=True),
     Column("file_id", UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
-    Column("chunk_id", UUID(as_uuid=True), ForeignKey("chunk.id", ondelete="CASCADE"), nullable=False),
+    Column("chunk_id", UUID(as_uuid=True), nullable=False),
     Column("workspace_id", UUID(as_uuid=False), ForeignKey("workspace.id", ondelete="CASCADE"), nullable=False),
 
     Column("chunk_hash", Text, nullable=False),
     Column("ack_at", TIMESTAMP(timezone=True), nullable=True),
     Column("last_error", Text, nullable=True),
-    Column("attempt_count", Integer, nullable=False, server_default=text("0"))
+    Column("attempt_count", Integer, nullable=False, server_default=text("0")),
+    # Claimable from then on: lease expiry while claimed, retry time after a failure
+    # (see neutrino_database.index_queue)
+    Column("available_at", TIMESTAMP(timezone=True), nullable=False, server_default=func.now()),
+
+    ForeignKeyConstraint(
+        ["chunk_id", "tenant_id"], ["chunk.id", "chunk.tenant_id"],
+        name="index_sync_chunk_id_fkey", ondelete="CASCADE",
+    ),
+    Index("ix_index_sync_tenant_file", "tenant_id", "file_id"),
+    Index("ix_index_sync_tenant_chunk", "tenant_id", "chunk_id"),
+    Index("ix_index_sync_pending", "available_at", postgresql_where=text("ack_at IS NULL")),
+    **tenant_partitioned(),
 )
 
 
@@ -208,6 +263,8 @@ strategies = Table(
     Column("created_by", String, nullable=False),
     Column("updated_by", String, nullable=False),
     Column("is_deleted", Boolean, nullable=False, server_default=text("false")),
+
+    Index("ix_strategies_file", "file_id"),
 )
 
 
@@ -292,6 +349,7 @@ signing_key = Table(
     Column("not_before", TIMESTAMP(timezone=True), nullable=True),
     Column("not_after", TIMESTAMP(timezone=True), nullable=True),
     Column("created_at", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False),
+    **notifies_key_changes(),
 )
 
 tenant_authz_store = Table(
@@ -325,6 +383,7 @@ tenant = Table(
 
     Index("ix_tenant_status", "status"),
     Index("ix_tenant_created_at", "created_at"),
+    **notifies_tenant_changes(),
 )
 
 user = Table(
@@ -360,6 +419,7 @@ tenant_identity = Table(
     Column("created_at", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False),
 
     UniqueConstraint("provider", "provider_org_id", name="ux_tenant_identity_provider_org"),
+    **notifies_tenant_identity_changes(),
 )
 
 sso_identity = Table(
@@ -407,7 +467,7 @@ role = Table(
     metadata,
 
     Column("id", UUID(as_uuid=False), primary_key=True, default=uuid.uuid4),
-    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id"), nullable=False),
+    Column("tenant_id", UUID(as_uuid=False), ForeignKey("tenant.id", ondelete="CASCADE"), nullable=False),
     Column("key", String(120), nullable=False),
     Column("name", String(255), nullable=False),
     Column("description", Text, nullable=True),
@@ -459,7 +519,9 @@ chat = Table(
 
     Index("ix_chat_tenant_incognito", "tenant_id", "incognito"),
     Index("ix_chat_tenant_non_incognito", "tenant_id", postgresql_where=text("incognito = false")),
-    Index("ix_chat_tenant_updated_at", "tenant_id", "updated_at"),
+    # Keyset pagination (see neutrino_database.chats); id breaks updated_at ties
+    Index("ix_chat_tenant_updated_at", "tenant_id", "updated_at", "id"),
+    Index("ix_chat_tenant_user_updated_at", "tenant_id", "created_by", "updated_at", "id"),
     Index("ix_chat_created_by", "tenant_id", "created_by"),
 )
 
@@ -473,13 +535,17 @@ message = Table(
     Column("user_id", UUID(as_uuid=False), ForeignKey("user.id", ondelete="SET NULL"), nullable=True),
     Column("role", PgEnum(MessageRoleEnum, name="message_role"), nullable=False, default=MessageRoleEnum.USER),
     Column("content", Text, nullable=False),
-    Column("created_at", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False),
+    # Partition key (monthly ranges, see models.partitions), hence part of the primary key
+    Column("created_at", TIMESTAMP(timezone=True), server_default=func.now(), primary_key=True),
     Column("updated_at", TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False),
     Column("deleted_at", TIMESTAMP(timezone=True), nullable=True),
 
-    Index("ix_message_chat_created_at", "chat_id", "created_at"),
+    Index("ix_message_chat_created_at", "chat_id", "created_at", "id"),
     Index("ix_message_tenant_chat", "tenant_id", "chat_id"),
+    # Per-tenant retention deletes (see neutrino_database.retention)
+    Index("ix_message_tenant_created_at", "tenant_id", "created_at"),
     Index("ix_message_user_id", "user_id"),
+    **monthly_partitioned("created_at"),
 )
 
 
@@ -517,6 +583,32 @@ workspace_member = Table(
     Index("ix_workspace_member_workspace", "workspace_id"),
     Index("ix_workspace_member_user", "user_id"),
     Index("ix_workspace_member_workspace_admin", "workspace_id", "is_workspace_admin"),
+    **logs_membership_changes(),
+)
+
+# Maintained by the workspace_member / workspace triggers (see models.notify).
+# No foreign keys: rows outlive the workspaces, and the cascade from a
+# deleted tenant, they describe.
+workspace_membership_version = Table(
+    "workspace_membership_version",
+    metadata,
+
+    Column("tenant_id", UUID(as_uuid=False), primary_key=True),
+    Column("version", BigInteger, nullable=False),
+)
+
+workspace_member_change = Table(
+    "workspace_member_change",
+    metadata,
+
+    Column("tenant_id", UUID(as_uuid=False), primary_key=True),
+    Column("version", BigInteger, primary_key=True),
+    Column("workspace_id", UUID(as_uuid=False), nullable=False),
+    # NULL: every member of the workspace removed
+    Column("user_id", UUID(as_uuid=False), nullable=True),
+    # NULL: membership removed
+    Column("is_workspace_admin", Boolean, nullable=True),
+    Column("changed_at", TIMESTAMP(timezone=True), server_default=func.now(), nullable=False),
 )
 
 workspace_access_request = Table(
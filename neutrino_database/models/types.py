@@ -0,0 +1,258 @@
+"""
+Custom column types.
+
+``DenseVector`` stores float32 embeddings either as a pgvector ``vector`` or,
+on servers without the extension, as a packed big-endian float32 ``bytea``
+(the same byte order pgvector uses on the wire). Which one a database uses is
+decided by the migration that creates the column; at runtime both decode to a
+1-D ``numpy.float32`` array. DDL emitted through a connected engine uses the
+storage that connection detected, ``vector`` on a dialect that never connected.
+
+With asyncpg the conversion happens in binary codecs registered on every new
+connection by ``register_vector_support`` (the engines in
+``neutrino_database.db`` do this automatically), so no text round trip is
+involved in either direction.
+
+``SparseVector`` packs sorted int4 indices followed by their float4 values
+(both big-endian) into a ``bytea`` and decodes to ``SparseArrays``.
+"""
+import struct
+from typing import Any, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import LargeBinary, TypeDecorator, UserDefinedType
+
+# Dialect attributes: whether embedding_vector.dense_vector is a pgvector column,
+# and the installed pgvector version as a tuple (None when not installed).
+PGVECTOR_FLAG = "neutrino_pgvector"
+PGVECTOR_VERSION = "neutrino_pgvector_version"
+
+WIRE_DTYPE = np.dtype(">f4")
+INDEX_WIRE_DTYPE = np.dtype(">i4")
+_VECTOR_HEADER = struct.Struct(">HH")
+
+
+class PgVector(UserDefinedType):
+    """DDL-level pgvector type; values are handled by ``DenseVector``."""
+    cache_ok = True
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return "vector" if self.dim is None else f"vector({self.dim})"
+
+
+def as_float32(value: Any) -> np.ndarray:
+    """Coerce a sequence or array to a contiguous 1-D float32 array."""
+    return np.ascontiguousarray(value, dtype=np.float32).reshape(-1)
+
+
+def to_wire(value: Any) -> np.ndarray:
+    """Big-endian float32 view of ``value``; its buffer is the bytea payload."""
+    return np.ascontiguousarray(value, dtype=WIRE_DTYPE).reshape(-1)
+
+
+def from_wire(buf: bytes, offset: int = 0) -> np.ndarray:
+    """Decode packed big-endian float32 bytes into a native float32 array."""
+    return np.frombuffer(buf, dtype=WIRE_DTYPE, offset=offset).astype(np.float32)
+
+
+def to_pgvector_literal(value: Any) -> str:
+    return "[" + ",".join(map(repr, as_float32(value).tolist())) + "]"
+
+
+def from_pgvector_literal(value: str) -> np.ndarray:
+    body = value.strip()[1:-1]
+    if not body:
+        return np.empty(0, dtype=np.float32)
+    return np.array(body.split(","), dtype=np.float32)
+
+
+def encode_pgvector(value: Any) -> bytes:
+    """pgvector binary send format: uint16 dim, uint16 unused, float4[dim]."""
+    arr = to_wire(value)
+    return _VECTOR_HEADER.pack(arr.shape[0], 0) + arr.tobytes()
+
+
+def decode_pgvector(buf: bytes) -> np.ndarray:
+    return from_wire(buf, offset=_VECTOR_HEADER.size)
+
+
+class DenseVector(TypeDecorator):
+    """float32 embedding column (pgvector ``vector`` or packed ``bytea``)."""
+    impl = PgVector
+    cache_ok = True
+
+    def __init__(self, dim: Optional[int] = None):
+        super().__init__(dim)
+        self.dim = dim
+
+    def load_dialect_impl(self, dialect):
+        # DDL and reflection follow the storage the connection detected
+        if getattr(dialect, PGVECTOR_FLAG, True):
+            return dialect.type_descriptor(PgVector(self.dim))
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.driver == "asyncpg":
+            # The connection's codecs turn this into either pgvector's binary
+            # format or, through the buffer protocol, the bytea payload.
+            return to_wire(value)
+        if getattr(dialect, PGVECTOR_FLAG, True):
+            return to_pgvector_literal(value)
+        return to_wire(value).tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            return from_pgvector_literal(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return from_wire(value)
+        return as_float32(value)
+
+
+class SparseArrays(NamedTuple):
+    """Decoded sparse vector: sorted int32 ``indices`` and float32 ``values``."""
+    indices: np.ndarray
+    values: np.ndarray
+
+
+def as_sparse(value: Any) -> SparseArrays:
+    """
+    Coerce a sparse vector to ``SparseArrays`` sorted by index.
+
+    Accepts ``SparseArrays`` or any ``(indices, values)`` pair, a mapping with
+    ``indices``/``values`` keys (the former JSONB layout) or an object with
+    ``indices`` and ``values``/``data`` attributes.
+    """
+    if isinstance(value, dict):
+        indices, values = value["indices"], value["values"]
+    elif hasattr(value, "indices") and not isinstance(value, tuple):
+        indices = value.indices
+        values = value.values if hasattr(value, "values") else value.data
+    else:
+        indices, values = value
+    indices = np.asarray(indices, dtype=np.int32).reshape(-1)
+    values = np.asarray(values, dtype=np.float32).reshape(-1)
+    if indices.shape != values.shape:
+        raise ValueError("Sparse vector indices and values differ in length")
+    if indices.size > 1 and np.any(indices[1:] < indices[:-1]):
+        order = np.argsort(indices, kind="stable")
+        indices, values = indices[order], values[order]
+    return SparseArrays(indices, values)
+
+
+def pack_sparse(value: Any) -> bytes:
+    """int4[nnz] indices then float4[nnz] values, big-endian."""
+    sparse = as_sparse(value)
+    return sparse.indices.astype(INDEX_WIRE_DTYPE).tobytes() + sparse.values.astype(WIRE_DTYPE).tobytes()
+
+
+def unpack_sparse(buf: bytes) -> SparseArrays:
+    nnz = len(buf) // 8
+    indices = np.frombuffer(buf, dtype=INDEX_WIRE_DTYPE, count=nnz).astype(np.int32)
+    values = np.frombuffer(buf, dtype=WIRE_DTYPE, count=nnz, offset=4 * nnz).astype(np.float32)
+    return SparseArrays(indices, values)
+
+
+def sparse_to_csr(vectors: Iterable[Optional[SparseArrays]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stack sparse vectors into CSR ``(indptr, indices, data)`` arrays.
+
+    ``None`` entries become empty rows. The result can be passed straight to
+    ``scipy.sparse.csr_matrix((data, indices, indptr), shape=(n, dim))``.
+    """
+    vectors = list(vectors)
+    lengths = np.fromiter((0 if v is None else v.indices.shape[0] for v in vectors), dtype=np.int64, count=len(vectors))
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.empty(indptr[-1], dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        if vector is not None:
+            indices[indptr[row]:indptr[row + 1]] = vector.indices
+            data[indptr[row]:indptr[row + 1]] = vector.values
+    return indptr, indices, data
+
+
+class SparseVector(TypeDecorator):
+    """Sparse embedding column packed into ``bytea`` (see ``pack_sparse``)."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return pack_sparse(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return unpack_sparse(value)
+
+
+# Schema and version of the pgvector extension (NULL when not installed), and
+# whether dense_vector was migrated to it rather than to bytea; without the
+# column yet, whether the extension is there. The column lives on
+# embedding_vector since 2b8f0d6c4e13 and on embedding before that.
+_DETECT_SQL = (
+    "SELECT n.nspname, x.extversion, "
+    "COALESCE((SELECT format_type(a.atttypid, NULL) = 'vector' FROM pg_attribute a "
+    " WHERE a.attrelid = COALESCE(to_regclass('embedding_vector'), to_regclass('embedding')) "
+    " AND a.attname = 'dense_vector' AND NOT a.attisdropped), x.extversion IS NOT NULL) "
+    "FROM (SELECT 1) AS one "
+    "LEFT JOIN pg_extension x ON x.extname = 'vector' "
+    "LEFT JOIN pg_namespace n ON n.oid = x.extnamespace"
+)
+
+
+def _parse_version(version: Optional[str]) -> Optional[tuple]:
+    if not version:
+        return None
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+def _on_connect(dialect, dbapi_connection, connection_record):
+    if dialect.driver == "asyncpg":
+        async def _register(conn):
+            schema, version, uses_pgvector = await conn.fetchrow(_DETECT_SQL)
+            if schema is not None:
+                await conn.set_type_codec(
+                    "vector",
+                    schema=schema,
+                    encoder=encode_pgvector,
+                    decoder=decode_pgvector,
+                    format="binary",
+                )
+            return version, uses_pgvector
+
+        version, uses_pgvector = dbapi_connection.run_async(_register)
+    else:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(_DETECT_SQL)
+            _, version, uses_pgvector = cursor.fetchone()
+        finally:
+            cursor.close()
+            # Leave no transaction open so isolation level can still be set.
+            dbapi_connection.rollback()
+    setattr(dialect, PGVECTOR_FLAG, uses_pgvector)
+    setattr(dialect, PGVECTOR_VERSION, _parse_version(version))
+
+
+def register_vector_support(engine: Engine) -> None:
+    """
+    Detect pgvector and install the vector codecs on every new connection.
+
+    Accepts a sync ``Engine``; pass ``async_engine.sync_engine`` for asyncpg.
+    """
+    def listener(dbapi_connection, connection_record):
+        _on_connect(engine.dialect, dbapi_connection, connection_record)
+
+    event.listen(engine, "connect", listener)
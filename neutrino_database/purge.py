@@ -0,0 +1,321 @@
+"""
+Background deletion of tenants, workspaces and files.
+
+Deleting a tenant through the ORM (or a single ``DELETE`` relying on
+``ON DELETE CASCADE``) removes millions of ``chunk``/``embedding``/``parsing``
+rows in one transaction: locks are held for minutes, a huge burst of WAL
+reaches the replicas at once and nothing survives a failure halfway. A purge
+instead runs in two phases:
+
+1. ``mark_*_deleted`` soft-deletes the root row (``deleted_at`` / ``status``
+   for tenants and workspaces, ``is_deleted`` for files) in one short
+   transaction, so readers stop seeing it immediately.
+2. ``Purger`` removes the dependent rows children first, ``batch_size`` rows
+   per transaction, and finally the root row itself. Before every batch it
+   waits while replication lag exceeds ``max_replication_lag``.
+
+Every step only deletes rows that still exist, so an interrupted purge is
+resumed by simply running it again. Progress is reported after each batch
+through the ``on_progress`` callback. A batch that cannot get its locks
+within ``DB_MAINTENANCE_LOCK_TIMEOUT`` is retried after a pause rather than
+letting writers queue behind it.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, exists, func, select, text, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from neutrino_database import db
+from neutrino_database.config import settings
+from neutrino_database.models import tables
+from neutrino_database.models.enums import TenantStatusEnum, WorkspaceStatusEnum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_MAX_REPLICATION_LAG = timedelta(seconds=10)
+LAG_POLL_INTERVAL = 1.0
+
+LOCK_NOT_AVAILABLE = "55P03"
+# Attempts per batch on a lock timeout; the pause between them starts at
+# LOCK_RETRY_BACKOFF seconds and doubles after every failure
+LOCK_RETRIES = 5
+LOCK_RETRY_BACKOFF = 1.0
+
+# Files fetched per round while purging a workspace
+FILE_PAGE_SIZE = 500
+
+
+@dataclass
+class PurgeProgress:
+    # "tenant", "workspace" or "file"
+    scope: str
+    id: str
+    # Table currently being purged
+    step: Optional[str] = None
+    # Rows deleted so far, per table
+    deleted: Dict[str, int] = field(default_factory=dict)
+    # Seconds spent waiting for replicas to catch up
+    throttled: float = 0.0
+    done: bool = False
+
+    @property
+    def total(self) -> int:
+        return sum(self.deleted.values())
+
+
+ProgressCallback = Callable[[PurgeProgress], None]
+
+
+async def mark_tenant_deleted(tenant_id: str, engine: Optional[AsyncEngine] = None) -> bool:
+    """Soft-delete the tenant; False if it does not exist or was already marked."""
+    t = tables.tenant
+    stmt = update(t).where(t.c.id == tenant_id, t.c.deleted_at.is_(None)).values(
+        deleted_at=func.now(), status=TenantStatusEnum.DELETED, status_updated_at=func.now(),
+    )
+    async with (engine or db.get_engine()).begin() as conn:
+        return (await conn.execute(stmt)).rowcount > 0
+
+
+async def mark_workspace_deleted(workspace_id: str, engine: Optional[AsyncEngine] = None) -> bool:
+    """Soft-delete the workspace; False if it does not exist or was already marked."""
+    w = tables.workspace
+    stmt = update(w).where(w.c.id == workspace_id, w.c.deleted_at.is_(None)).values(
+        deleted_at=func.now(), status=WorkspaceStatusEnum.DELETED,
+    )
+    async with (engine or db.get_engine()).begin() as conn:
+        return (await conn.execute(stmt)).rowcount > 0
+
+
+async def mark_file_deleted(file_id: str, engine: Optional[AsyncEngine] = None) -> bool:
+    """Soft-delete the file; False if it does not exist or was already marked."""
+    f = tables.files
+    stmt = update(f).where(f.c.id == file_id, f.c.is_deleted.is_(False)).values(is_deleted=True)
+    async with (engine or db.get_engine()).begin() as conn:
+        return (await conn.execute(stmt)).rowcount > 0
+
+
+async def replication_lag(conn: AsyncConnection) -> timedelta:
+    """
+    Replay lag of the slowest standby attached to this server.
+
+    Zero without standbys, once they have caught up, and for roles lacking
+    ``pg_monitor`` (which see NULLs in ``pg_stat_replication``).
+    """
+    lag = await conn.scalar(text(
+        "SELECT COALESCE(max(replay_lag), interval '0') FROM pg_stat_replication"
+    ))
+    return lag
+
+
+class Purger:
+    """
+    Batched, throttled deletion of a tenant, workspace or file and everything under it.
+
+    ``pause`` adds a fixed delay (seconds) between batches on top of the
+    replication lag throttle, to cap the WAL rate on clusters without
+    standbys to watch.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_replication_lag: Optional[timedelta] = DEFAULT_MAX_REPLICATION_LAG,
+        pause: float = 0.0,
+        on_progress: Optional[ProgressCallback] = None,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        self.engine = engine or db.get_engine()
+        self.batch_size = batch_size
+        self.max_replication_lag = max_replication_lag
+        self.pause = pause
+        self.on_progress = on_progress
+
+    async def purge_file(self, tenant_id: str, file_id: str) -> PurgeProgress:
+        """Mark the file deleted, then remove its ingestion rows and the file itself."""
+        progress = PurgeProgress("file", str(file_id))
+        await mark_file_deleted(file_id, self.engine)
+        await self._purge_file(progress, tenant_id, file_id)
+        return self._finish(progress)
+
+    async def purge_workspace(self, tenant_id: str, workspace_id: str) -> PurgeProgress:
+        """Mark the workspace deleted, then remove its files, connections, members and itself."""
+        progress = PurgeProgress("workspace", str(workspace_id))
+        await mark_workspace_deleted(workspace_id, self.engine)
+        await self._purge_workspace(progress, tenant_id, workspace_id)
+        return self._finish(progress)
+
+    async def purge_tenant(self, tenant_id: str) -> PurgeProgress:
+        """Mark the tenant deleted, then remove its workspaces, chats, users and itself."""
+        progress = PurgeProgress("tenant", str(tenant_id))
+        await mark_tenant_deleted(tenant_id, self.engine)
+
+        w = tables.workspace
+        workspace_ids = await self._ids(w.c.id, w.c.tenant_id == tenant_id)
+        # As in purge_workspace: once marked, the membership triggers skip
+        # the rows deleted below instead of logging each one
+        for workspace_id in workspace_ids:
+            await mark_workspace_deleted(workspace_id, self.engine)
+        for workspace_id in workspace_ids:
+            await self._purge_workspace(progress, tenant_id, workspace_id)
+
+        m, c, v = tables.message, tables.chat, tables.embedding_vector
+        await self._delete(progress, m, m.c.tenant_id == tenant_id)
+        await self._delete(progress, c, c.c.tenant_id == tenant_id)
+        # Vectors left behind by embeddings deleted outside a purge
+        await self._delete(progress, v, v.c.tenant_id == tenant_id)
+        for table in (tables.user_invitation, tables.tenant_identity, tables.role, tables.tenant_authz_store):
+            await self._delete(progress, table, table.c.tenant_id == tenant_id)
+        # sso_identity and the remaining memberships cascade with each user
+        u = tables.user
+        await self._delete(progress, u, u.c.tenant_id == tenant_id)
+        # Written by the workspace triggers, without a foreign key to cascade
+        for table in (tables.workspace_member_change, tables.workspace_membership_version):
+            await self._delete(progress, table, table.c.tenant_id == tenant_id)
+        t = tables.tenant
+        await self._delete(progress, t, t.c.id == tenant_id)
+        return self._finish(progress)
+
+    async def _purge_file(self, progress: PurgeProgress, tenant_id: str, file_id: str) -> None:
+        s, e = tables.index_sync, tables.embedding
+        # index_sync references chunk, so it goes first
+        await self._delete(progress, s, s.c.tenant_id == tenant_id, s.c.file_id == file_id)
+        await self._delete(
+            progress, e, e.c.tenant_id == tenant_id, e.c.file_id == file_id,
+            returning=e.c.vector_id, cleanup=self._prune_vectors(progress, tenant_id),
+        )
+        for table in (tables.chunk, tables.parsing):
+            await self._delete(progress, table, table.c.tenant_id == tenant_id, table.c.file_id == file_id)
+        for table in (tables.strategies, tables.ingestion_jobs):
+            await self._delete(progress, table, table.c.file_id == file_id)
+        f = tables.files
+        await self._delete(progress, f, f.c.id == file_id)
+
+    async def _purge_workspace(self, progress: PurgeProgress, tenant_id: str, workspace_id: str) -> None:
+        f = tables.files
+        while True:
+            file_ids = await self._ids(f.c.id, f.c.workspace_id == workspace_id, limit=FILE_PAGE_SIZE)
+            for file_id in file_ids:
+                await self._purge_file(progress, tenant_id, file_id)
+            if len(file_ids) < FILE_PAGE_SIZE:
+                break
+
+        conn_table, cred = tables.connections, tables.credentials
+        await self._delete(progress, cred, cred.c.connection_id.in_(
+            select(conn_table.c.id).where(conn_table.c.workspace_id == workspace_id)
+        ))
+        for table in (
+            conn_table, tables.datasources, tables.workspace_member,
+            tables.workspace_access_request, tables.workspace_invitation,
+        ):
+            await self._delete(progress, table, table.c.workspace_id == workspace_id)
+        w = tables.workspace
+        await self._delete(progress, w, w.c.id == workspace_id)
+
+    def _prune_vectors(self, progress: PurgeProgress, tenant_id: str):
+        """Delete the given vectors once no embedding of the tenant links them anymore."""
+        e, v = tables.embedding, tables.embedding_vector
+
+        async def cleanup(conn: AsyncConnection, vector_ids: List) -> Tuple[Table, int]:
+            orphans = select(v.c.id).where(
+                v.c.tenant_id == tenant_id,
+                v.c.id.in_(set(vector_ids)),
+                ~exists().where(e.c.tenant_id == tenant_id, e.c.vector_id == v.c.id),
+            ).with_for_update(skip_locked=True)
+            result = await conn.execute(v.delete().where(v.c.id.in_(orphans)))
+            return v, result.rowcount
+
+        return cleanup
+
+    async def _ids(self, column, *where, limit: Optional[int] = None) -> List:
+        stmt = select(column).where(*where).order_by(column)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        async with self.engine.connect() as conn:
+            return list((await conn.execute(stmt)).scalars())
+
+    async def _delete(self, progress: PurgeProgress, table: Table, *where, returning=None, cleanup=None) -> None:
+        """
+        Delete the rows of ``table`` matching ``where``, one committed batch at a time.
+
+        With ``returning``, ``cleanup(conn, values)`` runs in each batch's
+        transaction with the returned column values and returns the table it
+        deleted from and how many rows, counted once the batch has committed.
+        """
+        progress.step = table.name
+        key = tuple_(*table.primary_key.columns)
+        while True:
+            await self._throttle(progress)
+            batch = select(*table.primary_key.columns).where(*where).limit(self.batch_size)
+            stmt = table.delete().where(key.in_(batch))
+            deleted, cleaned = await self._delete_batch(stmt, returning, cleanup)
+            self._count(progress, table, deleted)
+            if cleaned is not None:
+                self._count(progress, *cleaned)
+            if deleted < self.batch_size:
+                return
+            if self.pause:
+                await asyncio.sleep(self.pause)
+
+    async def _delete_batch(self, stmt, returning, cleanup) -> Tuple[int, Optional[Tuple[Table, int]]]:
+        """Run one batch of ``_delete`` in its own transaction, retrying it on a lock timeout."""
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(text(f"SET LOCAL lock_timeout = '{settings.DB_MAINTENANCE_LOCK_TIMEOUT}'"))
+                    if returning is None:
+                        return (await conn.execute(stmt)).rowcount, None
+                    values = list((await conn.execute(stmt.returning(returning))).scalars())
+                    cleaned = await cleanup(conn, values) if values else None
+                    return len(values), cleaned
+            except DBAPIError as exc:
+                if getattr(exc.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE or attempt == LOCK_RETRIES:
+                    raise
+                pause = LOCK_RETRY_BACKOFF * 2 ** (attempt - 1)
+                logger.warning("Lock not available (attempt %d of %d), retrying in %.0fs", attempt, LOCK_RETRIES, pause)
+                await asyncio.sleep(pause)
+
+    async def _throttle(self, progress: PurgeProgress) -> None:
+        if self.max_replication_lag is None:
+            return
+        while True:
+            async with self.engine.connect() as conn:
+                lag = await replication_lag(conn)
+            if lag <= self.max_replication_lag:
+                return
+            await asyncio.sleep(LAG_POLL_INTERVAL)
+            progress.throttled += LAG_POLL_INTERVAL
+
+    def _count(self, progress: PurgeProgress, table: Table, deleted: int) -> None:
+        progress.deleted[table.name] = progress.deleted.get(table.name, 0) + deleted
+        if self.on_progress is not None:
+            self.on_progress(progress)
+
+    def _finish(self, progress: PurgeProgress) -> PurgeProgress:
+        progress.step = None
+        progress.done = True
+        if self.on_progress is not None:
+            self.on_progress(progress)
+        return progress
+
+
+async def purge_tenant(tenant_id: str, **options) -> PurgeProgress:
+    """``Purger(**options).purge_tenant(tenant_id)``."""
+    return await Purger(**options).purge_tenant(tenant_id)
+
+
+async def purge_workspace(tenant_id: str, workspace_id: str, **options) -> PurgeProgress:
+    """``Purger(**options).purge_workspace(tenant_id, workspace_id)``."""
+    return await Purger(**options).purge_workspace(tenant_id, workspace_id)
+
+
+async def purge_file(tenant_id: str, file_id: str, **options) -> PurgeProgress:
+    """``Purger(**options).purge_file(tenant_id, file_id)``."""
+    return await Purger(**options).purge_file(tenant_id, file_id)
@@ -0,0 +1,173 @@
+"""
+Hot-path statements, built once per process.
+
+A ``select()`` built per call is not free to run: every call constructs the
+expression tree and derives its cache key before the compiled SQL is found
+in the engine's compiled cache. The statements here are built at import
+with named ``bindparam`` placeholders, so their cache key is computed once
+(statements memoize it) and each call only passes the values::
+
+    stmt, params = queries.tenant_by_org(org_external_id)
+    row = (await conn.execute(stmt, params)).first()
+    # or: await session.execute(*queries.chat_page(...))
+
+The rendered SQL is byte-for-byte stable, so asyncpg's per-connection
+prepared statement cache (``DB_STATEMENT_CACHE_SIZE``) hits every time;
+every variant below is one entry. ``python benchmarks/queries.py``
+measures the per-call overhead saved.
+
+``lambda_stmt`` would avoid rebuilding as well, but executed through an ORM
+``Session`` it re-resolves (clones) the statement on every call and ends up
+slower than a plain ``select()``.
+
+Statements take already validated values (decoded cursors, exact row
+counts); ``chats``, ``index_queue`` and ``tenants`` build on them. Never
+``.params()`` or extend the shared statements per call: that copies them and
+loses the memoized cache key.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Interval, Select, Update, bindparam, func, select, tuple_, update
+from sqlalchemy.sql import Executable
+
+from neutrino_database.models import tables
+from neutrino_database.models.enums import IdpProviderEnum
+from neutrino_database.models.orm import Chat, Message, User
+
+# (timestamp, id) of the last row seen, as decoded from a page cursor
+Position = Tuple[datetime, str]
+Bound = Tuple[Executable, Dict[str, Any]]
+
+_tenant, _identity = tables.tenant, tables.tenant_identity
+_member, _sync = tables.workspace_member, tables.index_sync
+
+TENANT_COLUMNS = (
+    _tenant.c.id, _tenant.c.name, _tenant.c.org_external_id, _tenant.c.status,
+    _tenant.c.allowed_modules, _tenant.c.deleted_at,
+)
+SYNC_TASK_COLUMNS = (
+    _sync.c.doc_id, _sync.c.tenant_id, _sync.c.file_id, _sync.c.chunk_id, _sync.c.workspace_id,
+    _sync.c.chunk_hash, _sync.c.attempt_count, _sync.c.last_error, _sync.c.available_at,
+)
+
+TENANT_BY_ID = select(*TENANT_COLUMNS).where(_tenant.c.id == bindparam("tenant_id"))
+TENANT_BY_ORG = select(*TENANT_COLUMNS).where(_tenant.c.org_external_id == bindparam("org_external_id"))
+TENANT_BY_IDENTITY = (
+    select(*TENANT_COLUMNS)
+    .join(_identity, _identity.c.tenant_id == _tenant.c.id)
+    .where(_identity.c.provider == bindparam("provider"), _identity.c.provider_org_id == bindparam("provider_org_id"))
+)
+
+USER_BY_EMAIL = select(User).where(User.tenant_id == bindparam("tenant_id"), User.email == bindparam("email"))
+
+WORKSPACE_MEMBERSHIP = select(_member.c.is_workspace_admin).where(
+    _member.c.workspace_id == bindparam("workspace_id"), _member.c.user_id == bindparam("user_id"),
+)
+USER_WORKSPACES = select(_member.c.workspace_id, _member.c.is_workspace_admin).where(
+    _member.c.user_id == bindparam("user_id"),
+)
+
+
+def _chat_page(by_user: bool, paged: bool) -> Select:
+    stmt = select(Chat).where(Chat.tenant_id == bindparam("tenant_id"), Chat.deleted_at.is_(None))
+    if by_user:
+        stmt = stmt.where(Chat.created_by == bindparam("user_id"))
+    if paged:
+        stmt = stmt.where(tuple_(Chat.updated_at, Chat.id) < tuple_(
+            bindparam("after_at", type_=Chat.updated_at.type), bindparam("after_id", type_=Chat.id.type),
+        ))
+    return stmt.order_by(Chat.updated_at.desc(), Chat.id.desc()).limit(bindparam("rows"))
+
+
+def _message_page(paged: bool) -> Select:
+    stmt = select(Message).where(Message.chat_id == bindparam("chat_id"), Message.deleted_at.is_(None))
+    if paged:
+        before_at = bindparam("before_at", type_=Message.created_at.type)
+        stmt = stmt.where(
+            tuple_(Message.created_at, Message.id) < tuple_(before_at, bindparam("before_id", type_=Message.id.type)),
+            # Lets Postgres skip the newer monthly partitions
+            Message.created_at <= before_at,
+        )
+    return stmt.order_by(Message.created_at.desc(), Message.id.desc()).limit(bindparam("rows"))
+
+
+def _claim_index_sync(by_tenant: bool) -> Update:
+    claimable = select(_sync.c.doc_id, _sync.c.tenant_id).where(
+        _sync.c.ack_at.is_(None), _sync.c.available_at <= func.now(),
+    )
+    if by_tenant:
+        # UPDATE reserves column names as bind names
+        claimable = claimable.where(_sync.c.tenant_id == bindparam("claim_tenant_id"))
+    claimable = (
+        claimable.order_by(_sync.c.available_at).limit(bindparam("n"))
+        .with_for_update(skip_locked=True).cte("claimable")
+    )
+    return (
+        update(_sync)
+        .where(_sync.c.doc_id == claimable.c.doc_id, _sync.c.tenant_id == claimable.c.tenant_id)
+        .values(
+            attempt_count=_sync.c.attempt_count + 1,
+            available_at=func.now() + bindparam("lease", type_=Interval()),
+        )
+        .returning(*SYNC_TASK_COLUMNS)
+    )
+
+
+# Keyed by (by_user, paged), (paged,) and (by_tenant,)
+CHAT_PAGES = {(by_user, paged): _chat_page(by_user, paged) for by_user in (False, True) for paged in (False, True)}
+MESSAGE_PAGES = {paged: _message_page(paged) for paged in (False, True)}
+CLAIM_INDEX_SYNC = {by_tenant: _claim_index_sync(by_tenant) for by_tenant in (False, True)}
+
+
+def tenant_by_id(tenant_id: str) -> Bound:
+    return TENANT_BY_ID, {"tenant_id": str(tenant_id)}
+
+
+def tenant_by_org(org_external_id: str) -> Bound:
+    return TENANT_BY_ORG, {"org_external_id": org_external_id}
+
+
+def tenant_by_identity(provider: IdpProviderEnum, provider_org_id: str) -> Bound:
+    return TENANT_BY_IDENTITY, {"provider": provider, "provider_org_id": provider_org_id}
+
+
+def user_by_email(tenant_id: str, email: str) -> Bound:
+    """``User`` entity by the ``ux_user_tenant_email`` key."""
+    return USER_BY_EMAIL, {"tenant_id": str(tenant_id), "email": email}
+
+
+def chat_page(tenant_id: str, user_id: Optional[str], after: Optional[Position], rows: int) -> Bound:
+    """``Chat`` entities, most recently updated first, after ``after`` (see ``chats.list_chats``)."""
+    params = {"tenant_id": str(tenant_id), "rows": rows}
+    if user_id is not None:
+        params["user_id"] = str(user_id)
+    if after is not None:
+        params["after_at"], params["after_id"] = after
+    return CHAT_PAGES[user_id is not None, after is not None], params
+
+
+def message_page(chat_id: str, before: Optional[Position], rows: int) -> Bound:
+    """``Message`` entities of a chat, newest first, before ``before`` (see ``chats.list_messages``)."""
+    params = {"chat_id": str(chat_id), "rows": rows}
+    if before is not None:
+        params["before_at"], params["before_id"] = before
+    return MESSAGE_PAGES[before is not None], params
+
+
+def workspace_membership(workspace_id: str, user_id: str) -> Bound:
+    """``is_workspace_admin`` of the membership; no row if the user is not a member."""
+    return WORKSPACE_MEMBERSHIP, {"workspace_id": str(workspace_id), "user_id": str(user_id)}
+
+
+def user_workspaces(user_id: str) -> Bound:
+    """``(workspace_id, is_workspace_admin)`` of every membership of the user."""
+    return USER_WORKSPACES, {"user_id": str(user_id)}
+
+
+def claim_index_sync(n: int, lease: timedelta, tenant_id: Optional[str] = None) -> Bound:
+    """The ``index_queue.claim_batch`` statement, returning ``SYNC_TASK_COLUMNS``."""
+    params = {"n": n, "lease": lease}
+    if tenant_id is not None:
+        params["claim_tenant_id"] = str(tenant_id)
+    return CLAIM_INDEX_SYNC[tenant_id is not None], params
@@ -0,0 +1,253 @@
+"""
+Partition maintenance and retention for ``message``.
+
+``message`` is range-partitioned by month on ``created_at`` (see
+``neutrino_database.models.partitions``). Two jobs keep it healthy:
+
+* ``ensure_message_partitions`` creates the partitions for the coming months
+  so new rows never land in the default partition. Run it periodically (for
+  example daily from the worker) or call ``run_message_maintenance``. Rows
+  that did land there for a month it creates (the job ran late) are moved
+  into the new partition and logged.
+* ``apply_message_retention`` removes history past each tenant's retention
+  window. Months older than every tenant's window are dropped (or detached
+  for archiving) as a whole, which is a catalog operation instead of a
+  ``DELETE`` over millions of rows. Tenants with a shorter window than the
+  longest one have their remaining expired rows deleted in small batches.
+
+Recent-chat reads should bound ``created_at`` from below so the planner only
+visits the newest partitions.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from neutrino_database import db
+from neutrino_database.config import settings
+from neutrino_database.models import tables
+from neutrino_database.models.partitions import (
+    MONTHS_AHEAD, add_months, default_partition_check_ddl, default_partition_name, month_start,
+    monthly_partition_ddl, monthly_partition_name, partition_month,
+)
+
+DEFAULT_DELETE_BATCH_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MessagePartition:
+    """One monthly partition of ``message``; rows have ``lower <= created_at < upper``."""
+    name: str
+    lower: datetime
+    upper: datetime
+
+
+@dataclass
+class RetentionResult:
+    # Partitions dropped (or detached) as a whole
+    partitions: List[str] = field(default_factory=list)
+    # Rows deleted individually, per tenant
+    deleted: Dict[str, int] = field(default_factory=dict)
+
+
+async def list_message_partitions(conn: AsyncConnection) -> List[MessagePartition]:
+    """Monthly partitions currently attached to ``message``, oldest first."""
+    rows = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'message'::regclass"
+    ))
+    partitions = []
+    for (name,) in rows:
+        month = partition_month(name)
+        if month is not None:
+            partitions.append(MessagePartition(name, month, add_months(month, 1)))
+    return sorted(partitions, key=lambda p: p.lower)
+
+
+async def _has_default_partition(conn: AsyncConnection) -> bool:
+    return bool(await conn.scalar(text(
+        "SELECT partdefid <> 0 FROM pg_partitioned_table WHERE partrelid = 'message'::regclass"
+    )))
+
+
+async def _create_message_partition(conn: AsyncConnection, month: datetime, months: List[datetime]) -> int:
+    """
+    Create the partition for ``month`` next to the default partition.
+
+    Creating it while the default is attached would fail once the default
+    holds a row of that month, and scan the default under an exclusive lock
+    otherwise. Instead the default is detached, the month created and its
+    rows moved out of the default, and the default re-attached with its CHECK
+    extended to ``months`` (every monthly partition, this one included) so
+    the attach does not scan it again. Returns the rows moved.
+    """
+    default = default_partition_name("message")
+    await conn.execute(text(f"ALTER TABLE message DETACH PARTITION {default}"))
+    await conn.execute(text(monthly_partition_ddl("message", month)))
+    columns = ", ".join(c.name for c in tables.message.columns)
+    moved = await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :lower AND created_at < :upper "
+        f"RETURNING {columns}) "
+        f"INSERT INTO {monthly_partition_name('message', month)} ({columns}) SELECT {columns} FROM moved"
+    ), {"lower": month, "upper": add_months(month, 1)})
+    await conn.execute(text(default_partition_check_ddl("message", "created_at", months)))
+    await conn.execute(text(f"ALTER TABLE message ATTACH PARTITION {default} DEFAULT"))
+    return moved.rowcount
+
+
+async def ensure_message_partitions(
+    engine: Optional[AsyncEngine] = None,
+    months_ahead: int = MONTHS_AHEAD,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Create any missing partitions up to ``months_ahead`` months from now; return their names.
+
+    Rows of a new month found in the default partition are moved into it and
+    logged as a warning.
+    """
+    engine = engine or db.get_engine()
+    current = month_start(now or datetime.now(timezone.utc))
+
+    async with engine.begin() as conn:
+        months = [p.lower for p in await list_message_partitions(conn)]
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in months:
+            continue
+        months.append(month)
+        name = monthly_partition_name("message", month)
+        # Each partition takes a short exclusive lock on message; one
+        # transaction per partition keeps each lock as brief as possible.
+        async with engine.begin() as conn:
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{settings.DB_MAINTENANCE_LOCK_TIMEOUT}'"))
+            if await _has_default_partition(conn):
+                moved = await _create_message_partition(conn, month, months)
+                if moved:
+                    logger.warning("Moved %d rows of %s out of the default message partition", moved, name)
+            else:
+                await conn.execute(text(monthly_partition_ddl("message", month)))
+        created.append(name)
+    return created
+
+
+async def drop_message_partitions(
+    older_than: datetime,
+    engine: Optional[AsyncEngine] = None,
+    detach: bool = False,
+) -> List[str]:
+    """
+    Drop every monthly partition whose rows are all older than ``older_than``.
+
+    With ``detach=True`` the partitions are only detached and stay behind as
+    plain tables (same name) for archiving. Returns the affected names.
+    """
+    engine = engine or db.get_engine()
+    async with engine.begin() as conn:
+        partitions = await list_message_partitions(conn)
+    expired = [p for p in partitions if p.upper <= older_than]
+    months = [p.lower for p in partitions]
+
+    for partition in expired:
+        months.remove(partition.lower)
+        async with engine.begin() as conn:
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{settings.DB_MAINTENANCE_LOCK_TIMEOUT}'"))
+            if detach:
+                await conn.execute(text(f"ALTER TABLE message DETACH PARTITION {partition.name}"))
+            else:
+                await conn.execute(text(f"DROP TABLE {partition.name}"))
+            if await _has_default_partition(conn):
+                # The default must accept that month's rows again. Narrowing
+                # the CHECK holds for every existing row, so it needs no scan.
+                await conn.execute(text(default_partition_check_ddl("message", "created_at", months, not_valid=True)))
+    return [p.name for p in expired]
+
+
+async def delete_tenant_messages(
+    tenant_id: str,
+    older_than: datetime,
+    engine: Optional[AsyncEngine] = None,
+    batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    not_before: Optional[datetime] = None,
+) -> int:
+    """
+    Delete the tenant's messages created before ``older_than`` in small batches.
+
+    Each batch commits on its own so no long transaction holds back vacuum.
+    Batches are found through ``ix_message_tenant_created_at``; ``not_before``
+    bounds the scan from below (rows older than it are assumed gone already)
+    so only the partitions in between are visited.
+    """
+    engine = engine or db.get_engine()
+    m = tables.message
+    where = [m.c.tenant_id == tenant_id, m.c.created_at < older_than]
+    if not_before is not None:
+        where.append(m.c.created_at >= not_before)
+
+    deleted = 0
+    while True:
+        batch = select(m.c.id, m.c.created_at).where(*where).limit(batch_size)
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                m.delete().where(tuple_(m.c.id, m.c.created_at).in_(batch))
+            )
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+async def apply_message_retention(
+    retention: Mapping[str, timedelta],
+    default: Optional[timedelta] = None,
+    engine: Optional[AsyncEngine] = None,
+    now: Optional[datetime] = None,
+    detach: bool = False,
+    batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+) -> RetentionResult:
+    """
+    Enforce per-tenant retention windows on ``message``.
+
+    ``retention`` maps tenant ids to their window; tenants not listed use
+    ``default``, and ``default=None`` means they keep everything, in which
+    case no partition is ever dropped. Whole months are dropped (or detached)
+    once they are past every window; what is left is deleted per listed
+    tenant. Tenants on ``default`` are only trimmed by whole months once a
+    month is past every window; list a tenant to enforce its window exactly.
+    """
+    engine = engine or db.get_engine()
+    now = now or datetime.now(timezone.utc)
+    result = RetentionResult()
+
+    if default is not None:
+        longest = max([default, *retention.values()])
+        cutoff = now - longest
+        result.partitions = await drop_message_partitions(cutoff, engine, detach)
+        floor = month_start(cutoff)
+    else:
+        floor = None
+
+    for tenant_id, window in retention.items():
+        older_than = now - window
+        if floor is not None and older_than <= floor:
+            continue
+        result.deleted[tenant_id] = await delete_tenant_messages(
+            tenant_id, older_than, engine, batch_size, not_before=floor,
+        )
+    return result
+
+
+async def run_message_maintenance(
+    retention: Mapping[str, timedelta],
+    default: Optional[timedelta] = None,
+    engine: Optional[AsyncEngine] = None,
+) -> RetentionResult:
+    """Create upcoming partitions, then apply retention; meant for a periodic job."""
+    await ensure_message_partitions(engine)
+    return await apply_message_retention(retention, default, engine)
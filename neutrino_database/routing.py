@@ -0,0 +1,245 @@
+"""
+Read-replica routing for sessions.
+
+Sessions from ``get_routing_sessionmaker`` (or ``routing_session_scope``)
+send reads to a replica from ``DATABASE_REPLICA_URLS`` and everything else to
+the primary (``RoutingSession.get_bind``):
+
+* plain ``SELECT`` statements, lazy loads and ``session.get`` go to the
+  replica the router picked for the session (round-robin or
+  least-connections, see ``DB_REPLICA_BALANCING``);
+* flushes, ``INSERT``/``UPDATE``/``DELETE``, ``SELECT ... FOR UPDATE``,
+  textual SQL and ``session.connection()`` go to the primary. Read paths
+  that need the connection itself pass ``bind_arguments=READ_ONLY`` (as
+  ``search.search_embeddings`` and ``embeddings.fetch_embedding_matrix``
+  do) to stay on the replica.
+
+Read-your-writes: once anything went to the primary, every later read of the
+same request does too, across sessions. "Request" is the current
+``contextvars`` context, which ASGI servers create per request; workers and
+long-lived tasks should wrap each unit of work in ``request_scope``.
+
+``ReplicaRouter`` checks each replica's replay lag at most every
+``DB_REPLICA_CHECK_INTERVAL`` seconds (or continuously once started) and only
+uses replicas within ``DB_REPLICA_MAX_LAG``; with none left, or none
+configured, everything goes to the primary.
+
+``SELECT`` calling functions with side effects must be executed through
+``text()`` or after ``mark_written()``, otherwise the replica rejects it
+as a write in a read-only transaction.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional
+
+from sqlalchemy import CompoundSelect, Engine, Select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from neutrino_database import db
+from neutrino_database.config import settings
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+BALANCING = (ROUND_ROBIN, LEAST_CONNECTIONS)
+
+# session.connection(bind_arguments=READ_ONLY) for read-only work on the connection
+READ_ONLY = {"read_only": True}
+
+# Session.info key holding the router
+ROUTER_KEY = "neutrino_database.router"
+# Session.info key holding the replica engine picked for the session
+REPLICA_KEY = "neutrino_database.replica"
+
+# Zero once everything received has been replayed (an idle primary makes
+# pg_last_xact_replay_timestamp() look old), and on a server not in recovery
+REPLICA_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_written: ContextVar[bool] = ContextVar("neutrino_database_written", default=False)
+
+
+def mark_written() -> None:
+    """Route the rest of the current request to the primary."""
+    _written.set(True)
+
+
+def has_written() -> bool:
+    return _written.get()
+
+
+@contextmanager
+def request_scope() -> Iterator[None]:
+    """Start a fresh request: reads may use replicas again until the next write."""
+    token = _written.set(False)
+    try:
+        yield
+    finally:
+        _written.reset(token)
+
+
+@dataclass
+class Replica:
+    engine: AsyncEngine
+    # Replay lag in seconds as of checked_at; None while unknown or unreachable
+    lag: Optional[float] = None
+    checked_at: Optional[float] = None
+
+
+class ReplicaRouter:
+    """Picks the engine for reads: a replica within ``max_lag``, or the primary."""
+
+    def __init__(
+        self,
+        primary: Optional[AsyncEngine] = None,
+        replicas: Optional[List[AsyncEngine]] = None,
+        balancing: Optional[str] = None,
+        max_lag: Optional[float] = None,
+        check_interval: Optional[float] = None,
+    ):
+        balancing = balancing or settings.DB_REPLICA_BALANCING
+        if balancing not in BALANCING:
+            raise ValueError(f"balancing must be one of {', '.join(BALANCING)}")
+        self.primary = primary or db.get_engine()
+        engines = db.get_replica_engines() if replicas is None else replicas
+        self.replicas = [Replica(engine) for engine in engines]
+        self.balancing = balancing
+        self.max_lag = settings.DB_REPLICA_MAX_LAG if max_lag is None else max_lag
+        self.check_interval = settings.DB_REPLICA_CHECK_INTERVAL if check_interval is None else check_interval
+        self._turn = 0
+        self._checking: Optional[asyncio.Task] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Check the replicas now and then every ``check_interval`` in the background."""
+        await self.check()
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+
+    def available(self) -> List[Replica]:
+        return [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+
+    def choose(self) -> AsyncEngine:
+        """The engine the next read-only unit of work should use."""
+        candidates = [] if has_written() else self.available()
+        if not candidates:
+            return self.primary
+        if self.balancing == LEAST_CONNECTIONS:
+            return min(candidates, key=lambda r: r.engine.sync_engine.pool.checkedout()).engine
+        self._turn += 1
+        return candidates[self._turn % len(candidates)].engine
+
+    async def check(self) -> None:
+        """Measure every replica's lag; concurrent callers share one round."""
+        if self._checking is None or self._checking.done():
+            self._checking = asyncio.ensure_future(self._check_all())
+        await asyncio.shield(self._checking)
+
+    async def check_if_stale(self) -> None:
+        """``check`` unless every replica was measured within ``check_interval``."""
+        now = time.monotonic()
+        if any(r.checked_at is None or now - r.checked_at >= self.check_interval for r in self.replicas):
+            await self.check()
+
+    async def _check_all(self) -> None:
+        await asyncio.gather(*(self._check_one(replica) for replica in self.replicas))
+
+    async def _check_one(self, replica: Replica) -> None:
+        try:
+            async with replica.engine.connect() as conn:
+                lag = await conn.scalar(REPLICA_LAG)
+            replica.lag = float(lag)
+        except (DBAPIError, OSError):
+            replica.lag = None
+        replica.checked_at = time.monotonic()
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+
+def _is_read(clause) -> bool:
+    if isinstance(clause, CompoundSelect):
+        return True
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """``Session`` reading from a replica and writing to the primary (see module docstring)."""
+
+    def get_bind(self, mapper=None, clause=None, read_only: bool = False, **kw) -> Engine:
+        router: ReplicaRouter = self.info[ROUTER_KEY]
+        if self._flushing or not (read_only or _is_read(clause)):
+            mark_written()
+            return router.primary.sync_engine
+        if has_written():
+            return router.primary.sync_engine
+        # One replica per session, so its reads see a single server's state
+        engine = self.info.get(REPLICA_KEY)
+        if engine is None:
+            engine = self.info[REPLICA_KEY] = router.choose()
+        return engine.sync_engine
+
+
+_router: Optional[ReplicaRouter] = None
+_sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None
+
+
+def get_router() -> ReplicaRouter:
+    """Return the process-wide ``ReplicaRouter`` over the engines from ``db``."""
+    global _router, _sessionmaker
+    # Rebuilt when db replaced its engines (after dispose_engines or fork)
+    if _router is None or _router.primary is not db.get_engine():
+        _router = ReplicaRouter()
+        _sessionmaker = None
+    return _router
+
+
+def routing_sessionmaker(router: ReplicaRouter) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(
+        router.primary, sync_session_class=RoutingSession, info={ROUTER_KEY: router}, expire_on_commit=False,
+    )
+
+
+def get_routing_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Return the process-wide ``async_sessionmaker`` of ``RoutingSession``."""
+    global _sessionmaker
+    router = get_router()
+    if _sessionmaker is None:
+        _sessionmaker = routing_sessionmaker(router)
+    return _sessionmaker
+
+
+@asynccontextmanager
+async def routing_session_scope() -> AsyncIterator[AsyncSession]:
+    """``db.session_scope`` with replica routing; re-checks replica lag when it is stale."""
+    await get_router().check_if_stale()
+    async with get_routing_sessionmaker()() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+
+
+def _reset_after_fork() -> None:
+    global _router, _sessionmaker
+    _router = _sessionmaker = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,213 @@
+"""
+Nearest-neighbour search over ``embedding_vector.dense_vector``.
+
+The ANN indexes are created by migration ``2b8f0d6c4e13`` as partial
+expression indexes, one per embedding dimension::
+
+    CREATE INDEX ix_embedding_vector_dense_ann_1024 ON embedding_vector
+    USING hnsw ((dense_vector::vector(1024)) vector_cosine_ops)
+    WHERE dense_dim = 1024
+
+(``ivfflat`` on pgvector builds without HNSW). A query only uses the index
+when it repeats that expression and predicate verbatim, which is what
+``search_embeddings`` does.
+
+Vectors are shared by every file of a tenant with the same chunk, so the index
+covers the whole tenant and cannot hold the workspace. The scan walks vectors
+and keeps those with an ``embedding`` row in the workspace (and files) asked
+for, checked per candidate through ``ix_embedding_vector_id``; each hit is one
+vector, reported with one of its embeddings there (the lowest id). A vector
+used by several files of the workspace is therefore a single hit and does not
+take several of the ``k`` slots.
+
+The workspace and file filters sit in the WHERE of the ANN scan, below its
+``LIMIT k``, but the index cannot evaluate them: they discard candidates after
+the graph has produced them. On pgvector 0.8+ the scan is iterative and keeps
+walking the graph until ``k`` vectors pass, at a latency that grows with how
+selective the filters are. Older versions stop after ``ef_search``
+candidates, so the search over-fetches ``FILTER_OVERFETCH`` times as many as
+it would unfiltered; a result still short of ``k`` is retried once with the
+maximum ``ef_search`` and then answered by an exact scan over the filtered
+vectors.
+
+Databases without pgvector store vectors as bytea; there the search falls
+back to an exact scan scored in NumPy.
+"""
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Union
+
+import numpy as np
+from sqlalchemy import Float, bindparam, cast, literal, select, text, true
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from neutrino_database.models import tables
+from neutrino_database.models.types import PGVECTOR_FLAG, PGVECTOR_VERSION, DenseVector, PgVector, as_float32
+
+# Dimensions that have an ANN index (see migration 2b8f0d6c4e13)
+ANN_INDEX_DIMS = (1024,)
+
+DEFAULT_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+# Without iterative scans: candidates searched per wanted hit, relative to an
+# unfiltered search, to leave room for those the workspace filter discards
+FILTER_OVERFETCH = 4
+ITERATIVE_SCAN_VERSION = (0, 8)
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """Optional filters applied together with the tenant and workspace filters."""
+    file_ids: Optional[Sequence[Any]] = None
+    model: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class EmbeddingHit:
+    """
+    One search result; ``distance`` is cosine distance (0 = identical).
+
+    ``embedding_id``, ``file_id`` and ``chunk_hash`` are those of one embedding
+    of ``vector_id`` within the filters.
+    """
+    embedding_id: Any
+    file_id: Any
+    chunk_hash: str
+    distance: float
+    vector_id: Any
+
+
+def _embedding_filters(vector_id, tenant_id, workspace_id, filters: SearchFilters) -> list:
+    e = tables.embedding
+    # tenant_id prunes embedding to a single partition
+    clauses = [e.c.tenant_id == tenant_id, e.c.vector_id == vector_id, e.c.workspace_id == workspace_id]
+    if filters.file_ids is not None:
+        clauses.append(e.c.file_id.in_(list(filters.file_ids)))
+    return clauses
+
+
+def _apply_filters(stmt, tenant_id, workspace_id, filters: SearchFilters, dim: int):
+    e, v = tables.embedding, tables.embedding_vector
+    stmt = stmt.select_from(v).where(
+        v.c.tenant_id == tenant_id,
+        # Rendered as a literal so the partial index predicate can match.
+        v.c.dense_dim == literal(dim, literal_execute=True),
+        v.c.dense_vector.is_not(None),
+        select(e.c.id).where(*_embedding_filters(v.c.id, tenant_id, workspace_id, filters)).exists(),
+    )
+    if filters.model is not None:
+        stmt = stmt.where(v.c.model == filters.model)
+    return stmt
+
+
+def _hits(vectors, tenant_id, workspace_id, filters: SearchFilters, *columns):
+    """``vectors`` (an ``id`` column and ``columns``) with one embedding of each."""
+    e = tables.embedding
+    embedding = (
+        select(e.c.id, e.c.file_id, e.c.chunk_hash)
+        .where(*_embedding_filters(vectors.c.id, tenant_id, workspace_id, filters))
+        .order_by(e.c.id)
+        .limit(1)
+        .lateral("hit")
+    )
+    return select(
+        vectors.c.id.label("vector_id"), embedding.c.id, embedding.c.file_id, embedding.c.chunk_hash, *columns,
+    ).select_from(vectors.join(embedding, true()))
+
+
+async def _set_search_params(conn: AsyncConnection, ef_search: int, probes: Optional[int], iterative: bool) -> None:
+    # set_config(..., true) is SET LOCAL: it ends with the transaction.
+    params = {"hnsw.ef_search": str(ef_search), "ivfflat.probes": str(probes or 10)}
+    if iterative:
+        params["hnsw.iterative_scan"] = "strict_order"
+        params["ivfflat.iterative_scan"] = "relaxed_order"
+    calls = ", ".join(f"set_config('{name}', :p{i}, true)" for i, name in enumerate(params))
+    await conn.execute(text(f"SELECT {calls}"), {f"p{i}": value for i, value in enumerate(params.values())})
+
+
+def _distance(dim: int, query: np.ndarray):
+    v = tables.embedding_vector
+    return cast(v.c.dense_vector, PgVector(dim)).op("<=>", return_type=Float)(
+        bindparam("query", query, type_=DenseVector())
+    )
+
+
+async def search_embeddings(
+    bind: Union[AsyncSession, AsyncConnection],
+    tenant_id: str,
+    workspace_id: str,
+    query_vector: Any,
+    k: int = 10,
+    filters: Optional[SearchFilters] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[EmbeddingHit]:
+    """
+    Return the ``k`` embeddings of ``workspace_id`` closest to ``query_vector``.
+
+    Only rows whose ``dense_dim`` equals the query length are considered.
+    ``ef_search`` (HNSW) and ``probes`` (IVFFlat) trade recall for latency and
+    apply to this transaction only.
+    """
+    # read_only keeps a routing.RoutingSession on its replica
+    conn = await bind.connection(bind_arguments={"read_only": True}) if isinstance(bind, AsyncSession) else bind
+    filters = filters or SearchFilters()
+    query = as_float32(query_vector)
+    dim = int(query.shape[0])
+    v = tables.embedding_vector
+
+    if not getattr(conn.dialect, PGVECTOR_FLAG, True):
+        return await _exact_search(conn, tenant_id, workspace_id, query, k, filters)
+
+    version = getattr(conn.dialect, PGVECTOR_VERSION, None)
+    iterative = version is not None and version >= ITERATIVE_SCAN_VERSION
+    overfetch = 1 if iterative else FILTER_OVERFETCH
+    ef_search = ef_search or min(max(DEFAULT_EF_SEARCH, 2 * k * overfetch), MAX_EF_SEARCH)
+
+    distance = _distance(dim, query)
+    nearest = _apply_filters(
+        select(v.c.id, distance.label("distance")), tenant_id, workspace_id, filters, dim,
+    ).order_by(distance).limit(k).subquery("nearest")
+    stmt = _hits(nearest, tenant_id, workspace_id, filters, nearest.c.distance).order_by(nearest.c.distance)
+
+    await _set_search_params(conn, ef_search, probes, iterative)
+    hits = (await conn.execute(stmt)).all()
+
+    if len(hits) < k and not iterative:
+        if ef_search < MAX_EF_SEARCH:
+            await _set_search_params(conn, MAX_EF_SEARCH, probes, iterative)
+            hits = (await conn.execute(stmt)).all()
+        if len(hits) < k:
+            # The filters discard too many ANN candidates; order the filtered
+            # vectors exactly instead. MATERIALIZED keeps the ANN index out of it.
+            candidates = _apply_filters(
+                select(v.c.id, distance.label("distance")), tenant_id, workspace_id, filters, dim,
+            ).cte("candidates").prefix_with("MATERIALIZED")
+            nearest = select(candidates).order_by(candidates.c.distance).limit(k).subquery("nearest")
+            exact = _hits(nearest, tenant_id, workspace_id, filters, nearest.c.distance).order_by(nearest.c.distance)
+            hits = (await conn.execute(exact)).all()
+
+    return [EmbeddingHit(row.id, row.file_id, row.chunk_hash, row.distance, row.vector_id) for row in hits]
+
+
+async def _exact_search(conn: AsyncConnection, tenant_id, workspace_id, query: np.ndarray, k: int, filters: SearchFilters):
+    v = tables.embedding_vector
+    stmt = _apply_filters(select(v.c.id, v.c.dense_vector), tenant_id, workspace_id, filters, int(query.shape[0]))
+    rows = (await conn.execute(stmt)).all()
+    if not rows:
+        return []
+
+    matrix = np.stack([row.dense_vector for row in rows])
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = np.inf
+    distances = 1.0 - (matrix @ query) / norms
+
+    top = np.argsort(distances)[:k]
+    nearest = select(v.c.id).where(v.c.id.in_([rows[i].id for i in top])).subquery("nearest")
+    embeddings = {row.vector_id: row for row in await conn.execute(_hits(nearest, tenant_id, workspace_id, filters))}
+    hits = []
+    for i in top:
+        # Missing when the embeddings were deleted since the first query
+        hit = embeddings.get(rows[i].id)
+        if hit is not None:
+            hits.append(EmbeddingHit(hit.id, hit.file_id, hit.chunk_hash, float(distances[i]), hit.vector_id))
+    return hits
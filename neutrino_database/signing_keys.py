@@ -0,0 +1,194 @@
+"""
+In-process cache of the public signing keys used to verify tokens.
+
+``SigningKeyCache`` loads the ``CURRENT`` and ``NEXT`` keys once, parses
+their public PEMs once and then serves ``get(kid)`` from memory. It reloads:
+
+* as soon as ``signing_keys`` changes (statement-level ``NOTIFY``, see
+  ``models.notify``), so a rotation is picked up within milliseconds;
+* when a token names an unknown ``kid``, at most once per
+  ``min_miss_interval`` so tokens with made-up ``kid`` values cannot turn
+  into a query each;
+* after the listening connection was lost and re-established, since
+  notifications may have been missed in between.
+
+In steady state verification never touches the database. Private keys are
+never read. A key whose PEM does not parse is logged and left out, so the
+other keys still load.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from neutrino_database import db
+from neutrino_database.listen import Listener
+from neutrino_database.models import tables
+from neutrino_database.models.enums import KeyStatusEnum
+from neutrino_database.models.notify import SIGNING_KEYS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (KeyStatusEnum.CURRENT, KeyStatusEnum.NEXT)
+DEFAULT_MIN_MISS_INTERVAL = 5.0
+DEFAULT_CHECK_INTERVAL = 30.0
+
+
+def load_public_key(pem: str) -> Any:
+    """
+    Parse a public PEM with ``cryptography`` when it is installed.
+
+    Without it the PEM text is kept as is (which PyJWT and most JOSE
+    libraries accept too); pass ``parse=`` to ``SigningKeyCache`` to use
+    another loader.
+    """
+    try:
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    except ImportError:
+        return pem
+    return load_pem_public_key(pem.encode())
+
+
+@dataclass(frozen=True)
+class VerificationKey:
+    kid: str
+    status: KeyStatusEnum
+    # Whatever ``parse`` returned for public_pem
+    key: Any
+    public_pem: str
+    not_before: Optional[datetime]
+    not_after: Optional[datetime]
+
+    def valid_at(self, when: datetime) -> bool:
+        return (self.not_before is None or self.not_before <= when) and (
+            self.not_after is None or when < self.not_after
+        )
+
+
+class SigningKeyCache:
+    """
+    Verification keys by ``kid``, kept current by ``NOTIFY``.
+
+    Use as ``async with SigningKeyCache() as keys`` (or ``start``/``stop``)
+    for the lifetime of the service; ``get`` loads lazily if not started.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        parse: Callable[[str], Any] = load_public_key,
+        min_miss_interval: float = DEFAULT_MIN_MISS_INTERVAL,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+    ):
+        self.engine = engine or db.get_engine()
+        self.parse = parse
+        self.min_miss_interval = min_miss_interval
+        self.check_interval = check_interval
+        self._keys: Dict[str, VerificationKey] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._listener = Listener(SIGNING_KEYS_CHANNEL, self._notified, self.engine)
+        self._watcher: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> "SigningKeyCache":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """Listen for changes, then load (in that order, so no change slips in between)."""
+        await self._listener.start()
+        await self.refresh()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._watcher, *self._pending) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._watcher = None
+        self._pending.clear()
+        await self._listener.stop()
+
+    @property
+    def keys(self) -> List[VerificationKey]:
+        return list(self._keys.values())
+
+    def get_cached(self, kid: str, at: Optional[datetime] = None) -> Optional[VerificationKey]:
+        """Memory-only lookup, for synchronous verifiers."""
+        key = self._keys.get(kid)
+        if key is None or not key.valid_at(at or datetime.now(timezone.utc)):
+            return None
+        return key
+
+    async def get(self, kid: str, at: Optional[datetime] = None) -> Optional[VerificationKey]:
+        """The active key ``kid`` valid at ``at`` (now), reloading once if it is unknown."""
+        key = self.get_cached(kid, at)
+        if key is not None or kid in self._keys:
+            return key
+        loop = asyncio.get_running_loop()
+        if self._loaded_at is None or loop.time() - self._loaded_at >= self.min_miss_interval:
+            await self.refresh()
+        return self.get_cached(kid, at)
+
+    async def refresh(self) -> None:
+        """Reload the active keys; concurrent callers share one query."""
+        started = asyncio.get_running_loop().time()
+        async with self._lock:
+            if self._loaded_at is not None and self._loaded_at >= started:
+                return
+            loaded_at = asyncio.get_running_loop().time()
+            k = tables.signing_key
+            stmt = select(
+                k.c.kid, k.c.status, k.c.public_pem, k.c.not_before, k.c.not_after,
+            ).where(k.c.status.in_(ACTIVE_STATUSES))
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(stmt)).all()
+            keys = {}
+            for row in rows:
+                previous = self._keys.get(row.kid)
+                if previous is not None and previous.public_pem == row.public_pem:
+                    parsed = previous.key
+                else:
+                    try:
+                        parsed = self.parse(row.public_pem)
+                    except Exception:
+                        logger.error("Skipping signing key %s: its public PEM does not parse", row.kid, exc_info=True)
+                        continue
+                keys[row.kid] = VerificationKey(
+                    row.kid, row.status, parsed, row.public_pem, row.not_before, row.not_after,
+                )
+            self._keys = keys
+            self._loaded_at = loaded_at
+
+    def _notified(self, payload: str) -> None:
+        # One task per notification: a change committed while a reload is
+        # already querying must still trigger another one. refresh() folds
+        # the rest.
+        task = asyncio.get_running_loop().create_task(self.refresh())
+        self._pending.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # The cached keys stay in use until the next reload succeeds
+            logger.warning("Reloading signing keys failed", exc_info=task.exception())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                if not await self._listener.active() and await self._listener.start():
+                    await self.refresh()
+            except (DBAPIError, OSError):
+                # Database unreachable; the cached keys stay in use meanwhile
+                continue
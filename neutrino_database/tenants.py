@@ -0,0 +1,209 @@
+"""
+Tenant resolution cache for the auth path.
+
+Every request and SSO callback has to answer "which tenant is this, and may
+it use this module?", by ``tenant.id``, ``tenant.org_external_id`` or
+``tenant_identity (provider, provider_org_id)``. ``TenantCache`` answers from
+a bounded in-process LRU holding compact immutable ``TenantRecord`` values:
+
+* hits are served for ``ttl`` seconds, lookups that found nothing for
+  ``negative_ttl`` seconds (so unknown orgs cannot hammer the database);
+* concurrent misses on the same key share one query;
+* while started, ``NOTIFY`` from the ``tenant`` / ``tenant_identity``
+  triggers (see ``models.notify``) drops the tenant's entries, and all
+  negative ones, within milliseconds of a status, module or identity change.
+  After the listening connection was lost the whole cache is cleared.
+
+Without ``start`` the cache still works, bounded by ``ttl`` alone.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, Hashable, Optional, Set, Tuple, Union
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from neutrino_database import db, queries
+from neutrino_database.listen import Listener
+from neutrino_database.models.enums import AllowedModuleEnum, IdpProviderEnum, TenantStatusEnum
+from neutrino_database.models.notify import TENANTS_CHANNEL
+
+DEFAULT_MAXSIZE = 10_000
+DEFAULT_TTL = 300.0
+DEFAULT_NEGATIVE_TTL = 30.0
+DEFAULT_CHECK_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class TenantRecord:
+    id: str
+    name: str
+    org_external_id: str
+    status: TenantStatusEnum
+    allowed_modules: FrozenSet[str]
+    deleted_at: Optional[datetime]
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == TenantStatusEnum.ACTIVE and self.deleted_at is None
+
+    def allows(self, module: Union[AllowedModuleEnum, str]) -> bool:
+        value = module.value if isinstance(module, AllowedModuleEnum) else module
+        return self.is_active and value in self.allowed_modules
+
+
+def _record(row) -> TenantRecord:
+    return TenantRecord(
+        id=str(row.id),
+        name=row.name,
+        org_external_id=row.org_external_id,
+        status=row.status,
+        allowed_modules=frozenset(row.allowed_modules or ()),
+        deleted_at=row.deleted_at,
+    )
+
+
+class TenantCache:
+    """Bounded LRU + TTL cache of ``TenantRecord`` by id, org external id and IdP identity."""
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        maxsize: int = DEFAULT_MAXSIZE,
+        ttl: float = DEFAULT_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.engine = engine or db.get_engine()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.check_interval = check_interval
+        self.clock = clock
+        # key -> (expires, record or None for "no such tenant")
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[TenantRecord]]]" = OrderedDict()
+        self._keys_by_tenant: Dict[str, Set[Hashable]] = {}
+        self._negative: Set[Hashable] = set()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped by every invalidation; loads started before one are not cached
+        self._generation = 0
+        self._listener = Listener(TENANTS_CHANNEL, self.invalidate, self.engine)
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "TenantCache":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        await self._listener.start()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        await self._listener.stop()
+
+    async def by_id(self, tenant_id: str) -> Optional[TenantRecord]:
+        return await self._get(("id", str(tenant_id)), queries.tenant_by_id(tenant_id))
+
+    async def by_org(self, org_external_id: str) -> Optional[TenantRecord]:
+        return await self._get(("org", org_external_id), queries.tenant_by_org(org_external_id))
+
+    async def by_identity(self, provider: IdpProviderEnum, provider_org_id: str) -> Optional[TenantRecord]:
+        query = queries.tenant_by_identity(provider, provider_org_id)
+        return await self._get(("idp", provider.value, provider_org_id), query)
+
+    def invalidate(self, tenant_id: Optional[str] = None) -> None:
+        """Drop one tenant's entries plus every negative entry, or everything when ``tenant_id`` is None."""
+        self._generation += 1
+        if not tenant_id:
+            self._entries.clear()
+            self._keys_by_tenant.clear()
+            self._negative.clear()
+            return
+        for key in self._keys_by_tenant.pop(tenant_id, ()):
+            self._entries.pop(key, None)
+        # A new tenant or identity may be what an earlier lookup missed
+        for key in self._negative:
+            self._entries.pop(key, None)
+        self._negative.clear()
+
+    async def _get(self, key: Hashable, query: queries.Bound) -> Optional[TenantRecord]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, record = entry
+            if expires > self.clock():
+                self._entries.move_to_end(key)
+                return record
+            self._forget(key)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            async with self.engine.connect() as conn:
+                row = (await conn.execute(*query)).first()
+            record = _record(row) if row is not None else None
+            if generation == self._generation:
+                self._store(key, record)
+            future.set_result(record)
+            return record
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Waiters re-raise it; mark it retrieved for the no-waiter case
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _store(self, key: Hashable, record: Optional[TenantRecord]) -> None:
+        ttl = self.ttl if record is not None else self.negative_ttl
+        self._forget(key)
+        self._entries[key] = (self.clock() + ttl, record)
+        if record is None:
+            self._negative.add(key)
+        else:
+            self._keys_by_tenant.setdefault(record.id, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        record = entry[1]
+        if record is None:
+            self._negative.discard(key)
+            return
+        keys = self._keys_by_tenant.get(record.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tenant[record.id]
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                if not await self._listener.active() and await self._listener.start():
+                    # Notifications may have been missed while disconnected
+                    self.invalidate()
+            except (DBAPIError, OSError):
+                continue
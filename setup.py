@@ -10,6 +10,8 @@ setup(
         "sqlalchemy~=2.0.44",
         "alembic==1.17.0",
         "psycopg2-binary==2.9.11",
+        "asyncpg~=0.30",
+        "numpy>=1.24",
         "pydantic-settings~=2.11.0",
     ],
     python_requires=">=3.10",